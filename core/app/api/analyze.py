@@ -1,66 +1,144 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional, Any
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Any, Tuple
 from app.schemas import (
     AnalyzeRequest, AnalyzeResponse,
+    BatchAnalyzeItem, BatchAnalyzeRequest, BatchAnalyzeResponse, BatchAnalyzeResult,
+    AnalyzeSessionEditRequest, AnalyzeSessionResponse,
     OptimizeRequest, OptimizeResponse,
     BenchmarkRequest, BenchmarkResponse,
-    TrackRequest, TrackResponse,
+    TrackRequest, TrackResponse, TrackBatchRequest, TrackBatchResponse,
     UserStatsResponse, TeamStatsResponse,
-    LeaderboardRequest, LeaderboardResponse,
-    TimeSeriesRequest, TimeSeriesResponse,
+    LeaderboardRequest, LeaderboardResponse, MostImprovedRequest, MostImprovedResponse,
+    TimeSeriesRequest, TimeSeriesResponse, DashboardResponse,
     ModelListResponse, ModelSpecs,
     RecommendRequest, RecommendResponse,
     ErrorResponse
 )
-from app.database import get_db
-from app.security import require_api_key
-from app.models import PromptRun
+from app.config import settings
+from app.database import get_db, AsyncSessionLocal
+from app.api.responses import EncodedPayloads, json_bytes_response, prevalidated_response
+from app.security import api_keys, require_api_key, require_rate_limit
 from app.services.energy import (
-    estimate_tokens, estimate_output_tokens, estimate_energy,
+    estimate_tokens, estimate_energy, extract_features, PromptFeatures,
     calculate_carbon_footprint, calculate_cost,
-    detect_task_type, detect_output_format,
-    optimize_prompt, get_model_comparison,
-    EFFICIENCY_MODELS
+    get_model_comparison
+)
+from app.services.optimizer import DEFAULT_RULE_SET, get_rule_set, optimize_prompt
+from app.services.registry import registry
+from app.services.cache import AnalysisCache, RecentKeys, SnapshotCache, content_hash
+from app.services.sessions import (
+    AnalysisSession, RedisSessionStore, SessionConflict, SessionStore, SessionStoreUnavailable
+)
+from app.services.tracking import track_prompt_runs, get_user_stats, get_team_stats, get_time_series
+from app.services.leaderboard import get_ranked_leaderboard, get_most_improved, savings_from_totals
+from app.services.dashboard import get_dashboard
+from app.services.ranking import MemoryLeaderboard, RedisLeaderboard
+from app.services.benchmark import (
+    BENCHMARK_PROMPTS, run_benchmark, get_model_specs, list_supported_models, recommend_model
+)
+from app.services.executor import AnalysisExecutor, DeadlineExceeded, ExecutorSaturated, configure_worker
+from app.services.ingest import IngestUnavailable, RunIngestor
+from app.services.archive import archive
+from app.services.metrics import pipeline_stages
+from app.services.export import (
+    EXPORT_FORMATS, check_export_options, encode_export, export_allowed, export_filename, export_runs, parse_cursor
 )
-from app.services.tracking import track_prompt_run, get_user_stats, get_team_stats, get_time_series
-from app.services.leaderboard import get_leaderboard, calculate_savings_comparison
-from app.services.benchmark import run_benchmark, get_model_specs, list_supported_models, recommend_model
 
 router = APIRouter()
 
-@router.post("/analyze", response_model=AnalyzeResponse, responses={400: {"model": ErrorResponse}})
-async def analyze_prompt(
-    data: AnalyzeRequest,
-    owner: str = Depends(require_api_key),
-    db: AsyncSession = Depends(get_db)
-):
-    if not data.prompt or not data.prompt.strip():
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+MAX_STREAM_LINE_BYTES = 64 * 1024
+MAX_PROMPT_LENGTH = 10000
 
-    input_tokens = estimate_tokens(data.prompt)
-    output_tokens = data.max_tokens or estimate_output_tokens(data.prompt, detect_task_type(data.prompt))
-    energy = estimate_energy(input_tokens, output_tokens, data.model, data.output_format or "prose")
-    carbon = calculate_carbon_footprint(energy, data.region or "us-west")
-    cost = calculate_cost(energy, data.model.split("-")[0] if "-" in data.model else "openai")
-
-    run = PromptRun(
-        owner=owner,
-        prompt_hash=str(hash(data.prompt)),
-        prompt_length=len(data.prompt),
-        model=data.model,
-        prompt_tokens=input_tokens,
-        estimated_output_tokens=output_tokens,
-        energy_joules=energy,
-        carbon_kg=carbon["co2_kg"],
-        water_liters=carbon["water_liters"],
-        cost_usd=cost["estimated_cost_usd"]
+analysis_cache = AnalysisCache(settings.ANALYSIS_CACHE_MAX_BYTES, settings.ANALYSIS_CACHE_TTL_SECONDS)
+
+analysis_sessions = (
+    RedisSessionStore(settings.REDIS_URL, settings.ANALYSIS_SESSION_IDLE_SECONDS)
+    if settings.REDIS_URL else SessionStore(settings.ANALYSIS_SESSION_IDLE_SECONDS, settings.ANALYSIS_SESSION_MAX)
+)
+# In-process sessions would only be found by the worker that created them.
+sessions_available = bool(settings.REDIS_URL) or settings.WEB_CONCURRENCY <= 1
+
+analysis_executor = AnalysisExecutor(
+    mode=settings.EXECUTOR_MODE,
+    max_workers=settings.EXECUTOR_WORKERS,
+    max_queue=settings.EXECUTOR_QUEUE_SIZE,
+    inline_max_chars=settings.EXECUTOR_INLINE_MAX_CHARS,
+    deadline_seconds=settings.EXECUTOR_DEADLINE_SECONDS,
+    initializer=configure_worker,
+    initargs=(
+        settings.TOKENIZER_DIR, settings.TOKENIZER_MODE,
+        settings.MODEL_REGISTRY_PATH, settings.MODEL_REGISTRY_RELOAD_SECONDS
     )
-    db.add(run)
-    await db.commit()
-    await db.refresh(run)
+)
+
+_leaderboard_windows = [int(days) for days in settings.LEADERBOARD_WINDOWS.split(",") if days.strip()]
+if settings.REDIS_URL:
+    leaderboard_index = RedisLeaderboard(settings.REDIS_URL, _leaderboard_windows, settings.LEADERBOARD_REFRESH_SECONDS)
+elif settings.WEB_CONCURRENCY <= 1 or settings.LEADERBOARD_MEMORY_INDEX:
+    leaderboard_index = MemoryLeaderboard(_leaderboard_windows)
+else:
+    # A per-worker index would only see that worker's runs; with no windows
+    # indexed, every leaderboard and rank is read from the rollups.
+    leaderboard_index = MemoryLeaderboard(())
+
+dashboard_cache = SnapshotCache(settings.DASHBOARD_CACHE_MAX_ENTRIES, settings.DASHBOARD_CACHE_TTL_SECONDS)
+most_improved_cache = SnapshotCache(settings.MOST_IMPROVED_CACHE_MAX_ENTRIES, settings.MOST_IMPROVED_CACHE_TTL_SECONDS)
+
+async def _runs_inserted(rows: List[dict]) -> None:
+    dashboard_cache.invalidate({row["owner"] for row in rows})
+    await leaderboard_index.add(rows)
+
+run_ingestor = RunIngestor(
+    AsyncSessionLocal,
+    batch_rows=settings.INGEST_BATCH_ROWS,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.INGEST_MAX_PENDING,
+    spill_path=settings.INGEST_SPILL_PATH,
+    drain_timeout=settings.INGEST_DRAIN_SECONDS,
+    on_insert=_runs_inserted
+)
 
-    model_info = EFFICIENCY_MODELS.get(data.model.lower(), {"joules_per_token": 1.5, "accuracy": 0.90})
+recent_track_keys = RecentKeys(settings.TRACK_IDEMPOTENCY_CACHE_SIZE)
+
+encoded_payloads = EncodedPayloads()
+
+def _record_run(row: dict) -> None:
+    # Analyses are still answered if their run can't be recorded; the ingestor
+    # logs why it stopped and counts the row as dropped.
+    try:
+        run_ingestor.submit(row)
+    except IngestUnavailable:
+        pass
+
+def _respond(payload: Any) -> Any:
+    return prevalidated_response(payload) if settings.FAST_RESPONSES else payload
+
+async def _offload(fn, *args: Any, size: int) -> Any:
+    try:
+        return await analysis_executor.run(fn, *args, size=size)
+    except (ExecutorSaturated, DeadlineExceeded) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _build_analysis(
+    features: PromptFeatures,
+    model: str,
+    max_tokens: Optional[int],
+    output_format: Optional[str],
+    region: Optional[str]
+) -> AnalyzeResponse:
+    started = time.perf_counter()
+    input_tokens = features.token_count
+    output_tokens = max_tokens or features.output_tokens()
+    energy = estimate_energy(input_tokens, output_tokens, model, output_format or "prose")
+    carbon = calculate_carbon_footprint(energy, region or "us-west")
+    cost = calculate_cost(energy, model)
+    record = registry.snapshot.resolve(model)
+    pipeline_stages.observe(time.perf_counter() - started, "estimate")
 
     return AnalyzeResponse(
         input_tokens=input_tokens,
@@ -69,29 +147,52 @@ async def analyze_prompt(
         carbon_kg=carbon["co2_kg"],
         water_liters=carbon["water_liters"],
         estimated_cost_usd=cost["estimated_cost_usd"],
-        task_type=detect_task_type(data.prompt),
-        output_format=data.output_format or detect_output_format(data.prompt),
+        task_type=features.task_type,
+        output_format=output_format or features.output_format,
         confidence=0.92,
         model_info={
-            "model": data.model,
-            "energy_per_token": model_info["joules_per_token"],
-            "estimated_accuracy": model_info["accuracy"]
+            "model": model,
+            "energy_per_token": record.joules_per_token if record else 1.5,
+            "estimated_accuracy": record.accuracy if record else 0.90
         }
     )
 
-@router.post("/optimize", response_model=OptimizeResponse)
-async def optimize_prompt_endpoint(
-    data: OptimizeRequest,
-    owner: str = Depends(require_api_key)
-):
-    optimized, suggestions = optimize_prompt(data.prompt)
+def _analysis_key(data: AnalyzeRequest) -> str:
+    return content_hash(
+        "analyze", registry.snapshot.version,
+        data.prompt, data.model, data.output_format, data.region, data.max_tokens
+    )
+
+def _compute_analysis(data: AnalyzeRequest) -> AnalyzeResponse:
+    return _build_analysis(
+        extract_features(data.prompt, data.model), data.model, data.max_tokens, data.output_format, data.region
+    )
+
+def _compute_analyses(requests: List[AnalyzeRequest]) -> List[AnalyzeResponse]:
+    return [_compute_analysis(request) for request in requests]
+
+async def _analyze(data: AnalyzeRequest) -> AnalyzeResponse:
+    cache_key = _analysis_key(data)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = await _offload(_compute_analysis, data, size=len(data.prompt))
+    analysis_cache.put(cache_key, response, len(response.model_dump_json()))
+    return response
+
+def _compute_optimization(data: OptimizeRequest) -> OptimizeResponse:
+    features = extract_features(data.prompt, data.target_model)
+    started = time.perf_counter()
+    optimized, suggestions = optimize_prompt(data.prompt, features, data.rule_set, data.target_model)
+    pipeline_stages.observe(time.perf_counter() - started, "optimize")
     total_savings_joules = sum(s.energy_savings_joules for s in suggestions)
     total_savings_percent = sum(s.energy_savings_percent for s in suggestions) / max(len(suggestions), 1) if suggestions else 0
 
     carbon_savings = calculate_carbon_footprint(total_savings_joules)
     estimated_cost_savings = total_savings_joules * 0.00001
 
-    new_tokens = estimate_tokens(optimized)
+    new_tokens = estimate_tokens(optimized, data.target_model)
 
     suggestions_dicts = [
         {
@@ -114,68 +215,388 @@ async def optimize_prompt_endpoint(
         total_savings_percent=round(total_savings_percent, 2),
         carbon_savings_kg=round(carbon_savings["co2_kg"], 6),
         cost_savings_usd=round(estimated_cost_savings, 6),
-        estimated_new_tokens=new_tokens
+        estimated_new_tokens=new_tokens,
+        rule_set=data.rule_set or DEFAULT_RULE_SET
+    )
+
+async def _optimize(data: OptimizeRequest) -> OptimizeResponse:
+    cache_key = content_hash(
+        "optimize", registry.snapshot.version,
+        data.prompt, data.target_model, data.rule_set, data.include_savings
+    )
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        get_rule_set(data.rule_set)
+        response = await _offload(_compute_optimization, data, size=len(data.prompt))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    analysis_cache.put(cache_key, response, len(response.model_dump_json()))
+    return response
+
+def _prompt_run_row(owner: str, data: AnalyzeRequest, response: AnalyzeResponse) -> dict:
+    return {
+        "owner": owner,
+        "prompt_hash": content_hash(data.prompt),
+        "prompt_length": len(data.prompt),
+        "model": data.model,
+        "prompt_tokens": response.input_tokens,
+        "estimated_output_tokens": response.estimated_output_tokens,
+        "energy_joules": response.energy_joules,
+        "carbon_kg": response.carbon_kg,
+        "water_liters": response.water_liters,
+        "cost_usd": response.estimated_cost_usd
+    }
+
+@router.post("/analyze", response_model=AnalyzeResponse, responses={400: {"model": ErrorResponse}})
+async def analyze_prompt(
+    data: AnalyzeRequest,
+    owner: str = Depends(require_api_key)
+):
+    if not data.prompt or not data.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+
+    response = await _analyze(data)
+    _record_run(_prompt_run_row(owner, data, response))
+    return _respond(response)
+
+def _item_request(
+    item: BatchAnalyzeItem,
+    model: str,
+    output_format: Optional[str],
+    region: Optional[str]
+) -> AnalyzeRequest:
+    if not item.prompt.strip():
+        raise ValueError("Prompt cannot be empty")
+    return AnalyzeRequest(
+        prompt=item.prompt,
+        model=item.model or model,
+        max_tokens=item.max_tokens,
+        output_format=item.output_format or output_format,
+        region=item.region or region
+    )
+
+def _item_error(index: int, error: ValueError) -> BatchAnalyzeResult:
+    if isinstance(error, ValidationError):
+        return BatchAnalyzeResult(index=index, error="; ".join(err["msg"] for err in error.errors()))
+    return BatchAnalyzeResult(index=index, error=str(error))
+
+async def _analyze_item(
+    index: int,
+    item: BatchAnalyzeItem,
+    owner: str,
+    model: str,
+    output_format: Optional[str],
+    region: Optional[str]
+) -> Tuple[BatchAnalyzeResult, Optional[dict]]:
+    try:
+        request = _item_request(item, model, output_format, region)
+        response = await _analyze(request)
+    except ValueError as e:
+        return _item_error(index, e), None
+    except HTTPException as e:
+        return BatchAnalyzeResult(index=index, error=e.detail), None
+    return BatchAnalyzeResult(index=index, result=response), _prompt_run_row(owner, request, response)
+
+@router.post("/analyze/batch", response_model=BatchAnalyzeResponse)
+async def analyze_batch(
+    data: BatchAnalyzeRequest,
+    owner: str = Depends(require_api_key)
+):
+    results: List[Optional[BatchAnalyzeResult]] = [None] * len(data.items)
+    requests = {}
+    pending = []
+    for index, item in enumerate(data.items):
+        try:
+            request = _item_request(item, data.model, data.output_format, data.region)
+        except ValueError as e:
+            results[index] = _item_error(index, e)
+            continue
+        requests[index] = request
+        cached = analysis_cache.get(_analysis_key(request))
+        if cached is not None:
+            results[index] = BatchAnalyzeResult(index=index, result=cached)
+        else:
+            pending.append(index)
+
+    if pending:
+        misses = [requests[index] for index in pending]
+        responses = await _offload(_compute_analyses, misses, size=sum(len(r.prompt) for r in misses))
+        for index, response in zip(pending, responses):
+            analysis_cache.put(_analysis_key(requests[index]), response, len(response.model_dump_json()))
+            results[index] = BatchAnalyzeResult(index=index, result=response)
+
+    succeeded = 0
+    for result in results:
+        if result.result is not None:
+            _record_run(_prompt_run_row(owner, requests[result.index], result.result))
+            succeeded += 1
+
+    return BatchAnalyzeResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+class _NDJSONStreamingResponse(StreamingResponse):
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        # The body is still being read while we respond, so unlike the
+        # base class we must not consume `receive` to watch for disconnects.
+        await self.stream_response(send)
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[Optional[bytes]]:
+    buffer = bytearray()
+    oversized = False
+    async for chunk in request.stream():
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            yield None if oversized or end - start > MAX_STREAM_LINE_BYTES else bytes(buffer[start:end])
+            oversized = False
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_STREAM_LINE_BYTES:
+            oversized = True
+            buffer.clear()
+    if oversized:
+        yield None
+    elif buffer.strip():
+        yield bytes(buffer)
+
+async def _stream_analysis(
+    request: Request,
+    owner: str,
+    model: str,
+    output_format: Optional[str],
+    region: Optional[str]
+) -> AsyncIterator[str]:
+    index = -1
+    async for line in _iter_ndjson_lines(request):
+        index += 1
+        if line is None:
+            result = BatchAnalyzeResult(index=index, error=f"Line exceeds {MAX_STREAM_LINE_BYTES} bytes")
+        elif not line.strip():
+            continue
+        else:
+            try:
+                item = BatchAnalyzeItem.model_validate_json(line)
+            except ValidationError as e:
+                result = BatchAnalyzeResult(index=index, error="; ".join(err["msg"] for err in e.errors()))
+            else:
+                result, row = await _analyze_item(index, item, owner, model, output_format, region)
+                if row is not None:
+                    _record_run(row)
+        yield result.model_dump_json() + "\n"
+
+@router.post("/analyze/stream", response_class=_NDJSONStreamingResponse)
+async def analyze_stream(
+    request: Request,
+    model: str = Query(default="gpt-4o"),
+    output_format: Optional[str] = Query(default="prose"),
+    region: Optional[str] = Query(default="us-west"),
+    owner: str = Depends(require_api_key)
+):
+    return _NDJSONStreamingResponse(_stream_analysis(request, owner, model, output_format, region))
+
+def _session_response(session: AnalysisSession) -> AnalyzeSessionResponse:
+    analysis = _build_analysis(
+        session.features(), session.model, session.max_tokens, session.output_format, session.region
+    )
+    return AnalyzeSessionResponse(
+        session_id=session.id,
+        version=session.version,
+        prompt_length=len(session.text),
+        analysis=analysis
     )
 
+def _check_sessions_available() -> None:
+    if not sessions_available:
+        raise HTTPException(
+            status_code=503, detail="Analysis sessions need REDIS_URL when the API runs more than one worker"
+        )
+
+@router.post("/analyze/sessions", response_model=AnalyzeSessionResponse)
+async def create_analysis_session(
+    data: AnalyzeRequest,
+    owner: str = Depends(require_api_key)
+):
+    _check_sessions_available()
+    session = AnalysisSession(owner, data.prompt, data.model, data.max_tokens, data.output_format, data.region)
+    try:
+        await analysis_sessions.create(session)
+    except SessionStoreUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return _session_response(session)
+
+def _apply_edits(session: AnalysisSession, data: AnalyzeSessionEditRequest) -> None:
+    if data.base_version is not None and data.base_version != session.version:
+        raise HTTPException(status_code=409, detail=f"Session is at version {session.version}")
+    length = len(session.text)
+    for edit in data.edits:
+        if edit.offset + edit.deleted > length:
+            raise HTTPException(status_code=409, detail=f"Edit at offset {edit.offset} is outside the prompt")
+        length += len(edit.inserted) - edit.deleted
+    if length > MAX_PROMPT_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Prompt cannot exceed {MAX_PROMPT_LENGTH} characters")
+    try:
+        for edit in data.edits:
+            session.apply_edit(edit.offset, edit.deleted, edit.inserted)
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/analyze/sessions/{session_id}/edits", response_model=AnalyzeSessionResponse)
+async def edit_analysis_session(
+    session_id: str,
+    data: AnalyzeSessionEditRequest,
+    owner: str = Depends(require_api_key)
+):
+    _check_sessions_available()
+    try:
+        session = await analysis_sessions.get(owner, session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        with session.lock:
+            base_version = session.version
+            _apply_edits(session, data)
+        saved = await analysis_sessions.save(session, base_version)
+    except SessionStoreUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    if not saved:
+        raise HTTPException(status_code=409, detail="Session was edited by another request")
+    return _session_response(session)
+
+@router.delete("/analyze/sessions/{session_id}", status_code=204)
+async def delete_analysis_session(
+    session_id: str,
+    owner: str = Depends(require_api_key)
+):
+    _check_sessions_available()
+    try:
+        deleted = await analysis_sessions.delete(owner, session_id)
+    except SessionStoreUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+
+@router.post("/optimize", response_model=OptimizeResponse)
+async def optimize_prompt_endpoint(
+    data: OptimizeRequest,
+    owner: str = Depends(require_api_key)
+):
+    return _respond(await _optimize(data))
+
 @router.post("/benchmark", response_model=BenchmarkResponse)
 async def benchmark_prompt(
     data: BenchmarkRequest,
     owner: str = Depends(require_api_key)
 ):
-    models = data.models or list(EFFICIENCY_MODELS.keys())[:10]
-    result = await run_benchmark(data.prompt, models, data.include_standard)
-    return result
+    models = data.models or list(registry.snapshot.model_names[:10])
+    if data.prompts:
+        size = sum(len(p) for p in data.prompts)
+    elif data.prompt:
+        size = len(data.prompt)
+    else:
+        size = sum(len(p) for p in BENCHMARK_PROMPTS.values()) if data.include_standard else 0
+    result = await _offload(
+        run_benchmark, data.prompt, models, data.include_standard, data.prompts, size=size * len(models)
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return _respond(result)
+
+@router.delete("/keys/current", status_code=204)
+async def revoke_current_key(request: Request, owner: str = Depends(require_api_key)):
+    await api_keys.revoke(request.state.api_key_hash)
 
-@router.get("/models", response_model=ModelListResponse)
+@router.get("/models", response_model=ModelListResponse, dependencies=[Depends(require_rate_limit)])
 async def list_models():
-    return await list_supported_models()
+    return json_bytes_response(
+        await encoded_payloads.get("models", registry.snapshot.version, ModelListResponse, list_supported_models)
+    )
 
-@router.get("/models/{model}", response_model=ModelSpecs)
+@router.get("/models/{model}", response_model=ModelSpecs, dependencies=[Depends(require_rate_limit)])
 async def get_model(model: str):
     specs = await get_model_specs(model)
     if "error" in specs:
         raise HTTPException(status_code=404, detail=specs["error"])
     return specs
 
-@router.post("/recommend", response_model=RecommendResponse)
+@router.post("/recommend", response_model=RecommendResponse, dependencies=[Depends(require_rate_limit)])
 async def recommend_model_endpoint(data: RecommendRequest):
     return await recommend_model(data.model_dump())
 
+def _track_row(owner: str, data: TrackRequest) -> dict:
+    features = extract_features(data.prompt, data.model)
+    input_tokens = data.input_tokens or features.token_count
+    output_tokens = data.output_tokens or features.output_tokens("standard")
+    energy = data.actual_energy_joules or estimate_energy(input_tokens, output_tokens, data.model)
+    carbon = calculate_carbon_footprint(energy)
+    cost_usd = data.actual_cost_usd or calculate_cost(energy, data.model)["estimated_cost_usd"]
+    return {
+        "owner": owner,
+        "team_id": data.team_id,
+        "prompt_hash": content_hash(data.prompt),
+        "prompt_length": len(data.prompt),
+        "model": data.model,
+        "prompt_tokens": input_tokens,
+        "estimated_output_tokens": output_tokens,
+        "energy_joules": energy,
+        "carbon_kg": carbon["co2_kg"],
+        "water_liters": carbon["water_liters"],
+        "cost_usd": cost_usd,
+        "idempotency_key": data.idempotency_key
+    }
+
+def _track_rows(owner: str, items: List[TrackRequest]) -> List[dict]:
+    return [_track_row(owner, item) for item in items]
+
+def _track_response(run: dict) -> TrackResponse:
+    return TrackResponse(
+        id=run["id"],
+        owner=run["owner"],
+        model=run["model"],
+        energy_joules=run["energy_joules"],
+        carbon_kg=run["carbon_kg"],
+        water_liters=run["water_liters"],
+        cost_usd=run["cost_usd"],
+        created_at=run["created_at"],
+        duplicate=run.get("duplicate", False)
+    )
+
 @router.post("/track", response_model=TrackResponse)
 async def track_run(
     data: TrackRequest,
     owner: str = Depends(require_api_key),
     db: AsyncSession = Depends(get_db)
 ):
-    input_tokens = data.input_tokens or estimate_tokens(data.prompt)
-    output_tokens = data.output_tokens or estimate_output_tokens(data.prompt)
-    energy = data.actual_energy_joules or estimate_energy(input_tokens, output_tokens)
-    carbon = calculate_carbon_footprint(energy)
-    cost = data.actual_cost_usd or calculate_cost(energy, data.model.split("-")[0] if "-" in data.model else "openai")
+    row = _track_row(owner, data)
+    if data.idempotency_key is not None:
+        runs = await track_prompt_runs(db, owner, [row], recent_track_keys)
+        await _runs_inserted([run for run in runs if not run["duplicate"]])
+        return _track_response(runs[0])
 
-    run = await track_prompt_run(
-        db=db,
-        owner=owner,
-        prompt=data.prompt,
-        model=data.model,
-        input_tokens=input_tokens,
-        output_tokens=output_tokens,
-        energy_joules=energy,
-        carbon_kg=carbon["co2_kg"],
-        water_liters=carbon["water_liters"],
-        cost_usd=cost["estimated_cost_usd"],
-        team_id=data.team_id
-    )
+    try:
+        run = await run_ingestor.write(row)
+    except IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return _track_response(run)
 
-    return TrackResponse(
-        id=run.id,
-        owner=run.owner,
-        model=run.model,
-        energy_joules=run.energy_joules,
-        carbon_kg=run.carbon_kg,
-        water_liters=run.water_liters,
-        cost_usd=run.cost_usd,
-        created_at=run.created_at
+@router.post("/track/batch", response_model=TrackBatchResponse)
+async def track_batch(
+    data: TrackBatchRequest,
+    owner: str = Depends(require_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    rows = await _offload(_track_rows, owner, data.items, size=sum(len(item.prompt) for item in data.items))
+    runs = await track_prompt_runs(db, owner, rows, recent_track_keys)
+    await _runs_inserted([run for run in runs if not run["duplicate"]])
+    duplicates = sum(1 for run in runs if run["duplicate"])
+    return TrackBatchResponse(
+        results=[_track_response(run) for run in runs],
+        created=len(runs) - duplicates,
+        duplicates=duplicates
     )
 
 @router.get("/stats/me", response_model=UserStatsResponse)
@@ -185,9 +606,23 @@ async def get_my_stats(
     db: AsyncSession = Depends(get_db)
 ):
     stats = await get_user_stats(db, owner, days)
-    savings = await calculate_savings_comparison(db, owner, days)
+    savings = savings_from_totals(stats["total_prompts"], stats["total_energy_joules"])
     return UserStatsResponse(user_id=owner, savings_comparison=savings, **stats)
 
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard_endpoint(
+    days: int = Query(default=30, ge=1, le=365),
+    owner: str = Depends(require_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    cached = dashboard_cache.get((owner, days))
+    if cached is not None:
+        return cached
+    generation = dashboard_cache.generation(owner)
+    response = DashboardResponse(**await get_dashboard(db, leaderboard_index, owner, days))
+    dashboard_cache.put((owner, days), response, generation)
+    return response
+
 @router.get("/stats/team/{team_id}", response_model=TeamStatsResponse)
 async def get_team_stats_endpoint(
     team_id: str,
@@ -203,8 +638,74 @@ async def get_leaderboard_endpoint(
     owner: str = Depends(require_api_key),
     db: AsyncSession = Depends(get_db)
 ):
-    entries = await get_leaderboard(db, data.scope, data.team_id, data.days, data.limit)
-    return LeaderboardResponse(scope=data.scope, period_days=data.days, entries=entries)
+    ranked = await get_ranked_leaderboard(
+        db, leaderboard_index, owner, data.scope, data.team_id, data.days, data.limit, data.neighbors
+    )
+    return LeaderboardResponse(scope=data.scope, period_days=data.days, **ranked)
+
+@router.post("/leaderboard/most-improved", response_model=MostImprovedResponse)
+async def get_most_improved_endpoint(
+    data: MostImprovedRequest,
+    owner: str = Depends(require_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        improved = await get_most_improved(
+            db, data.scope, data.team_id, data.days, data.limit, data.cursor, most_improved_cache
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MostImprovedResponse(scope=data.scope, period_days=data.days, **improved)
+
+def _utc_naive(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+@router.get("/export")
+async def export_prompt_runs(
+    scope: str = Query(default="user", pattern="^(user|team|organization)$"),
+    team_id: Optional[str] = Query(default=None),
+    organization_id: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    output_format: str = Query(default="ndjson", alias="format", pattern="^(csv|ndjson|arrow)$"),
+    compression: str = Query(default="none", pattern="^(none|gzip|zstd)$"),
+    cursor: Optional[str] = Query(default=None, max_length=128),
+    owner: str = Depends(require_api_key)
+):
+    if scope == "team" and not team_id:
+        raise HTTPException(status_code=400, detail="team_id is required for team scope")
+    if scope == "organization" and not organization_id:
+        raise HTTPException(status_code=400, detail="organization_id is required for organization scope")
+    try:
+        check_export_options(output_format, compression)
+        after = parse_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if scope != "user":
+        async with AsyncSessionLocal() as db:
+            allowed = await export_allowed(
+                db, owner, team_id if scope == "team" else None, organization_id if scope == "organization" else None
+            )
+        if not allowed:
+            raise HTTPException(status_code=403, detail=f"Not a member of this {scope}")
+
+    batches = export_runs(
+        AsyncSessionLocal,
+        archive,
+        _utc_naive(start) if start else datetime(1970, 1, 1),
+        _utc_naive(end) if end else datetime.utcnow(),
+        owner=owner if scope == "user" else None,
+        team_id=team_id if scope == "team" else None,
+        organization_id=organization_id if scope == "organization" else None,
+        after=after,
+        batch_rows=settings.EXPORT_BATCH_ROWS
+    )
+    media_type = {"gzip": "application/gzip", "zstd": "application/zstd"}.get(compression, EXPORT_FORMATS[output_format])
+    return StreamingResponse(
+        encode_export(batches, output_format, compression),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(output_format, compression)}"'}
+    )
 
 @router.post("/timeseries", response_model=TimeSeriesResponse)
 async def get_timeseries(
@@ -213,5 +714,8 @@ async def get_timeseries(
     db: AsyncSession = Depends(get_db)
 ):
     scope = "user" if data.user_id else "team" if data.team_id else "user"
-    series = await get_time_series(db, data.user_id, data.team_id, data.days, data.granularity)
+    try:
+        series = await get_time_series(db, data.user_id, data.team_id, data.days, data.granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return TimeSeriesResponse(scope=scope, period_days=data.days, granularity=data.granularity, data=series)
@@ -0,0 +1,32 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple, Type
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+class EncodedPayloads:
+    # Payloads that only change with the model registry are validated and
+    # encoded once per registry version, then served as bytes.
+    def __init__(self):
+        self._encoded: Dict[str, Tuple[str, bytes]] = {}
+
+    async def get(self, name: str, version: str, model: Type[BaseModel], build: Callable[[], Awaitable[Any]]) -> bytes:
+        cached = self._encoded.get(name)
+        if cached is None or cached[0] != version:
+            body = model.model_validate(await build()).model_dump_json().encode("utf-8")
+            cached = self._encoded[name] = (version, body)
+        return cached[1]
+
+def json_bytes_response(body: bytes) -> Response:
+    return Response(body, media_type="application/json")
+
+def prevalidated_response(payload: Any) -> Response:
+    # For payloads the service layer already built in the response_model's
+    # shape: FastAPI would dump, re-validate and re-dump them before encoding.
+    if isinstance(payload, BaseModel):
+        return json_bytes_response(payload.model_dump_json().encode("utf-8"))
+    return FastJSONResponse(payload)
@@ -6,14 +6,62 @@ class Settings(BaseSettings):
     APP_NAME: str = "GreenPrompt Core API"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
+    # Also read by uvicorn as its default --workers.
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
     
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
     API_KEY_SALT: str = os.getenv("API_KEY_SALT", "default-salt-change-in-production")
     
     REDIS_URL: str = os.getenv("REDIS_URL", "")
     RATE_LIMIT: int = int(os.getenv("RATE_LIMIT", "1000"))
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+    
+    TOKENIZER_MODE: str = os.getenv("TOKENIZER_MODE", "bpe")
+    TOKENIZER_DIR: str = os.getenv("TOKENIZER_DIR", "")
+    MODEL_REGISTRY_PATH: str = os.getenv("MODEL_REGISTRY_PATH", "")
+    MODEL_REGISTRY_RELOAD_SECONDS: float = float(os.getenv("MODEL_REGISTRY_RELOAD_SECONDS", "5"))
+    
+    ANALYSIS_CACHE_MAX_BYTES: int = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ANALYSIS_CACHE_TTL_SECONDS: int = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "300"))
+    
+    ANALYSIS_SESSION_IDLE_SECONDS: int = int(os.getenv("ANALYSIS_SESSION_IDLE_SECONDS", "600"))
+    ANALYSIS_SESSION_MAX: int = int(os.getenv("ANALYSIS_SESSION_MAX", "10000"))
+    EXECUTOR_MODE: str = os.getenv("EXECUTOR_MODE", "thread")
+    EXECUTOR_WORKERS: int = int(os.getenv("EXECUTOR_WORKERS", "4"))
+    EXECUTOR_QUEUE_SIZE: int = int(os.getenv("EXECUTOR_QUEUE_SIZE", "64"))
+    EXECUTOR_INLINE_MAX_CHARS: int = int(os.getenv("EXECUTOR_INLINE_MAX_CHARS", "2000"))
+    EXECUTOR_DEADLINE_SECONDS: float = float(os.getenv("EXECUTOR_DEADLINE_SECONDS", "10"))
+    
+    INGEST_BATCH_ROWS: int = int(os.getenv("INGEST_BATCH_ROWS", "500"))
+    INGEST_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "0.25"))
+    INGEST_MAX_PENDING: int = int(os.getenv("INGEST_MAX_PENDING", "100000"))
+    INGEST_SPILL_PATH: str = os.getenv("INGEST_SPILL_PATH", "./prompt_runs.spill")
+    INGEST_DRAIN_SECONDS: float = float(os.getenv("INGEST_DRAIN_SECONDS", "10"))
+    TRACK_IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("TRACK_IDEMPOTENCY_CACHE_SIZE", "100000"))
+    
+    LEADERBOARD_WINDOWS: str = os.getenv("LEADERBOARD_WINDOWS", "1,7,30")
+    LEADERBOARD_REFRESH_SECONDS: float = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "5"))
+    LEADERBOARD_MEMORY_INDEX: bool = os.getenv("LEADERBOARD_MEMORY_INDEX", "false").lower() in ("1", "true", "yes")
+    DASHBOARD_CACHE_TTL_SECONDS: float = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+    DASHBOARD_CACHE_MAX_ENTRIES: int = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "10000"))
+    MOST_IMPROVED_CACHE_TTL_SECONDS: float = float(os.getenv("MOST_IMPROVED_CACHE_TTL_SECONDS", "60"))
+    MOST_IMPROVED_CACHE_MAX_ENTRIES: int = int(os.getenv("MOST_IMPROVED_CACHE_MAX_ENTRIES", "1000"))
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+    EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+    # Revocations reach other workers through Redis; without it, cached keys
+    # have to expire on their own, so they are kept for less time.
+    API_KEY_CACHE_TTL_SECONDS: float = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60" if os.getenv("REDIS_URL") else "5"))
+    API_KEY_CACHE_MAX_ENTRIES: int = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "100000"))
+    API_KEY_LAST_USED_FLUSH_SECONDS: float = float(os.getenv("API_KEY_LAST_USED_FLUSH_SECONDS", "5"))
+    FAST_RESPONSES: bool = os.getenv("FAST_RESPONSES", "false").lower() in ("1", "true", "yes")
     
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS: float = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
     CORS_ORIGINS: list = ["*"]
     
     JWT_SECRET: str = os.getenv("JWT_SECRET", "change-in-production")
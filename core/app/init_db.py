@@ -1,8 +1,11 @@
 import asyncio
 import logging
+from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import AsyncSessionLocal
-from app.models import Base, APIKey, User, Team, Organization
+from app.database import AsyncSessionLocal, engine
+from app.models import Base, APIKey, User, Team, Organization, PromptRunDaily, PromptRunHourly
+from app.services.archive import archive, archive_runs
+from app.services.rollups import rebuild_rollups
 from app.config import settings
 import hashlib
 
@@ -55,6 +58,27 @@ async def reset_db():
                 await session.execute(text(f"TRUNCATE TABLE {table.name} CASCADE"))
     logger.info("Database reset")
 
+async def rebuild_rollup_tables():
+    logger.info("Rebuilding hourly and daily rollups from prompt_runs...")
+    archive.configure(settings.ARCHIVE_DIR)
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all, tables=[PromptRunHourly.__table__, PromptRunDaily.__table__]
+        )
+    async with AsyncSessionLocal() as session:
+        count = await rebuild_rollups(session)
+    logger.info(f"Rollups rebuilt from {count} prompt runs")
+
+async def archive_old_runs():
+    if settings.ARCHIVE_AFTER_DAYS < 31:
+        raise ValueError("ARCHIVE_AFTER_DAYS must be at least 31")
+    archive.configure(settings.ARCHIVE_DIR)
+    before = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    logger.info(f"Archiving prompt runs from months before {before:%Y-%m} to {settings.ARCHIVE_DIR}...")
+    async with AsyncSessionLocal() as session:
+        count = await archive_runs(session, archive, before)
+    logger.info(f"Archived {count} prompt runs")
+
 if __name__ == "__main__":
     import sys
     command = sys.argv[1] if len(sys.argv) > 1 else "init"
@@ -66,6 +90,10 @@ if __name__ == "__main__":
         asyncio.run(seed_demo_data())
     elif command == "reset":
         asyncio.run(reset_db())
+    elif command == "rollups":
+        asyncio.run(rebuild_rollup_tables())
+    elif command == "archive":
+        asyncio.run(archive_old_runs())
     else:
         print(f"Unknown command: {command}")
-        print("Usage: python -m app.init_db [init|seed|reset]")
+        print("Usage: python -m app.init_db [init|seed|reset|rollups|archive]")
@@ -0,0 +1,132 @@
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TextIO
+
+import structlog
+
+LOG_FORMATS = ("json", "console")
+# Loggers that uvicorn gives their own synchronous stderr handlers.
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    # "/v1/analyze=0.1,/v1/track=0.05" -> {route template: fraction logged}
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, rate = item.rpartition("=")
+        try:
+            rates[route] = float(rate)
+        except ValueError:
+            raise ValueError(f"Invalid LOG_SAMPLE_RATES entry '{item}', expected '<route>=<rate>'")
+        if not route or not 0 <= rates[route] <= 1:
+            raise ValueError(f"Invalid LOG_SAMPLE_RATES entry '{item}', expected '<route>=<rate>' with 0 <= rate <= 1")
+    return rates
+
+def _capture_exc_info(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # The traceback is rendered on the writer thread, after the handler
+    # has returned, so grab it while it still exists.
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+def _from_record(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    record = event_dict["_record"]
+    event_dict["timestamp"] = datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    for key, value in getattr(record, "context", {}).items():
+        event_dict.setdefault(key, value)
+    return event_dict
+
+class DroppingQueueHandler(QueueHandler):
+    # Never blocks the caller: when the writer thread falls behind, records
+    # are dropped and counted.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Rendering happens on the writer thread. Plain logging records only
+        # get their message merged here, plus the request context, which
+        # lives in contextvars of this thread.
+        if not hasattr(record, "_logger"):
+            record.msg = record.getMessage()
+            record.args = None
+            record.context = structlog.contextvars.get_contextvars()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Only called on shutdown; wait for room rather than losing the stop.
+        self.queue.put(self._sentinel)
+
+class LogPipeline:
+    def __init__(self, level: str = "INFO", log_format: str = "json", max_queue: int = 10000, stream: Optional[TextIO] = None):
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format '{log_format}'. Use one of: {', '.join(LOG_FORMATS)}")
+        self.level = getattr(logging, level.upper())
+        self.max_queue = max_queue
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._handler = DroppingQueueHandler(self._queue)
+        self._writer = logging.StreamHandler(stream or sys.stderr)
+        self._writer.setFormatter(structlog.stdlib.ProcessorFormatter(
+            foreign_pre_chain=[structlog.stdlib.add_log_level, structlog.stdlib.add_logger_name, _from_record],
+            processors=[
+                structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                structlog.processors.format_exc_info,
+                structlog.processors.JSONRenderer() if log_format == "json" else structlog.dev.ConsoleRenderer(colors=False)
+            ]
+        ))
+        self._listener: Optional[_Listener] = None
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        structlog.configure(
+            processors=[
+                structlog.stdlib.filter_by_level,
+                structlog.contextvars.merge_contextvars,
+                structlog.stdlib.add_log_level,
+                structlog.stdlib.add_logger_name,
+                structlog.processors.TimeStamper(fmt="iso", utc=True),
+                _capture_exc_info,
+                structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+            ],
+            logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.stdlib.BoundLogger,
+            cache_logger_on_first_use=True
+        )
+        root = logging.getLogger()
+        root.handlers = [self._handler]
+        root.setLevel(self.level)
+        for name in SERVER_LOGGERS:
+            server_logger = logging.getLogger(name)
+            # --no-access-log leaves uvicorn.access with no handlers and no
+            # propagation; uvicorn only logs requests if it has a handler.
+            if not server_logger.handlers and not server_logger.propagate:
+                continue
+            server_logger.handlers = []
+            server_logger.propagate = True
+        self._listener = _Listener(self._queue, self._writer)
+        self._listener.start()
+
+    def stop(self) -> None:
+        # Writes out what is queued, then logs synchronously from here on.
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        logging.getLogger().handlers = [self._writer]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "dropped": self._handler.dropped
+        }
@@ -1,31 +1,83 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 import logging
+import random
 import time
+import uuid
+import structlog
 from app.config import settings
-from app.database import engine
+from app.database import engine, AsyncSessionLocal
+from app.logs import LogPipeline, parse_sample_rates
+from app.api.responses import FastJSONResponse
 from app.models import Base
-from app.api.analyze import router as analyze_router
-
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+from app.api.analyze import (
+    router as analyze_router, analysis_cache, analysis_executor, analysis_sessions, dashboard_cache,
+    most_improved_cache, leaderboard_index, run_ingestor
+)
+from app.security import api_keys, rate_limiter
+from app.services.archive import archive
+from app.services.metrics import (
+    CONTENT_TYPE, MetricsMiddleware, SharedMetrics, instrument_database, metrics, route_template
 )
+from app.services.registry import registry
+from app.services.tokenizer import configure_tokenizers
+
+log_pipeline = LogPipeline(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_QUEUE_SIZE)
+log_pipeline.start()
 logger = logging.getLogger(__name__)
+access_logger = structlog.get_logger("greenprompt.access")
+log_sample_rates = parse_sample_rates(settings.LOG_SAMPLE_RATES)
+shared_metrics = SharedMetrics(metrics, settings.METRICS_DIR, settings.METRICS_FLUSH_SECONDS)
+
+COMPONENT_STATS = {
+    "analysis_cache": analysis_cache.stats,
+    "analysis_sessions": analysis_sessions.stats,
+    "dashboard_cache": dashboard_cache.stats,
+    "most_improved_cache": most_improved_cache.stats,
+    "analysis_executor": analysis_executor.stats,
+    "run_ingestor": run_ingestor.stats,
+    "leaderboard_index": leaderboard_index.stats,
+    "archive": archive.stats,
+    "api_keys": api_keys.stats,
+    "rate_limiter": rate_limiter.stats,
+    "logging": log_pipeline.stats,
+    "metrics": shared_metrics.stats
+}
+
+instrument_database(engine)
+for component, stats in COMPONENT_STATS.items():
+    metrics.register_stats(component, stats)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    log_pipeline.start()
     logger.info("Starting GreenPrompt Core API...")
     logger.info(f"Version: {settings.APP_VERSION}")
     logger.info(f"Environment: {'DEBUG' if settings.DEBUG else 'PRODUCTION'}")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.info("Database tables created/verified")
+    configure_tokenizers(settings.TOKENIZER_DIR, settings.TOKENIZER_MODE)
+    registry.configure(settings.MODEL_REGISTRY_PATH, settings.MODEL_REGISTRY_RELOAD_SECONDS)
+    archive.configure(settings.ARCHIVE_DIR)
+    async with AsyncSessionLocal() as db:
+        await leaderboard_index.warm(db)
+    await run_ingestor.start()
+    await api_keys.start()
+    await shared_metrics.start()
     logger.info("GreenPrompt Core API started successfully")
     yield
     logger.info("Shutting down GreenPrompt Core API...")
+    await run_ingestor.drain()
+    await api_keys.stop()
+    await shared_metrics.stop()
+    await leaderboard_index.close()
+    await analysis_sessions.close()
+    await rate_limiter.close()
+    analysis_executor.shutdown()
+    log_pipeline.stop()
 
 app = FastAPI(
     title="GreenPrompt Core API",
@@ -34,6 +86,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=FastJSONResponse if settings.FAST_RESPONSES else JSONResponse,
     lifespan=lifespan
 )
 
@@ -47,12 +100,28 @@ app.add_middleware(
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(request_id=request_id)
+    start_time = time.perf_counter()
     response = await call_next(request)
-    process_time = time.time() - start_time
-    logger.info(
-        f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s"
-    )
+    process_time = time.perf_counter() - start_time
+
+    # Errors are always logged; successful requests on busy routes can be
+    # sampled, and carry the rate so counts can be scaled back up.
+    route = route_template(request.scope)
+    sample_rate = log_sample_rates.get(route, 1.0)
+    if response.status_code >= 400 or sample_rate >= 1 or random.random() < sample_rate:
+        access_logger.info(
+            "request",
+            method=request.method,
+            path=request.url.path,
+            route=route,
+            status=response.status_code,
+            duration_ms=round(process_time * 1000, 3),
+            sample_rate=sample_rate
+        )
+    response.headers["X-Request-ID"] = request_id
     return response
 
 @app.middleware("http")
@@ -66,6 +135,8 @@ async def add_security_headers(request: Request, call_next):
     })
     return response
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(analyze_router, prefix="/v1")
 
 @app.get("/", include_in_schema=False)
@@ -83,9 +154,15 @@ async def health():
     return {
         "status": "healthy",
         "version": settings.APP_VERSION,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        **{component: stats() for component, stats in COMPONENT_STATS.items()},
+        "model_registry_version": registry.snapshot.version
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(await shared_metrics.render(), media_type=CONTENT_TYPE)
+
 @app.get("/ready", include_in_schema=False)
 async def readiness_check():
     from sqlalchemy import text
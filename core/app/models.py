@@ -1,8 +1,10 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Text, func
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Text, Index, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+MEASURE_COLUMNS = ("energy_joules", "carbon_kg", "water_liters", "cost_usd")
+
 class APIKey(Base):
     __tablename__ = "api_keys"
 
@@ -18,10 +20,20 @@ class APIKey(Base):
 
 class PromptRun(Base):
     __tablename__ = "prompt_runs"
+    __table_args__ = (
+        Index("ix_prompt_runs_owner_idempotency_key", "owner", "idempotency_key", unique=True),
+        # INCLUDE makes these covering on Postgres; SQLite ignores it.
+        Index("ix_prompt_runs_owner_created", "owner", "created_at",
+              postgresql_include=("team_id", "model", *MEASURE_COLUMNS)),
+        Index("ix_prompt_runs_team_created", "team_id", "created_at", "owner",
+              postgresql_include=("model", *MEASURE_COLUMNS)),
+        Index("ix_prompt_runs_created_model", "created_at", "model",
+              postgresql_include=("owner", "team_id", *MEASURE_COLUMNS)),
+    )
 
     id = Column(Integer, primary_key=True)
-    owner = Column(String(255), nullable=False, index=True)
-    team_id = Column(String(255), nullable=True, index=True)
+    owner = Column(String(255), nullable=False)
+    team_id = Column(String(255), nullable=True)
     prompt_hash = Column(String(64), nullable=True, index=True)
     prompt_length = Column(Integer, nullable=True)
     model = Column(String(255), nullable=False, index=True)
@@ -33,7 +45,36 @@ class PromptRun(Base):
     water_liters = Column(Float, nullable=True)
     cost_usd = Column(Float, nullable=True)
     is_tracked = Column(Boolean, default=True)
-    created_at = Column(DateTime, server_default=func.now(), index=True)
+    idempotency_key = Column(String(255), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+class RollupColumns:
+    id = Column(Integer, primary_key=True)
+    owner = Column(String(255), nullable=False)
+    team_id = Column(String(255), nullable=False, default="")
+    model = Column(String(255), nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    prompt_count = Column(Integer, nullable=False, default=0)
+    energy_joules = Column(Float, nullable=False, default=0.0)
+    carbon_kg = Column(Float, nullable=False, default=0.0)
+    water_liters = Column(Float, nullable=False, default=0.0)
+    cost_usd = Column(Float, nullable=False, default=0.0)
+
+class PromptRunHourly(RollupColumns, Base):
+    __tablename__ = "prompt_runs_hourly"
+    __table_args__ = (
+        Index("ix_prompt_runs_hourly_key", "owner", "bucket", "team_id", "model", unique=True),
+        Index("ix_prompt_runs_hourly_team", "team_id", "bucket"),
+        Index("ix_prompt_runs_hourly_bucket", "bucket"),
+    )
+
+class PromptRunDaily(RollupColumns, Base):
+    __tablename__ = "prompt_runs_daily"
+    __table_args__ = (
+        Index("ix_prompt_runs_daily_key", "owner", "bucket", "team_id", "model", unique=True),
+        Index("ix_prompt_runs_daily_team", "team_id", "bucket"),
+        Index("ix_prompt_runs_daily_bucket", "bucket"),
+    )
 
 class User(Base):
     __tablename__ = "users"
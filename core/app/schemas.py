@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional
 from pydantic import BaseModel, Field
 
 class AnalyzeRequest(BaseModel):
@@ -21,10 +21,51 @@ class AnalyzeResponse(BaseModel):
     confidence: float
     model_info: Dict
 
+MAX_BATCH_ITEMS = 1000
+
+class BatchAnalyzeItem(BaseModel):
+    prompt: str
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    output_format: Optional[str] = None
+    region: Optional[str] = None
+
+class BatchAnalyzeRequest(BaseModel):
+    items: List[BatchAnalyzeItem] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+    model: str = Field(default="gpt-4o", description="Default model for items without one")
+    output_format: Optional[str] = Field(default="prose", description="Default output format for items without one")
+    region: Optional[str] = Field(default="us-west", description="Default region for items without one")
+
+class BatchAnalyzeResult(BaseModel):
+    index: int
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalyzeResponse(BaseModel):
+    results: List[BatchAnalyzeResult]
+    succeeded: int
+    failed: int
+
+class TextEdit(BaseModel):
+    offset: int = Field(..., ge=0, description="Character offset of the edit in the current prompt")
+    deleted: int = Field(default=0, ge=0, description="Number of characters removed at offset")
+    inserted: str = Field(default="", max_length=10000, description="Text inserted at offset")
+
+class AnalyzeSessionEditRequest(BaseModel):
+    edits: List[TextEdit] = Field(..., min_length=1, max_length=100)
+    base_version: Optional[int] = Field(default=None, description="Reject the edits unless the session is at this version")
+
+class AnalyzeSessionResponse(BaseModel):
+    session_id: str
+    version: int
+    prompt_length: int
+    analysis: AnalyzeResponse
+
 class OptimizeRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=10000)
     include_savings: bool = Field(default=True, description="Calculate potential savings")
     target_model: Optional[str] = Field(default=None, description="Optimize for specific model")
+    rule_set: Optional[str] = Field(default=None, max_length=32, description="Optimizer rule set version, latest if omitted")
 
 class OptimizationSuggestion(BaseModel):
     type: str
@@ -44,11 +85,15 @@ class OptimizeResponse(BaseModel):
     carbon_savings_kg: float
     cost_savings_usd: float
     estimated_new_tokens: int
+    rule_set: str
 
 class BenchmarkRequest(BaseModel):
     prompt: Optional[str] = Field(default=None, max_length=5000, description="Custom prompt for benchmarking")
     models: Optional[List[str]] = Field(default=None, description="Specific models to compare")
     include_standard: bool = Field(default=True, description="Include standard benchmark prompts")
+    prompts: Optional[List[Annotated[str, Field(min_length=1, max_length=5000)]]] = Field(
+        default=None, max_length=500, description="Batch of prompts compared in one pass"
+    )
 
 class ModelBenchmarkResult(BaseModel):
     model: str
@@ -75,6 +120,7 @@ class TrackRequest(BaseModel):
     actual_energy_joules: Optional[float] = None
     actual_cost_usd: Optional[float] = None
     team_id: Optional[str] = None
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=255, description="Retries with the same key are recorded once")
 
 class TrackResponse(BaseModel):
     id: int
@@ -85,6 +131,15 @@ class TrackResponse(BaseModel):
     water_liters: float
     cost_usd: float
     created_at: datetime
+    duplicate: bool = False
+
+class TrackBatchRequest(BaseModel):
+    items: List[TrackRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class TrackBatchResponse(BaseModel):
+    results: List[TrackResponse]
+    created: int
+    duplicates: int
 
 class UserStatsResponse(BaseModel):
     user_id: str
@@ -122,11 +177,34 @@ class LeaderboardRequest(BaseModel):
     team_id: Optional[str] = None
     days: int = Field(default=30, ge=1, le=365)
     limit: int = Field(default=10, ge=1, le=100)
+    neighbors: int = Field(default=0, ge=0, le=25, description="Entries to return above and below your own rank")
 
 class LeaderboardResponse(BaseModel):
     scope: str
     period_days: int
     entries: List[LeaderboardEntry]
+    my_rank: Optional[int] = None
+    around_me: List[LeaderboardEntry] = []
+
+class MostImprovedRequest(BaseModel):
+    scope: str = Field(default="team", pattern="^(global|team|organization)$")
+    team_id: Optional[str] = None
+    days: int = Field(default=30, ge=1, le=180)
+    limit: int = Field(default=10, ge=1, le=100)
+    cursor: Optional[str] = Field(default=None, max_length=1024, description="next_cursor from the previous page")
+
+class MostImprovedEntry(BaseModel):
+    rank: int
+    user_id: str
+    improvement_percent: float
+    previous_avg_energy: float
+    current_avg_energy: float
+
+class MostImprovedResponse(BaseModel):
+    scope: str
+    period_days: int
+    entries: List[MostImprovedEntry]
+    next_cursor: Optional[str] = None
 
 class TimeSeriesDataPoint(BaseModel):
     timestamp: str
@@ -135,11 +213,32 @@ class TimeSeriesDataPoint(BaseModel):
     cost_usd: float
     prompt_count: int
 
+class DashboardModelUsage(BaseModel):
+    model: str
+    energy_joules: float
+    carbon_kg: float
+    cost_usd: float
+    prompt_count: int
+
+class DashboardResponse(BaseModel):
+    user_id: str
+    period_days: int
+    total_energy_joules: float
+    total_carbon_kg: float
+    total_water_liters: float
+    total_cost_usd: float
+    total_prompts: int
+    avg_energy_per_prompt: float
+    savings_comparison: Dict
+    time_series: List[TimeSeriesDataPoint]
+    top_models: List[DashboardModelUsage]
+    global_rank: Optional[int] = None
+
 class TimeSeriesRequest(BaseModel):
     user_id: Optional[str] = None
     team_id: Optional[str] = None
     days: int = Field(default=30, ge=1, le=365)
-    granularity: str = Field(default="day", pattern="^(hour|day)$")
+    granularity: str = Field(default="day", pattern="^(minute|hour|day|week|month)$")
 
 class TimeSeriesResponse(BaseModel):
     scope: str
@@ -154,8 +253,11 @@ class ModelListResponse(BaseModel):
 
 class ModelSpecs(BaseModel):
     model: str
+    resolved_model: str
+    provider: str
     estimated_joules_per_token: float
     estimated_accuracy: float
+    price_per_1k_tokens: float
     energy_per_1k_tokens: float
     carbon_per_1k_tokens_kg: float
     category: str
@@ -1,18 +1,26 @@
 import hashlib
-from fastapi import Header, HTTPException, Depends, Request
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import get_db
-from app.models import APIKey
+import math
+from datetime import datetime
+from fastapi import Header, HTTPException, Request
+from app.database import AsyncSessionLocal
 from app.config import settings
+from app.services.api_keys import APIKeyStore
+from app.services.rate_limit import MemoryRateLimiter, RedisRateLimiter
+
+api_keys = APIKeyStore(
+    AsyncSessionLocal,
+    settings.API_KEY_CACHE_TTL_SECONDS,
+    settings.API_KEY_CACHE_MAX_ENTRIES,
+    settings.API_KEY_LAST_USED_FLUSH_SECONDS,
+    settings.REDIS_URL
+)
 
 def hash_key(key: str) -> str:
     return hashlib.sha256((key + settings.API_KEY_SALT).encode()).hexdigest()
 
 async def require_api_key(
     request: Request,
-    authorization: str = Header(None, alias="Authorization"),
-    db: AsyncSession = Depends(get_db)
+    authorization: str = Header(None, alias="Authorization")
 ) -> str:
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
@@ -23,50 +31,36 @@ async def require_api_key(
     raw_key = authorization.replace("Bearer ", "")
     key_hash = hash_key(raw_key)
 
-    result = await db.execute(
-        select(APIKey).where(
-            APIKey.key_hash == key_hash,
-            APIKey.is_active == True
-        )
-    )
-    api_key = result.scalar_one_or_none()
+    api_key = await api_keys.lookup(key_hash)
 
-    if not api_key:
+    if not api_key or not api_key.usable(datetime.utcnow()):
         raise HTTPException(status_code=401, detail="Invalid or expired API key")
 
-    api_key.last_used_at = __import__('datetime').datetime.utcnow()
-    await db.commit()
+    # Keys without their own limit get the RATE_LIMIT default, per minute.
+    await check_rate_limit(f"key:{api_key.id}", api_key.rate_limit or settings.RATE_LIMIT)
+    api_keys.touch(api_key)
+    request.state.api_key = api_key
+    request.state.api_key_hash = key_hash
 
     return api_key.owner
 
-class RateLimiter:
-    def __init__(self, requests_per_minute: int = 60):
-        self.requests_per_minute = requests_per_minute
-        self.requests = {}
+rate_limiter = (
+    RedisRateLimiter(settings.REDIS_URL, settings.RATE_LIMIT_MAX_CLIENTS)
+    if settings.REDIS_URL else MemoryRateLimiter(settings.RATE_LIMIT_MAX_CLIENTS)
+)
 
-    async def check_rate_limit(self, client_id: str):
-        import time
-        current = time.time()
-        if client_id not in self.requests:
-            self.requests[client_id] = []
-        
-        self.requests[client_id] = [
-            t for t in self.requests[client_id] if current - t < 60
-        ]
-        
-        if len(self.requests[client_id]) >= self.requests_per_minute:
-            raise HTTPException(
-                status_code=429,
-                detail="Rate limit exceeded. Please try again later."
-            )
-        
-        self.requests[client_id].append(current)
-
-rate_limiter = RateLimiter()
+async def check_rate_limit(client_id: str, limit: int):
+    wait = await rate_limiter.check(client_id, max(1, limit))
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded. Please try again later.",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
 
 async def require_rate_limit(
     request: Request,
     x_client_id: str = Header(None, alias="X-Client-ID")
 ):
-    client_id = x_client_id or request.client.host if request.client else "anonymous"
-    await rate_limiter.check_rate_limit(client_id)
+    client_id = x_client_id or (request.client.host if request.client else "anonymous")
+    await check_rate_limit(f"client:{client_id}", settings.RATE_LIMIT)
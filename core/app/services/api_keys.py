@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models import APIKey
+
+logger = logging.getLogger(__name__)
+
+class APIKeyRecord(NamedTuple):
+    id: int
+    owner: str
+    is_active: bool
+    expires_at: Optional[datetime]
+    rate_limit: Optional[int]
+
+    def usable(self, now: datetime) -> bool:
+        return self.is_active and (self.expires_at is None or self.expires_at > now)
+
+class APIKeyStore:
+    def __init__(
+        self,
+        session_factory: Callable,
+        ttl_seconds: float = 60.0,
+        max_entries: int = 100_000,
+        flush_interval: float = 5.0,
+        redis_url: str = "",
+        channel: str = "greenprompt:api-keys:revoked",
+        client: Optional[Any] = None
+    ):
+        self._session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        # key_hash -> (expires_at, record); None records unknown keys.
+        self._entries: "OrderedDict[str, Tuple[float, Optional[APIKeyRecord]]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._used: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # With Redis, revocations are published on a channel that every
+        # worker listens to, so each one drops the key from its cache.
+        self.channel = channel
+        if client is None and redis_url:
+            client = redis_asyncio.from_url(redis_url, decode_responses=True)
+        self._redis = client
+        self._subscribed = False
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _cached(self, key_hash: str) -> Tuple[bool, Optional[APIKeyRecord]]:
+        # While not listening for revocations, the cache could serve a key
+        # another worker has revoked.
+        if self._redis is not None and not self._subscribed:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or entry[0] < time.monotonic():
+                return False, None
+            self._entries.move_to_end(key_hash)
+            return True, entry[1]
+
+    def _store(self, key_hash: str, record: Optional[APIKeyRecord]) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + self.ttl_seconds, record)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _load(self, key_hash: str) -> Optional[APIKeyRecord]:
+        async with self._session_factory() as db:
+            result = await db.execute(
+                select(
+                    APIKey.id, APIKey.owner, APIKey.is_active, APIKey.expires_at, APIKey.rate_limit
+                ).where(APIKey.key_hash == key_hash)
+            )
+            row = result.one_or_none()
+        return APIKeyRecord(row[0], row[1], bool(row[2]), row[3], row[4]) if row else None
+
+    async def lookup(self, key_hash: str) -> Optional[APIKeyRecord]:
+        found, record = self._cached(key_hash)
+        if found:
+            self.hits += 1
+            return record
+        self.misses += 1
+        # Concurrent misses for the same key share one query.
+        loading = self._loading.get(key_hash)
+        if loading is None:
+            loading = self._loading[key_hash] = asyncio.ensure_future(self._load(key_hash))
+            loading.add_done_callback(lambda future: self._loaded(key_hash, future))
+        return await asyncio.shield(loading)
+
+    def _loaded(self, key_hash: str, future: asyncio.Future) -> None:
+        del self._loading[key_hash]
+        if not future.cancelled() and future.exception() is None:
+            self._store(key_hash, future.result())
+
+    def touch(self, record: APIKeyRecord) -> None:
+        self._used[record.id] = datetime.utcnow()
+
+    def invalidate(self, key_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    async def revoke(self, key_hash: str) -> bool:
+        async with self._session_factory() as db:
+            result = await db.execute(
+                update(APIKey).where(APIKey.key_hash == key_hash, APIKey.is_active == True).values(is_active=False)
+            )
+            await db.commit()
+        # A lookup that started before the commit must not re-cache the key.
+        loading = self._loading.get(key_hash)
+        if loading is not None:
+            await asyncio.wait([loading])
+        self.invalidate(key_hash)
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self.channel, key_hash)
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"Failed to publish API key revocation, other workers keep it until their TTL: {e}")
+        return result.rowcount > 0
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Revocations published while unsubscribed were missed.
+                    self.clear()
+                    self._subscribed = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.invalidate(message["data"])
+                            self.invalidations += 1
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"API key revocation channel lost, bypassing the key cache: {e}")
+            finally:
+                self._subscribed = False
+            await asyncio.sleep(1.0)
+
+    async def flush(self) -> None:
+        if not self._used:
+            return
+        used, self._used = self._used, {}
+        table = APIKey.__table__
+        try:
+            async with self._session_factory() as db:
+                await db.execute(
+                    update(table).where(table.c.id == bindparam("key_id")).values(last_used_at=bindparam("used_at")),
+                    [{"key_id": key_id, "used_at": used_at} for key_id, used_at in sorted(used.items())]
+                )
+                await db.commit()
+            self.flushes += 1
+        except (SQLAlchemyError, OSError) as e:
+            logger.warning(f"Failed to record API key usage for {len(used)} keys: {e}")
+            for key_id, used_at in used.items():
+                if self._used.get(key_id, used_at) <= used_at:
+                    self._used[key_id] = used_at
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        if self._redis is not None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._listener):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._listener = None
+        await self.flush()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "pending_last_used": len(self._used),
+            "flushes": self.flushes,
+            "shared_revocations": self._subscribed,
+            "invalidations": self.invalidations,
+            "errors": self.errors
+        }
@@ -0,0 +1,267 @@
+import heapq
+import logging
+import mmap
+import os
+import re
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Boolean, DateTime, Float, Integer, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PromptRun
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE_RE = re.compile(r"^prompt_runs-(\d{4})-(\d{2})\.npz$")
+ROW_GROUP_ROWS = 65536
+COLUMNS = tuple(column.name for column in PromptRun.__table__.columns)
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(ts: datetime) -> datetime:
+    return ts.replace(year=ts.year + 1, month=1) if ts.month == 12 else ts.replace(month=ts.month + 1)
+
+def _dtype(name: str) -> str:
+    column_type = PromptRun.__table__.c[name].type
+    if isinstance(column_type, DateTime):
+        return "datetime64[us]"
+    if isinstance(column_type, Boolean):
+        return "bool"
+    if isinstance(column_type, Integer):
+        return "int64"
+    if isinstance(column_type, Float):
+        return "float64"
+    return "str"
+
+COLUMN_DTYPES = {name: _dtype(name) for name in COLUMNS}
+_FILL = {"datetime64[us]": datetime(1970, 1, 1), "bool": False, "int64": 0, "float64": 0.0, "str": ""}
+
+class _MappedFile(mmap.mmap):
+    # zipfile checks seekable() before reading members.
+    def seekable(self) -> bool:
+        return True
+
+def _write_array(archive: zipfile.ZipFile, name: str, array: np.ndarray) -> None:
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+def _write_group(archive: zipfile.ZipFile, group: int, rows: List[Dict[str, Any]]) -> None:
+    for name in COLUMNS:
+        values = [row[name] for row in rows]
+        nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        fill = _FILL[COLUMN_DTYPES[name]]
+        _write_array(archive, f"{group}/{name}", np.array(
+            [fill if value is None else value for value in values],
+            dtype=str if COLUMN_DTYPES[name] == "str" else COLUMN_DTYPES[name]
+        ))
+        if nulls.any():
+            _write_array(archive, f"{group}/{name}.null", nulls)
+
+class _MonthWriter:
+    def __init__(self, archive: zipfile.ZipFile):
+        self._archive = archive
+        self._first: List[datetime] = []
+        self._last: List[datetime] = []
+        self.rows = 0
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        _write_group(self._archive, len(self._first), rows)
+        self._first.append(rows[0]["created_at"])
+        self._last.append(rows[-1]["created_at"])
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        _write_array(self._archive, "index/first", np.array(self._first, dtype="datetime64[us]"))
+        _write_array(self._archive, "index/last", np.array(self._last, dtype="datetime64[us]"))
+
+class ArchiveStore:
+    def __init__(self, directory: str = ""):
+        self.directory = directory
+        self._months: List[datetime] = []
+        self._stamp: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def configure(self, directory: str) -> None:
+        with self._lock:
+            self.directory = directory
+            self._months = []
+            self._stamp = None
+
+    def path(self, month: datetime) -> str:
+        return os.path.join(self.directory, f"prompt_runs-{month:%Y-%m}.npz")
+
+    def months(self) -> List[datetime]:
+        if not self.directory:
+            return []
+        try:
+            stamp = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            # Re-list only when a file was added or removed by another process.
+            if stamp != self._stamp:
+                found = (ARCHIVE_FILE_RE.match(name) for name in os.listdir(self.directory))
+                self._months = sorted(datetime(int(m.group(1)), int(m.group(2)), 1) for m in found if m)
+                self._stamp = stamp
+            return self._months
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        month = month_start(start)
+        return end <= next_month(month) and month in self.months()
+
+    @contextmanager
+    def _open(self, month: datetime) -> Iterator[Any]:
+        with open(self.path(month), "rb") as f:
+            mapped = _MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                with np.load(mapped, allow_pickle=False) as archive:
+                    yield archive
+            finally:
+                mapped.close()
+
+    def read(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Sequence[str] = COLUMNS
+    ) -> Iterator[Dict[str, Any]]:
+        # Yields one batch of column lists per row group, limited to
+        # [start, end). Only the requested columns are decompressed.
+        for month in self.months():
+            if (end is not None and month >= end) or (start is not None and next_month(month) <= start):
+                continue
+            with self._open(month) as archive:
+                first = archive["index/first"]
+                last = archive["index/last"]
+                for group in range(len(first)):
+                    if start is not None and last[group] < np.datetime64(start, "us"):
+                        continue
+                    if end is not None and first[group] >= np.datetime64(end, "us"):
+                        continue
+                    created = archive[f"{group}/created_at"]
+                    lo = 0 if start is None else int(np.searchsorted(created, np.datetime64(start, "us")))
+                    hi = len(created) if end is None else int(np.searchsorted(created, np.datetime64(end, "us")))
+                    if lo >= hi:
+                        continue
+                    batch = {}
+                    for name in columns:
+                        values = archive[f"{group}/{name}"][lo:hi].tolist()
+                        if f"{group}/{name}.null" in archive.files:
+                            nulls = archive[f"{group}/{name}.null"][lo:hi].tolist()
+                            values = [None if null else value for value, null in zip(values, nulls)]
+                        batch[name] = values
+                    yield batch
+
+    def rows(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Sequence[str] = COLUMNS
+    ) -> Iterator[Dict[str, Any]]:
+        for batch in self.read(start, end, columns):
+            yield from (dict(zip(columns, values)) for values in zip(*(batch[name] for name in columns)))
+
+    @contextmanager
+    def _month_writer(self, month: datetime) -> Iterator["_MonthWriter"]:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(month)
+        partial = f"{path}.partial"
+        try:
+            with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED) as f:
+                writer = _MonthWriter(f)
+                yield writer
+                writer.close()
+            with open(partial, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def stats(self) -> Dict[str, Any]:
+        months = self.months()
+        return {
+            "directory": self.directory,
+            "months": len(months),
+            "oldest": months[0].strftime("%Y-%m") if months else None,
+            "newest": months[-1].strftime("%Y-%m") if months else None
+        }
+
+archive = ArchiveStore()
+
+def _run_order(row: Dict[str, Any]) -> Tuple[datetime, int]:
+    return row["created_at"], row["id"]
+
+async def _archive_month(
+    db: AsyncSession,
+    store: ArchiveStore,
+    month: datetime,
+    writer: _MonthWriter
+) -> List[int]:
+    # Files are kept sorted by (created_at, id) across row groups, so range
+    # reads and export cursors can seek instead of scanning.
+    result = await db.stream(
+        select(PromptRun.__table__).where(
+            PromptRun.created_at >= month, PromptRun.created_at < next_month(month)
+        ).order_by(PromptRun.created_at, PromptRun.id).execution_options(yield_per=ROW_GROUP_ROWS)
+    )
+    fetched_ids = []
+    group: List[Dict[str, Any]] = []
+
+    def take(row: Dict[str, Any]) -> None:
+        nonlocal group
+        group.append(row)
+        if len(group) >= ROW_GROUP_ROWS:
+            writer.add(group)
+            group = []
+
+    if month in store.months():
+        # A month archived before (or by an interrupted run) is merged with
+        # whatever is still in prompt_runs, skipping rows already in the file.
+        archived_ids = {row["id"] for row in store.rows(month, next_month(month), ("id",))}
+        late = []
+        async for row in result.mappings():
+            fetched_ids.append(row["id"])
+            if row["id"] not in archived_ids:
+                late.append(dict(row))
+        for row in heapq.merge(store.rows(month, next_month(month)), late, key=_run_order):
+            take(row)
+    else:
+        async for row in result.mappings():
+            fetched_ids.append(row["id"])
+            take(dict(row))
+    if group:
+        writer.add(group)
+    return fetched_ids
+
+async def archive_runs(
+    db: AsyncSession,
+    store: ArchiveStore,
+    before: datetime,
+    chunk_rows: int = 10000
+) -> int:
+    # Whole calendar months older than `before` are written to one file each
+    # and then deleted from prompt_runs. Rollups are kept, so stats for those
+    # months do not change.
+    if not store.directory:
+        raise ValueError("ARCHIVE_DIR is not configured")
+    horizon = month_start(before)
+    archived = 0
+    while True:
+        oldest = await db.scalar(select(func.min(PromptRun.created_at)).where(PromptRun.created_at < horizon))
+        if oldest is None:
+            return archived
+        month = month_start(oldest)
+        with store._month_writer(month) as writer:
+            fetched_ids = await _archive_month(db, store, month, writer)
+        for start in range(0, len(fetched_ids), chunk_rows):
+            await db.execute(delete(PromptRun).where(PromptRun.id.in_(fetched_ids[start:start + chunk_rows])))
+            await db.commit()
+        archived += len(fetched_ids)
+        logger.info(f"Archived {len(fetched_ids)} prompt runs from {month:%Y-%m} ({writer.rows} rows in file)")
@@ -1,12 +1,10 @@
 from typing import Dict, List, Optional
 from app.services.energy import (
-    estimate_tokens,
-    estimate_output_tokens,
-    estimate_energy,
-    EFFICIENCY_MODELS,
+    extract_features,
     calculate_carbon_footprint,
-    get_model_comparison
+    get_comparison_engine
 )
+from app.services.registry import registry
 
 BENCHMARK_PROMPTS = {
     "simple": "What is 2+2?",
@@ -17,51 +15,70 @@ BENCHMARK_PROMPTS = {
     "analytical": "Compare and contrast the leadership styles of Winston Churchill and Nelson Mandela.",
 }
 
-async def run_benchmark(
+def run_benchmark(
     prompt: Optional[str] = None,
     models: Optional[List[str]] = None,
-    include_standard: bool = True
+    include_standard: bool = True,
+    prompts: Optional[List[str]] = None
 ) -> Dict:
     if models is None:
-        models = list(EFFICIENCY_MODELS.keys())[:10]
+        models = list(registry.snapshot.model_names[:10])
+
+    if prompts:
+        return _compare_prompts("batch", dict(enumerate(prompts)), models)
 
     if prompt is None and include_standard:
-        results = {}
-        for category, standard_prompt in BENCHMARK_PROMPTS.items():
-            model_comparison = get_model_comparison(models, standard_prompt)
-            results[category] = {
-                "prompt": standard_prompt,
-                "prompt_tokens": estimate_tokens(standard_prompt),
-                "models": model_comparison
-            }
-        return {
-            "benchmark_type": "standard",
-            "categories": list(BENCHMARK_PROMPTS.keys()),
-            "results": results
-        }
+        return _compare_prompts("standard", BENCHMARK_PROMPTS, models)
 
     if prompt:
-        model_comparison = get_model_comparison(models, prompt)
+        features = extract_features(prompt)
+        model_comparison = get_comparison_engine().compare([features], models).row(0)
         return {
             "benchmark_type": "custom",
             "prompt": prompt,
-            "prompt_tokens": estimate_tokens(prompt),
+            "prompt_tokens": features.token_count,
+            "categories": None,
+            "results": None,
             "models": model_comparison
         }
 
     return {"error": "No prompt provided and standard benchmarks disabled"}
 
+def _compare_prompts(benchmark_type: str, prompts: Dict, models: List[str]) -> Dict:
+    features = [extract_features(p) for p in prompts.values()]
+    matrix = get_comparison_engine().compare(features, models)
+
+    results = {}
+    for i, (category, category_prompt) in enumerate(prompts.items()):
+        results[str(category)] = {
+            "prompt": category_prompt,
+            "prompt_tokens": features[i].token_count,
+            "models": matrix.row(i)
+        }
+    return {
+        "benchmark_type": benchmark_type,
+        "prompt": None,
+        "prompt_tokens": int(matrix.input_tokens.sum()),
+        "categories": list(results.keys()),
+        "results": results,
+        "models": None
+    }
+
 async def get_model_specs(model: str) -> Dict:
-    model_lower = model.lower()
-    if model_lower in EFFICIENCY_MODELS:
-        info = EFFICIENCY_MODELS[model_lower]
+    snapshot = registry.snapshot
+    record = snapshot.resolve(model)
+    if record:
+        jpt = record.joules_per_token
         return {
             "model": model,
-            "estimated_joules_per_token": info["joules_per_token"],
-            "estimated_accuracy": info["accuracy"],
-            "energy_per_1k_tokens": round(info["joules_per_token"] * 1000, 2),
-            "carbon_per_1k_tokens_kg": round(info["joules_per_token"] * 1000 * 0.0004 / 1000, 6),
-            "category": "small" if info["joules_per_token"] < 0.5 else "medium" if info["joules_per_token"] < 1.5 else "large"
+            "resolved_model": record.name,
+            "provider": record.provider,
+            "estimated_joules_per_token": jpt,
+            "estimated_accuracy": record.accuracy,
+            "price_per_1k_tokens": record.price_per_1k_tokens,
+            "energy_per_1k_tokens": round(jpt * 1000, 2),
+            "carbon_per_1k_tokens_kg": round(jpt * 1000 * snapshot.carbon_factor("default") / 1000, 6),
+            "category": "small" if jpt < 0.5 else "medium" if jpt < 1.5 else "large"
         }
     return {"error": f"Model {model} not found in benchmarks"}
 
@@ -72,18 +89,19 @@ async def list_supported_models() -> Dict:
         "large_capable": []
     }
 
-    for model, info in EFFICIENCY_MODELS.items():
-        if info["joules_per_token"] < 0.5:
+    models = registry.snapshot.models
+    for model, record in models.items():
+        if record.joules_per_token < 0.5:
             models_by_category["small_efficient"].append(model)
-        elif info["joules_per_token"] < 1.5:
+        elif record.joules_per_token < 1.5:
             models_by_category["medium_balanced"].append(model)
         else:
             models_by_category["large_capable"].append(model)
 
     return {
-        "supported_models": list(EFFICIENCY_MODELS.keys()),
+        "supported_models": list(models),
         "by_category": models_by_category,
-        "total_models": len(EFFICIENCY_MODELS)
+        "total_models": len(models)
     }
 
 async def recommend_model(
@@ -96,20 +114,20 @@ async def recommend_model(
 
     candidates = []
 
-    for model, info in EFFICIENCY_MODELS.items():
-        if info["accuracy"] < min_accuracy:
+    for model, record in registry.snapshot.models.items():
+        if record.accuracy < min_accuracy:
             continue
 
         if max_budget:
-            cost = info["joules_per_token"] * 1000 * 0.00001
+            cost = record.joules_per_token * 1000 * 0.00001
             if cost > max_budget:
                 continue
 
-        if max_energy and info["joules_per_token"] > max_energy:
+        if max_energy and record.joules_per_token > max_energy:
             continue
 
-        efficiency_score = info["accuracy"] / info["joules_per_token"]
-        candidates.append((model, info, efficiency_score))
+        efficiency_score = record.accuracy / record.joules_per_token
+        candidates.append((model, record, efficiency_score))
 
     if not candidates:
         return {"error": "No models match the specified requirements"}
@@ -117,7 +135,7 @@ async def recommend_model(
     if priority == "efficiency":
         candidates.sort(key=lambda x: x[2], reverse=True)
     elif priority == "accuracy":
-        candidates.sort(key=lambda x: x[1]["accuracy"], reverse=True)
+        candidates.sort(key=lambda x: x[1].accuracy, reverse=True)
     else:
         candidates.sort(key=lambda x: x[2], reverse=True)
 
@@ -127,8 +145,8 @@ async def recommend_model(
         "recommended_model": best[0],
         "reasoning": f"Best match for {priority} priority with accuracy >= {min_accuracy}",
         "model_specs": {
-            "energy_per_token": best[1]["joules_per_token"],
-            "accuracy": best[1]["accuracy"],
+            "energy_per_token": best[1].joules_per_token,
+            "accuracy": best[1].accuracy,
             "efficiency_score": round(best[2], 2)
         },
         "alternatives": [
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Union
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.leaderboard import get_rank, rank_subqueries, savings_from_totals
+from app.services.ranking import MemoryLeaderboard, RedisLeaderboard
+from app.services.rollups import window_source
+from app.services.tracking import bucket_expression, fill_time_series, floor_bucket
+
+async def get_dashboard(
+    db: AsyncSession,
+    index: Union[MemoryLeaderboard, RedisLeaderboard],
+    owner: str,
+    days: int = 30,
+    top_models: int = 5
+) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    start_date = now - timedelta(days=days)
+
+    # One grouped read per (model, day): totals, savings, the daily series
+    # and the model breakdown are all folded from these rows. When the
+    # ranking index doesn't cover the window, the global rank rides along
+    # on every row, computed once by the database.
+    indexed = days in index.windows
+    runs = window_source(start_date, owner=owner)
+    day = bucket_expression(db.get_bind().dialect.name, "day", runs.c.bucket)
+    columns = [
+        day.label("period"),
+        runs.c.model,
+        func.sum(runs.c.energy_joules),
+        func.sum(runs.c.carbon_kg),
+        func.sum(runs.c.water_liters),
+        func.sum(runs.c.cost_usd),
+        func.sum(runs.c.prompt_count)
+    ]
+    if not indexed:
+        columns.extend(rank_subqueries(owner, start_date))
+    result = await db.execute(select(*columns).group_by("period", runs.c.model).order_by("period"))
+
+    totals = [0.0, 0.0, 0.0, 0.0, 0]
+    periods: Dict[Any, list] = {}
+    models: Dict[str, list] = {}
+    rank = None
+    for period, model, *measures in result.all():
+        if not indexed:
+            my_energy, ahead = measures[5:]
+            measures = measures[:5]
+            rank = None if my_energy is None else ahead + 1
+        measures = [value or 0 for value in measures]
+        for i, value in enumerate(measures):
+            totals[i] += value
+        point = periods.setdefault(period, [0.0, 0.0, 0.0, 0])
+        point[0] += measures[0]
+        point[1] += measures[1]
+        point[2] += measures[3]
+        point[3] += measures[4]
+        usage = models.setdefault(model, [0.0, 0.0, 0.0, 0])
+        usage[0] += measures[0]
+        usage[1] += measures[1]
+        usage[2] += measures[3]
+        usage[3] += measures[4]
+
+    energy, carbon, water, cost, prompts = totals
+    if indexed:
+        ranked = await index.query("global", days, 0, owner)
+        rank = ranked["my_rank"] if ranked is not None else await get_rank(db, owner, "global", None, days)
+
+    return {
+        "user_id": owner,
+        "period_days": days,
+        "total_energy_joules": energy,
+        "total_carbon_kg": carbon,
+        "total_water_liters": water,
+        "total_cost_usd": cost,
+        "total_prompts": prompts,
+        "avg_energy_per_prompt": energy / prompts if prompts else 0,
+        "savings_comparison": savings_from_totals(prompts, energy),
+        "time_series": await fill_time_series(
+            ((period, *point) for period, point in periods.items()), floor_bucket(start_date, "day"), "day", now
+        ),
+        "top_models": [
+            {"model": model, "energy_joules": usage[0], "carbon_kg": usage[1], "cost_usd": usage[2], "prompt_count": usage[3]}
+            for model, usage in sorted(models.items(), key=lambda item: item[1][0], reverse=True)[:top_models]
+        ],
+        "global_rank": rank
+    }
@@ -1,7 +1,12 @@
-import re
 import json
-from typing import Dict, List, Optional, Tuple
+import time
+import numpy as np
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 from dataclasses import dataclass
+from functools import cached_property
+from app.services.metrics import pipeline_stages
+from app.services.registry import DEFAULT_PRICE_PER_1K_TOKENS, RegistrySnapshot, registry
+from app.services.tokenizer import get_tokenizer
 
 OPTIMIZATION_KEYWORDS = {
     "high_energy": [
@@ -19,32 +24,31 @@ OPTIMIZATION_KEYWORDS = {
     ]
 }
 
-EFFICIENCY_MODELS = {
-    "gpt-4o": {"joules_per_token": 2.5, "accuracy": 0.95},
-    "gpt-4o-mini": {"joules_per_token": 0.8, "accuracy": 0.92},
-    "gpt-3.5-turbo": {"joules_per_token": 0.6, "accuracy": 0.89},
-    "claude-3-5-sonnet": {"joules_per_token": 1.8, "accuracy": 0.94},
-    "claude-3-haiku": {"joules_per_token": 0.5, "accuracy": 0.88},
-    "gemini-2.5-pro": {"joules_per_token": 1.5, "accuracy": 0.96},
-    "gemini-2.5-flash": {"joules_per_token": 0.35, "accuracy": 0.94},
-    "gemini-2.5-flash-lite": {"joules_per_token": 0.2, "accuracy": 0.91},
-    "gemini-2.0-flash": {"joules_per_token": 0.3, "accuracy": 0.92},
-    "gemini-2.0-flash-lite": {"joules_per_token": 0.15, "accuracy": 0.89},
-    "gemini-1.5-pro": {"joules_per_token": 1.2, "accuracy": 0.93},
-    "gemini-1.5-flash": {"joules_per_token": 0.4, "accuracy": 0.90},
-    "gemini-3-pro": {"joules_per_token": 0.9, "accuracy": 0.92},
-    "gemini-3-flash": {"joules_per_token": 0.35, "accuracy": 0.90},
-    "mistral-large": {"joules_per_token": 1.5, "accuracy": 0.92},
-    "mistral-medium": {"joules_per_token": 0.9, "accuracy": 0.90},
-    "mistral-small": {"joules_per_token": 0.4, "accuracy": 0.87},
-    "qwen-72b": {"joules_per_token": 1.8, "accuracy": 0.91},
-    "qwen-32b": {"joules_per_token": 1.0, "accuracy": 0.89},
-    "qwen-7b": {"joules_per_token": 0.5, "accuracy": 0.86},
-    "llama-3-70b": {"joules_per_token": 1.6, "accuracy": 0.91},
-    "llama-3-8b": {"joules_per_token": 0.4, "accuracy": 0.85},
-    "llama-3.1-405b": {"joules_per_token": 3.5, "accuracy": 0.96},
-    "llama-3.1-70b": {"joules_per_token": 1.4, "accuracy": 0.92},
-    "llama-3.1-8b": {"joules_per_token": 0.35, "accuracy": 0.84},
+TASK_KEYWORDS = {
+    "analysis": ["analyze", "evaluate", "assess"],
+    "generation": ["write", "create", "generate", "compose"],
+    "classification": ["classify", "categorize", "tag"],
+    "summarization": ["summarize", "condense", "abridge"],
+}
+
+FORMAT_KEYWORDS = {
+    "json": ["json"],
+    "bullets": ["bullet", "list", "- "],
+    "table": ["table", "column", "row"],
+    "markdown_headers": ["# ", "heading"],
+}
+
+CONSTRAINT_KEYWORDS = ["json", "bullet", "list", "table", "max_tokens", "limit"]
+POLITENESS_KEYWORDS = ["please", "could you"]
+VAGUENESS_KEYWORDS = ["in detail", "in depth"]
+REASONING_KEYWORDS = ["think step by step"]
+
+OUTPUT_TOKEN_MULTIPLIERS = {
+    "analysis": 2.5,
+    "generation": 3.0,
+    "classification": 0.5,
+    "summarization": 0.3,
+    "standard": 1.5
 }
 
 STRUCTURE_SAVINGS = {
@@ -56,33 +60,93 @@ STRUCTURE_SAVINGS = {
     "prose": 0.0
 }
 
+def _build_feature_vocabulary() -> Tuple[str, ...]:
+    keywords = []
+    for group in OPTIMIZATION_KEYWORDS.values():
+        keywords.extend(group)
+    for group in TASK_KEYWORDS.values():
+        keywords.extend(group)
+    for group in FORMAT_KEYWORDS.values():
+        keywords.extend(group)
+    keywords.extend(CONSTRAINT_KEYWORDS)
+    keywords.extend(POLITENESS_KEYWORDS)
+    keywords.extend(VAGUENESS_KEYWORDS)
+    keywords.extend(REASONING_KEYWORDS)
+    return tuple(dict.fromkeys(keywords))
+
+FEATURE_VOCABULARY = _build_feature_vocabulary()
+
 @dataclass
-class OptimizationSuggestion:
-    type: str
-    original_text: str
-    suggested_text: str
-    energy_savings_joules: float
-    energy_savings_percent: float
-    confidence: float
-    reason: str
-
-def estimate_tokens(text: str) -> int:
+class PromptFeatures:
+    prompt: str
+    token_count: int
+    task_type: str
+    output_format: str
+    keyword_hits: FrozenSet[str]
+
+    def has(self, *keywords: str) -> bool:
+        return any(kw in self.keyword_hits for kw in keywords)
+
+    @cached_property
+    def keyword_offsets(self) -> Dict[str, List[int]]:
+        prompt_lower = self.prompt.lower()
+        return {kw: _keyword_offsets(prompt_lower, kw) for kw in self.keyword_hits}
+
+    def output_tokens(self, task_type: Optional[str] = None) -> int:
+        return _output_tokens_for(self.token_count, task_type or self.task_type)
+
+def _output_tokens_for(prompt_tokens: int, task_type: str) -> int:
+    multiplier = OUTPUT_TOKEN_MULTIPLIERS.get(task_type, 1.5)
+    return max(50, int(prompt_tokens * multiplier))
+
+def _match_task_type(contains: Callable[[str], bool]) -> str:
+    for task_type, keywords in TASK_KEYWORDS.items():
+        if any(contains(kw) for kw in keywords):
+            return task_type
+    return "standard"
+
+def _match_output_format(contains: Callable[[str], bool]) -> str:
+    for output_format, keywords in FORMAT_KEYWORDS.items():
+        if any(contains(kw) for kw in keywords):
+            return output_format
+    return "prose"
+
+def _keyword_offsets(text_lower: str, keyword: str) -> List[int]:
+    offsets = []
+    pos = text_lower.find(keyword)
+    while pos != -1:
+        offsets.append(pos)
+        pos = text_lower.find(keyword, pos + 1)
+    return offsets
+
+def features_from_hits(prompt: str, token_count: int, keyword_hits: FrozenSet[str]) -> PromptFeatures:
+    contains = keyword_hits.__contains__
+    return PromptFeatures(
+        prompt=prompt,
+        token_count=token_count,
+        task_type=_match_task_type(contains),
+        output_format=_match_output_format(contains),
+        keyword_hits=keyword_hits
+    )
+
+def extract_features(prompt: str, model: Optional[str] = None) -> PromptFeatures:
+    started = time.perf_counter()
+    token_count = estimate_tokens(prompt, model)
+    tokenized = time.perf_counter()
+    prompt_lower = prompt.lower()
+    keyword_hits = frozenset(kw for kw in FEATURE_VOCABULARY if kw in prompt_lower)
+    features = features_from_hits(prompt, token_count, keyword_hits)
+    pipeline_stages.observe(tokenized - started, "tokenize")
+    pipeline_stages.observe(time.perf_counter() - tokenized, "detect")
+    return features
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
     if not text or not text.strip():
         return 0
-    tokens = re.findall(r'\b\w+\b|[^\w\s]|\s+', text)
-    return max(1, len(tokens))
+    return max(1, get_tokenizer(model).count(text))
 
 def estimate_output_tokens(prompt: str, task_type: str = "standard") -> int:
-    prompt_tokens = estimate_tokens(prompt)
-    multipliers = {
-        "analysis": 2.5,
-        "generation": 3.0,
-        "classification": 0.5,
-        "summarization": 0.3,
-        "standard": 1.5
-    }
-    multiplier = multipliers.get(task_type, 1.5)
-    return max(50, int(prompt_tokens * multiplier))
+    return _output_tokens_for(estimate_tokens(prompt), task_type)
 
 def estimate_energy(
     input_tokens: int,
@@ -90,22 +154,14 @@ def estimate_energy(
     model: str = "gpt-4o",
     output_format: str = "prose"
 ) -> float:
-    model_info = EFFICIENCY_MODELS.get(model.lower(), EFFICIENCY_MODELS["gpt-4o"])
-    base_joules = (input_tokens + output_tokens) * model_info["joules_per_token"]
+    snapshot = registry.snapshot
+    record = snapshot.resolve(model) or snapshot.default_model
+    base_joules = (input_tokens + output_tokens) * record.joules_per_token
     format_saving = STRUCTURE_SAVINGS.get(output_format.lower(), 0.0)
     return base_joules * (1 - format_saving)
 
 def calculate_carbon_footprint(energy_joules: float, region: str = "us-west") -> Dict[str, float]:
-    carbon_factors = {
-        "us-west": 0.00035,
-        "us-east": 0.00042,
-        "eu-west": 0.00028,
-        "eu-central": 0.00032,
-        "asia-east": 0.00055,
-        "asia-south": 0.00048,
-        "default": 0.00040
-    }
-    factor = carbon_factors.get(region.lower(), carbon_factors["default"])
+    factor = registry.snapshot.carbon_factor(region)
     co2_kg = energy_joules * factor / 1000
     return {
         "co2_kg": round(co2_kg, 6),
@@ -113,184 +169,124 @@ def calculate_carbon_footprint(energy_joules: float, region: str = "us-west") ->
         "energy_joules": energy_joules
     }
 
-def calculate_cost(energy_joules: float, provider: str = "openai") -> Dict[str, float]:
-    cost_per_1000_tokens = {
-        "openai": {"gpt-4o": 0.005, "gpt-4o-mini": 0.00015, "gpt-3.5-turbo": 0.0005},
-        "anthropic": {"claude-3-5-sonnet": 0.003, "claude-3-haiku": 0.00025},
-        "google": {
-            "gemini-2.5-pro": 0.00125, "gemini-2.5-flash": 0.00015, "gemini-2.5-flash-lite": 0.000075,
-            "gemini-2.0-flash": 0.00010, "gemini-2.0-flash-lite": 0.00005,
-            "gemini-1.5-pro": 0.00125, "gemini-1.5-flash": 0.000075,
-            "gemini-3-pro": .00050, "gemini-3-flash": 0.00010,
-        },
-        "mistral": {"mistral-large": 0.002, "mistral-medium": 0.001, "mistral-small": 0.0002},
-        "meta": {"llama-3-70b": 0.0009, "llama-3-8b": 0.00008, "llama-3.1-405b": 0.005, "llama-3.1-70b": 0.0009, "llama-3.1-8b": 0.00008},
-    }
-    default_cost = 0.001
-    provider_key = provider.lower()
-
-    if provider_key in cost_per_1000_tokens:
-        model_pricing = cost_per_1000_tokens[provider_key]
-        cost_per_token = 0.001
-        for model_name, price in model_pricing.items():
-            if model_name in provider:
-                cost_per_token = price
-                break
-    else:
-        cost_per_token = default_cost
+def calculate_cost(energy_joules: float, model: str = "gpt-4o") -> Dict[str, float]:
+    record = registry.snapshot.resolve(model)
+    cost_per_token = record.price_per_1k_tokens if record else DEFAULT_PRICE_PER_1K_TOKENS
 
     tokens_approx = energy_joules / 0.5
     estimated_cost = (tokens_approx / 1000) * cost_per_token
     return {
         "estimated_cost_usd": round(estimated_cost, 6),
         "currency": "USD",
-        "provider": provider
+        "provider": record.provider if record else "unknown"
     }
 
 def detect_task_type(prompt: str) -> str:
-    prompt_lower = prompt.lower()
-    if any(kw in prompt_lower for kw in ["analyze", "evaluate", "assess"]):
-        return "analysis"
-    elif any(kw in prompt_lower for kw in ["write", "create", "generate", "compose"]):
-        return "generation"
-    elif any(kw in prompt_lower for kw in ["classify", "categorize", "tag"]):
-        return "classification"
-    elif any(kw in prompt_lower for kw in ["summarize", "condense", "abridge"]):
-        return "summarization"
-    return "standard"
+    return _match_task_type(prompt.lower().__contains__)
 
 def detect_output_format(prompt: str) -> str:
-    prompt_lower = prompt.lower()
-    if "json" in prompt_lower:
-        return "json"
-    elif any(kw in prompt_lower for kw in ["bullet", "list", "- "]):
-        return "bullets"
-    elif any(kw in prompt_lower for kw in ["table", "column", "row"]):
-        return "table"
-    elif "# " in prompt or "heading" in prompt_lower:
-        return "markdown_headers"
-    return "prose"
+    return _match_output_format(prompt.lower().__contains__)
 
-def optimize_prompt(prompt: str) -> Tuple[str, List[OptimizationSuggestion]]:
-    suggestions = []
-    original_prompt = prompt
-    optimized_prompt = prompt
-    total_savings = 0.0
+@dataclass
+class ComparisonMatrix:
+    models: List[str]
+    input_tokens: np.ndarray
+    output_tokens: np.ndarray
+    energy_joules: np.ndarray
+    co2_kg: np.ndarray
+    accuracy: np.ndarray
+    efficiency_score: np.ndarray
+    rank: np.ndarray
 
-    prompt_lower = prompt.lower()
+    def row(self, i: int) -> List[Dict]:
+        total_tokens = int(self.input_tokens[i] + self.output_tokens[i])
+        results = []
+        for j in np.argsort(self.rank[i], kind="stable"):
+            energy = float(self.energy_joules[i, j])
+            results.append({
+                "model": self.models[j],
+                "estimated_energy_joules": round(energy, 2),
+                "estimated_tokens": total_tokens,
+                "estimated_accuracy": float(self.accuracy[j]),
+                "efficiency_score": round(float(self.efficiency_score[j]), 2),
+                "carbon_footprint": {
+                    "co2_kg": round(float(self.co2_kg[i, j]), 6),
+                    "water_liters": round(energy * 0.5, 2),
+                    "energy_joules": energy
+                },
+                "rank": int(self.rank[i, j])
+            })
+        return results
+
+class ModelComparisonEngine:
+    def __init__(
+        self,
+        snapshot: RegistrySnapshot,
+        structure_savings: Dict[str, float] = STRUCTURE_SAVINGS,
+        region: str = "us-west"
+    ):
+        self.snapshot = snapshot
+        self.model_index = {name: i for i, name in enumerate(snapshot.models)}
+        records = snapshot.models.values()
+        self.joules_per_token = np.array([r.joules_per_token for r in records], dtype=np.float64)
+        self.accuracy = np.array([r.accuracy for r in records], dtype=np.float64)
+        self.structure_savings = dict(structure_savings)
+        self.carbon_factor = snapshot.carbon_factor(region)
+        self.default_index = self.model_index[snapshot.default_model.name]
+
+    def _lookup(self, model: str) -> int:
+        record = self.snapshot.resolve(model)
+        return self.model_index[record.name] if record else -1
+
+    def _model_vectors(self, models: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        idx = np.array([self._lookup(m) for m in models], dtype=np.int64)
+        known = idx >= 0
+        safe_idx = np.where(known, idx, 0)
+        energy_jpt = np.where(known, self.joules_per_token[safe_idx], self.joules_per_token[self.default_index])
+        info_jpt = np.where(known, self.joules_per_token[safe_idx], 1.5)
+        accuracy = np.where(known, self.accuracy[safe_idx], 0.85)
+        return energy_jpt, info_jpt, accuracy
+
+    def compare(self, features: List[PromptFeatures], models: List[str]) -> ComparisonMatrix:
+        energy_jpt, info_jpt, accuracy = self._model_vectors(models)
+        input_tokens = np.fromiter((f.token_count for f in features), dtype=np.int64, count=len(features))
+        output_tokens = np.maximum(50, (input_tokens * OUTPUT_TOKEN_MULTIPLIERS["standard"]).astype(np.int64))
+        format_saving = np.fromiter(
+            (self.structure_savings.get(f.output_format, 0.0) for f in features),
+            dtype=np.float64,
+            count=len(features)
+        )
+
+        tokens = (input_tokens + output_tokens).astype(np.float64)
+        energy = tokens[:, None] * energy_jpt[None, :] * (1 - format_saving)[:, None]
+        order = np.argsort(np.round(energy, 2), axis=1, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(1, len(models) + 1)[None, :], axis=1)
+
+        return ComparisonMatrix(
+            models=list(models),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            energy_joules=energy,
+            co2_kg=energy * self.carbon_factor / 1000,
+            accuracy=accuracy,
+            efficiency_score=accuracy / (info_jpt / 0.5),
+            rank=rank
+        )
+
+_comparison_engine = ModelComparisonEngine(registry.snapshot)
+
+def get_comparison_engine() -> ModelComparisonEngine:
+    global _comparison_engine
+    snapshot = registry.snapshot
+    if _comparison_engine.snapshot is not snapshot:
+        _comparison_engine = ModelComparisonEngine(snapshot)
+    return _comparison_engine
 
-    for keyword in OPTIMIZATION_KEYWORDS["high_energy"]:
-        if keyword in prompt_lower:
-            for low_energy in OPTIMIZATION_KEYWORDS["low_energy"]:
-                if low_energy not in prompt_lower:
-                    savings = estimate_tokens(keyword) * 0.5
-                    total_savings += savings
-                    suggestions.append(OptimizationSuggestion(
-                        type="keyword_replacement",
-                        original_text=keyword,
-                        suggested_text=low_energy,
-                        energy_savings_joules=savings,
-                        energy_savings_percent=15.0,
-                        confidence=0.85,
-                        reason=f"'{keyword}' consumes high energy. '{low_energy}' achieves similar result with lower overhead."
-                    ))
-                    optimized_prompt = optimized_prompt.replace(keyword, low_energy)
-                    break
-            break
-
-    if "please" in prompt_lower or "could you" in prompt_lower:
-        original = "Please "
-        if optimized_prompt.lower().startswith("please "):
-            optimized_prompt = optimized_prompt[7:]
-            savings = estimate_tokens(original) * 0.5
-            total_savings += savings
-            suggestions.append(OptimizationSuggestion(
-                type="remove_politeness",
-                original_text="Please",
-                suggested_text="[removed]",
-                energy_savings_joules=savings,
-                energy_savings_percent=5.0,
-                confidence=0.95,
-                reason="Politeness phrases increase token count without affecting output quality."
-            ))
-
-    if "in detail" in prompt_lower or "in depth" in prompt_lower:
-        savings = 15.0
-        total_savings += savings
-        suggestions.append(OptimizationSuggestion(
-            type="remove_vagueness",
-            original_text="in detail/in depth",
-            suggested_text="[specify focus areas]",
-            energy_savings_joules=savings,
-            energy_savings_percent=10.0,
-            confidence=0.80,
-            reason="Vague directives waste tokens. Specify exact areas of focus instead."
-        ))
-
-    if "think step by step" in prompt_lower:
-        savings = 25.0
-        total_savings += savings
-        suggestions.append(OptimizationSuggestion(
-            type="remove_reasoning",
-            original_text="think step by step",
-            suggested_text="[removed for efficiency]",
-            energy_savings_joules=savings,
-            energy_savings_percent=12.0,
-            confidence=0.70,
-            reason="Chain-of-thought significantly increases output. Use only when necessary."
-        ))
-
-    if not re.search(r'(json|bullet|list|table|max_tokens|limit)', prompt_lower):
-        savings = 10.0
-        suggestions.append(OptimizationSuggestion(
-            type="add_constraint",
-            original_text="[no constraints]",
-            suggested_text="Add output format or token limit",
-            energy_savings_joules=savings,
-            energy_savings_percent=8.0,
-            confidence=0.75,
-            reason="Adding output constraints helps models produce focused, efficient responses."
-        ))
-
-    if len(prompt) > 500 and estimate_tokens(prompt) > 100:
-        savings = estimate_tokens(prompt) * 0.1
-        total_savings += savings
-        suggestions.append(OptimizationSuggestion(
-            type="concise_instruction",
-            original_text="[long prompt]",
-            suggested_text="Summarize key requirements",
-            energy_savings_joules=savings,
-            energy_savings_percent=10.0,
-            confidence=0.65,
-            reason="Concise prompts with clear requirements outperform verbose ones."
-        ))
-
-    return optimized_prompt.strip(), suggestions
-
-def get_model_comparison(models: List[str], prompt: str) -> List[Dict]:
-    input_tokens = estimate_tokens(prompt)
-    output_tokens = estimate_output_tokens(prompt)
-    task_type = detect_task_type(prompt)
-    output_format = detect_output_format(prompt)
-
-    results = []
-    for model in models:
-        model_lower = model.lower()
-        energy = estimate_energy(input_tokens, output_tokens, model_lower, output_format)
-        model_info = EFFICIENCY_MODELS.get(model_lower, {"joules_per_token": 1.5, "accuracy": 0.85})
-        efficiency_score = model_info["accuracy"] / (model_info["joules_per_token"] / 0.5)
-
-        results.append({
-            "model": model,
-            "estimated_energy_joules": round(energy, 2),
-            "estimated_tokens": input_tokens + output_tokens,
-            "estimated_accuracy": model_info["accuracy"],
-            "efficiency_score": round(efficiency_score, 2),
-            "carbon_footprint": calculate_carbon_footprint(energy)
-        })
-
-    results.sort(key=lambda x: x["estimated_energy_joules"])
-    for i, r in enumerate(results):
-        r["rank"] = i + 1
-
-    return results
+def get_model_comparison(
+    models: List[str],
+    prompt: str,
+    features: Optional[PromptFeatures] = None
+) -> List[Dict]:
+    features = features or extract_features(prompt)
+    return get_comparison_engine().compare([features], models).row(0)
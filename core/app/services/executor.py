@@ -0,0 +1,148 @@
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services.metrics import pipeline_stages
+from app.services.registry import registry
+from app.services.tokenizer import configure_tokenizers
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+class ExecutorSaturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    def __init__(self, deadline_seconds: float, retry_after: int):
+        super().__init__(f"Analysis did not finish within {deadline_seconds:g}s")
+        self.retry_after = retry_after
+
+def configure_worker(
+    tokenizer_dir: str,
+    tokenizer_mode: str,
+    registry_path: str,
+    registry_reload_seconds: float
+) -> None:
+    configure_tokenizers(tokenizer_dir, tokenizer_mode)
+    registry.configure(registry_path, registry_reload_seconds)
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[float, Any, Optional[Dict]]:
+    started_at = time.time()
+    result = fn(*args)
+    # Stage timings recorded in a worker process are handed back with the
+    # result so the parent's /metrics includes them.
+    stages = pipeline_stages.drain() if multiprocessing.parent_process() is not None else None
+    return started_at, result, stages
+
+class AnalysisExecutor:
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 64,
+        inline_max_chars: int = 2000,
+        deadline_seconds: float = 10.0,
+        initializer: Optional[Callable] = None,
+        initargs: Tuple = ()
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}'. Use one of: {', '.join(EXECUTOR_MODES)}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.inline_max_chars = inline_max_chars
+        self.deadline_seconds = deadline_seconds
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._service_seconds = 0.0
+        self.in_flight = 0
+        self.inline = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self._initializer,
+                    initargs=self._initargs
+                )
+            else:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="analysis")
+        return self._pool
+
+    def _retry_after(self) -> int:
+        backlog = max(0, self.in_flight - self.max_workers) + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_workers))
+
+    def _release(self, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn: Callable, *args: Any, size: int = 0) -> Any:
+        if self.mode == "inline" or size <= self.inline_max_chars:
+            self.inline += 1
+            return fn(*args)
+
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self._retry_after())
+            self.in_flight += 1
+        self.submitted += 1
+        submitted_at = time.time()
+        try:
+            future = self._get_pool().submit(_timed_call, fn, args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            started_at, result, stages = await asyncio.wait_for(asyncio.wrap_future(future), self.deadline_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise DeadlineExceeded(self.deadline_seconds, self._retry_after())
+
+        if stages:
+            pipeline_stages.merge(stages)
+        wait = max(0.0, started_at - submitted_at)
+        self.completed += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self._service_seconds += 0.2 * (time.time() - started_at - self._service_seconds)
+        return result
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.max_workers),
+            "inline": self.inline,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.completed, 6) if self.completed else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 6)
+        }
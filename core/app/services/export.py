@@ -0,0 +1,202 @@
+import asyncio
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from app.models import PromptRun, Team, User
+from app.services.archive import COLUMN_DTYPES, COLUMNS, ArchiveStore, next_month
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "arrow": "application/vnd.apache.arrow.stream"}
+EXPORT_COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+Cursor = Tuple[datetime, int]
+
+def parse_cursor(cursor: str) -> Cursor:
+    # The cursor is "<created_at>,<id>" of the last row received, so a client
+    # can build it from its partial download.
+    try:
+        created_at, run_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(run_id)
+    except ValueError as e:
+        raise ValueError("Invalid cursor, expected '<created_at>,<id>' of the last row received") from e
+
+def check_export_options(output_format: str, compression: str) -> None:
+    if output_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{output_format}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}'. Use one of: {', '.join(EXPORT_COMPRESSIONS)}")
+    if output_format == "arrow" and pa is None:
+        raise ValueError("Arrow export requires the pyarrow package")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package")
+
+async def export_allowed(db, owner: str, team_id: Optional[str] = None, organization_id: Optional[str] = None) -> bool:
+    # Team and organization exports are limited to users of that
+    # organization, or of the organization the team belongs to.
+    member_of = await db.scalar(select(User.organization_id).where(User.id == owner))
+    if member_of is None:
+        return False
+    if organization_id is not None:
+        return organization_id == member_of
+    return await db.scalar(select(Team.organization_id).where(Team.id == team_id)) == member_of
+
+def export_filename(output_format: str, compression: str) -> str:
+    return f"prompt_runs.{output_format}{EXPORT_COMPRESSIONS[compression]}"
+
+def _row_filter(owner: Optional[str], team_ids: Optional[set]) -> Callable[[Dict[str, Any]], bool]:
+    if owner is not None:
+        return lambda row: row["owner"] == owner
+    return lambda row: row["team_id"] in team_ids
+
+def _archive_batches(
+    store: ArchiveStore,
+    start: datetime,
+    end: datetime,
+    after: Optional[Cursor],
+    keep: Callable[[Dict[str, Any]], bool],
+    batch_rows: int
+) -> Iterator[List[Dict[str, Any]]]:
+    for batch in store.read(max(start, after[0]) if after else start, end):
+        rows = [dict(zip(COLUMNS, values)) for values in zip(*(batch[name] for name in COLUMNS))]
+        rows = [row for row in rows if keep(row) and (after is None or (row["created_at"], row["id"]) > after)]
+        for offset in range(0, len(rows), batch_rows):
+            yield rows[offset:offset + batch_rows]
+
+async def export_runs(
+    session_factory: Callable,
+    store: ArchiveStore,
+    start: datetime,
+    end: datetime,
+    owner: Optional[str] = None,
+    team_id: Optional[str] = None,
+    organization_id: Optional[str] = None,
+    after: Optional[Cursor] = None,
+    batch_rows: int = 5000
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    # Rows come out in (created_at, id) order: archived months first, read
+    # from their files, then prompt_runs through a server-side cursor.
+    async with session_factory() as db:
+        team_ids = None
+        if owner is None:
+            team_ids = {team_id} if team_id else set(
+                (await db.execute(select(Team.id).where(Team.organization_id == organization_id))).scalars()
+            )
+        keep = _row_filter(owner, team_ids)
+
+        months = store.months()
+        archive_end = min(next_month(months[-1]), end) if months else start
+        if months and start < archive_end:
+            batches = _archive_batches(store, start, archive_end, after, keep, batch_rows)
+            while (rows := await asyncio.to_thread(next, batches, None)) is not None:
+                yield rows
+
+        query = select(PromptRun.__table__).where(
+            PromptRun.created_at >= max(start, archive_end), PromptRun.created_at < end
+        )
+        if owner is not None:
+            query = query.where(PromptRun.owner == owner)
+        else:
+            query = query.where(PromptRun.team_id.in_(sorted(team_ids)))
+        if after is not None:
+            query = query.where(tuple_(PromptRun.created_at, PromptRun.id) > tuple_(*after))
+        result = await db.stream(
+            query.order_by(PromptRun.created_at, PromptRun.id).execution_options(yield_per=batch_rows)
+        )
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+class _CSVEncoder:
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(COLUMNS)
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        self._writer.writerows([_json_value(row[name]) for name in COLUMNS] for row in rows)
+        return self._drain()
+
+    def close(self) -> bytes:
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+class _NDJSONEncoder:
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        return "".join(
+            json.dumps({name: _json_value(row[name]) for name in COLUMNS}) + "\n" for row in rows
+        ).encode("utf-8")
+
+    def close(self) -> bytes:
+        return b""
+
+class _ArrowEncoder:
+    def __init__(self):
+        types = {
+            "datetime64[us]": pa.timestamp("us"), "bool": pa.bool_(), "int64": pa.int64(),
+            "float64": pa.float64(), "str": pa.string()
+        }
+        self._schema = pa.schema([(name, types[COLUMN_DTYPES[name]]) for name in COLUMNS])
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, self._schema)
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        self._writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self._schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+_ENCODERS = {"csv": _CSVEncoder, "ndjson": _NDJSONEncoder, "arrow": _ArrowEncoder}
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    if compression == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+        return compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+    return (lambda data: data), (lambda: b""), (lambda: b"")
+
+async def encode_export(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+    output_format: str,
+    compression: str
+) -> AsyncIterator[bytes]:
+    encoder = _ENCODERS[output_format]()
+    compress, flush_block, finish = _compressor(compression)
+    async for rows in batches:
+        # Flushing per batch keeps what the client has received decodable up
+        # to the last whole batch if the connection drops.
+        data = compress(encoder.encode(rows)) + flush_block()
+        if data:
+            yield data
+    yield compress(encoder.close()) + finish()
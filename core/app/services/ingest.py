@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError, SQLAlchemyError
+
+from app.models import PromptRun
+from app.services.rollups import apply_rollups
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RUN_FIELDS = (
+    "owner", "team_id", "prompt_hash", "prompt_length", "model", "prompt_tokens",
+    "estimated_output_tokens", "energy_joules", "carbon_kg", "water_liters", "cost_usd", "created_at"
+)
+# Errors that say the database can't be reached, rather than that the rows
+# themselves were refused.
+UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, DisconnectionError, OSError)
+REPLAY_RETRY_SECONDS = 30.0
+
+class IngestUnavailable(Exception):
+    pass
+
+def _lock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _try_lock(f) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _same_file(f, path: str) -> bool:
+    try:
+        return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+def _encode(row: Dict[str, Any]) -> str:
+    return json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+
+def _decode(lines: Iterator[str]) -> Iterator[Dict[str, Any]]:
+    for line in lines:
+        try:
+            row = json.loads(line)
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Skipping unreadable spill record")
+            continue
+        yield row
+
+def append_spill(path: str, rows: List[Dict[str, Any]]) -> None:
+    payload = "".join(_encode(row) for row in rows)
+    while True:
+        with open(path, "a", encoding="utf-8") as f:
+            _lock(f)
+            # A replay may have renamed the file between open() and flock().
+            if not _same_file(f, path):
+                continue
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            return
+
+def _claim_spill(path: str) -> Optional[Tuple[Any, List[Dict[str, Any]]]]:
+    replay_path = f"{path}.replay"
+    if not os.path.exists(replay_path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "a", encoding="utf-8") as f:
+            _lock(f)
+            if _same_file(f, path):
+                os.replace(path, replay_path)
+    try:
+        f = open(replay_path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    if not _try_lock(f) or not _same_file(f, replay_path):
+        f.close()
+        return None
+    return f, list(_decode(f))
+
+class RunIngestor:
+    def __init__(
+        self,
+        session_factory: Callable,
+        batch_rows: int = 500,
+        flush_interval: float = 0.25,
+        max_pending: int = 100_000,
+        spill_path: str = "",
+        drain_timeout: float = 10.0,
+        on_insert: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+    ):
+        self._session_factory = session_factory
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.drain_timeout = drain_timeout
+        self._on_insert = on_insert
+        self._pending: Deque[Tuple[Dict[str, Any], Optional[asyncio.Future]]] = deque()
+        # The batch _flush is writing, kept here so a drain that cancels the
+        # flush can still spill it.
+        self._in_flight: List[Tuple[Dict[str, Any], Optional[asyncio.Future]]] = []
+        self._overflow: List[Dict[str, Any]] = []
+        self._overflow_task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._replay_after = 0.0
+        self.inserted = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.quarantined = 0
+        self.dropped = 0
+
+    def _enqueue(self, row: Dict[str, Any], future: Optional[asyncio.Future]) -> None:
+        row = {field: row.get(field) for field in RUN_FIELDS}
+        if row["created_at"] is None:
+            row["created_at"] = datetime.utcnow()
+        self._pending.append((row, future))
+        self._wake.set()
+        if len(self._pending) >= self.batch_rows:
+            self._full.set()
+
+    def submit(self, row: Dict[str, Any]) -> None:
+        if self._task is not None and self._task.done():
+            self.dropped += 1
+            raise IngestUnavailable("Run ingestion has stopped")
+        if len(self._pending) >= self.max_pending:
+            # Overflow is spilled in batches off the event loop; past another
+            # max_pending rows waiting for the spill file, runs are dropped.
+            if len(self._overflow) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._overflow.append(row)
+            if self._overflow_task is None:
+                self._overflow_task = asyncio.get_running_loop().create_task(self._spill_overflow())
+            return
+        self._enqueue(row, None)
+
+    async def _spill_overflow(self) -> None:
+        try:
+            while self._overflow:
+                rows, self._overflow = self._overflow, []
+                try:
+                    await asyncio.to_thread(self._spill, rows)
+                except OSError as e:
+                    self.dropped += len(rows)
+                    logger.error(f"Dropping {len(rows)} prompt runs: spill failed: {e}")
+        finally:
+            self._overflow_task = None
+
+    async def write(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self._task is None or self._task.done() or self._closing or len(self._pending) >= self.max_pending:
+            raise IngestUnavailable("Run ingestion is not accepting writes")
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(row, future)
+        return await future
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        if not self.spill_path:
+            logger.error(f"Dropping {len(rows)} prompt runs: database unavailable and no spill file configured")
+            return
+        rows = [{field: row.get(field) for field in RUN_FIELDS} for row in rows]
+        for row in rows:
+            row["created_at"] = row["created_at"] or datetime.utcnow()
+        append_spill(self.spill_path, rows)
+        self.spilled += len(rows)
+
+    async def start(self) -> None:
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._stopped)
+
+    def _stopped(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Run ingestion stopped; runs are no longer written", exc_info=task.exception())
+            for _, future in self._in_flight + list(self._pending):
+                if future is not None and not future.done():
+                    future.set_exception(IngestUnavailable("Run ingestion has stopped"))
+
+    async def drain(self) -> None:
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        self._full.set()
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Ingestion drain timed out; spilling {len(self._in_flight) + len(self._pending)} pending runs"
+            )
+        except Exception:
+            # Already logged by _stopped; spill whatever it left behind.
+            pass
+        self._task = None
+        leftover = self._in_flight + list(self._pending)
+        self._in_flight = []
+        self._pending.clear()
+        for _, future in leftover:
+            if future is not None and not future.done():
+                future.set_exception(IngestUnavailable("Server is shutting down"))
+        if self._overflow_task is not None:
+            await self._overflow_task
+        await asyncio.to_thread(self._spill, [row for row, future in leftover if future is None])
+
+    async def _run(self) -> None:
+        await self._replay_spill()
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            if not self._closing and len(self._pending) < self.batch_rows:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_rows, len(self._pending)))]
+            if await self._flush(batch) and not self._closing:
+                await self._replay_spill()
+            elif not self._closing:
+                await asyncio.sleep(self.flush_interval)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], Optional[asyncio.Future]]]) -> bool:
+        self._in_flight = batch
+        try:
+            async with self._session_factory() as db:
+                result = await db.execute(
+                    insert(PromptRun).returning(PromptRun.id, PromptRun.created_at, sort_by_parameter_order=True),
+                    [row for row, _ in batch]
+                )
+                keys = result.all()
+                await apply_rollups(db, [row for row, _ in batch])
+                await db.commit()
+            self._in_flight = []
+        except (SQLAlchemyError, OSError) as e:
+            self._in_flight = []
+            self.failed_batches += 1
+            logger.warning(f"Prompt run flush of {len(batch)} rows failed: {e}")
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(IngestUnavailable("Database is unavailable"))
+            await asyncio.to_thread(self._spill, [row for row, future in batch if future is None])
+            return False
+
+        for (row, future), (run_id, created_at) in zip(batch, keys):
+            if future is not None and not future.done():
+                future.set_result({**row, "id": run_id, "created_at": created_at})
+        self.inserted += len(batch)
+        self.batches += 1
+        await self._notify([row for row, _ in batch])
+        return True
+
+    async def _notify(self, rows: List[Dict[str, Any]]) -> None:
+        # The rows are committed; a failing listener must not stop ingestion.
+        if not rows or self._on_insert is None:
+            return
+        try:
+            await self._on_insert(rows)
+        except Exception:
+            logger.exception(f"Insert listener failed for {len(rows)} prompt runs")
+
+    async def _insert_rows(self, rows: List[Dict[str, Any]]) -> None:
+        async with self._session_factory() as db:
+            await db.execute(insert(PromptRun), rows)
+            await apply_rollups(db, rows)
+            await db.commit()
+
+    async def _replay_spill(self) -> None:
+        if not self.spill_path or time.monotonic() < self._replay_after:
+            return
+        claimed = await asyncio.to_thread(_claim_spill, self.spill_path)
+        if claimed is None:
+            return
+        f, rows = claimed
+        inserted: List[Dict[str, Any]] = []
+        refused: List[Dict[str, Any]] = []
+        # Each batch commits on its own, so a failure only costs the rows
+        # from `position` on; rows the database refuses are quarantined
+        # rather than blocking the rest of the file.
+        position = 0
+        try:
+            while position < len(rows):
+                batch = rows[position:position + self.batch_rows]
+                try:
+                    await self._insert_rows(batch)
+                    inserted.extend(batch)
+                    position += len(batch)
+                    continue
+                except UNAVAILABLE_ERRORS:
+                    raise
+                except SQLAlchemyError as e:
+                    logger.warning(f"Spilled batch of {len(batch)} rows refused, retrying row by row: {e}")
+                for row in batch:
+                    try:
+                        await self._insert_rows([row])
+                        inserted.append(row)
+                    except UNAVAILABLE_ERRORS:
+                        raise
+                    except SQLAlchemyError as e:
+                        refused.append(row)
+                        logger.warning(f"Quarantining spilled prompt run: {e}")
+                    position += 1
+        except UNAVAILABLE_ERRORS as e:
+            self._replay_after = time.monotonic() + REPLAY_RETRY_SECONDS
+            logger.warning(f"Spill replay stopped after {position} of {len(rows)} rows, will retry: {e}")
+        except asyncio.CancelledError:
+            # Shutting down: record how far the replay got before letting go.
+            self._settle_replay(f, rows[position:], refused)
+            raise
+        try:
+            await asyncio.to_thread(self._settle_replay, f, rows[position:], refused)
+        except OSError as e:
+            self._replay_after = time.monotonic() + REPLAY_RETRY_SECONDS
+            logger.error(f"Failed to update spill file {f.name}: {e}")
+        self.replayed += len(inserted)
+        if rows:
+            logger.info(f"Replayed {len(inserted)} spilled prompt runs, quarantined {len(refused)}")
+        await self._notify(inserted)
+
+    def _settle_replay(self, f, remaining: List[Dict[str, Any]], refused: List[Dict[str, Any]]) -> None:
+        try:
+            if refused:
+                append_spill(f"{self.spill_path}.quarantine", refused)
+                self.quarantined += len(refused)
+            if remaining:
+                # Keep only the rows still to replay, so the next attempt
+                # starts where this one stopped.
+                temporary = f"{f.name}.tmp"
+                with open(temporary, "w", encoding="utf-8") as out:
+                    out.write("".join(_encode(row) for row in remaining))
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(temporary, f.name)
+            else:
+                os.remove(f.name)
+        finally:
+            f.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "quarantined": self.quarantined,
+            "dropped": self.dropped
+        }
@@ -1,8 +1,14 @@
+import base64
+import json
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from sqlalchemy import func, select
+from typing import Any, Dict, List, Optional, Tuple, Union
+from sqlalchemy import and_, case, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import PromptRun, Team, User
+from app.models import PromptRunDaily, Team
+from app.services.cache import SnapshotCache
+from app.services.ranking import MemoryLeaderboard, RedisLeaderboard, index_scope
+from app.services.rollups import day_bucket, window_source
 
 async def get_leaderboard(
     db: AsyncSession,
@@ -14,17 +20,15 @@ async def get_leaderboard(
     start_date = datetime.utcnow() - timedelta(days=days)
 
     if scope == "global":
+        runs = window_source(start_date)
         result = await db.execute(
             select(
-                PromptRun.owner,
-                func.sum(PromptRun.energy_joules),
-                func.sum(PromptRun.carbon_kg),
-                func.count(PromptRun.id),
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.created_at >= start_date
-            ).group_by(PromptRun.owner).order_by(
-                func.sum(PromptRun.energy_joules)
+                runs.c.owner,
+                func.sum(runs.c.energy_joules),
+                func.sum(runs.c.carbon_kg),
+                func.sum(runs.c.prompt_count)
+            ).group_by(runs.c.owner).order_by(
+                func.sum(runs.c.energy_joules)
             ).limit(limit)
         )
 
@@ -36,25 +40,22 @@ async def get_leaderboard(
                 "total_energy_joules": row[1] or 0,
                 "total_carbon_kg": row[2] or 0,
                 "prompt_count": row[3] or 0,
-                "avg_energy_per_prompt": row[4] or 0
+                "avg_energy_per_prompt": row[1] / row[3] if row[3] else 0
             })
 
     elif scope == "team":
         if not team_id:
             return []
 
+        runs = window_source(start_date, team_id=team_id)
         result = await db.execute(
             select(
-                PromptRun.owner,
-                func.sum(PromptRun.energy_joules),
-                func.sum(PromptRun.carbon_kg),
-                func.count(PromptRun.id),
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.team_id == team_id,
-                PromptRun.created_at >= start_date
-            ).group_by(PromptRun.owner).order_by(
-                func.sum(PromptRun.energy_joules)
+                runs.c.owner,
+                func.sum(runs.c.energy_joules),
+                func.sum(runs.c.carbon_kg),
+                func.sum(runs.c.prompt_count)
+            ).group_by(runs.c.owner).order_by(
+                func.sum(runs.c.energy_joules)
             ).limit(limit)
         )
 
@@ -66,25 +67,25 @@ async def get_leaderboard(
                 "total_energy_joules": row[1] or 0,
                 "total_carbon_kg": row[2] or 0,
                 "prompt_count": row[3] or 0,
-                "avg_energy_per_prompt": row[4] or 0
+                "avg_energy_per_prompt": row[1] / row[3] if row[3] else 0
             })
 
     elif scope == "organization":
         if not team_id:
             return []
 
+        runs = window_source(start_date)
         result = await db.execute(
             select(
                 Team.id,
                 Team.name,
-                func.sum(PromptRun.energy_joules),
-                func.sum(PromptRun.carbon_kg),
-                func.count(PromptRun.id)
-            ).join(Team, PromptRun.team_id == Team.id).where(
-                Team.organization_id == team_id,
-                PromptRun.created_at >= start_date
-            ).group_by(Team.id).order_by(
-                func.sum(PromptRun.energy_joules)
+                func.sum(runs.c.energy_joules),
+                func.sum(runs.c.carbon_kg),
+                func.sum(runs.c.prompt_count)
+            ).join(Team, runs.c.team_id == Team.id).where(
+                Team.organization_id == team_id
+            ).group_by(Team.id, Team.name).order_by(
+                func.sum(runs.c.energy_joules)
             ).limit(limit)
         )
 
@@ -101,72 +102,148 @@ async def get_leaderboard(
 
     return entries
 
-async def get_most_improved(
+def rank_subqueries(owner: str, start_date: datetime, team_id: Optional[str] = None) -> Tuple[Any, Any]:
+    # The SQL counterpart of the ranking index, as two uncorrelated scalar
+    # subqueries that can ride along with another query: the owner's energy
+    # and how many owners come first, ordered by energy, ties by user id.
+    runs = window_source(start_date, team_id=team_id)
+    totals = select(runs.c.owner, func.sum(runs.c.energy_joules).label("energy")).group_by(runs.c.owner).cte()
+    mine = select(totals.c.energy).where(totals.c.owner == owner).scalar_subquery()
+    ahead = select(func.count()).select_from(totals).where(
+        or_(totals.c.energy < mine, and_(totals.c.energy == mine, totals.c.owner < owner))
+    ).scalar_subquery()
+    return mine, ahead
+
+async def get_rank(
     db: AsyncSession,
+    owner: str,
+    scope: str = "global",
     team_id: Optional[str] = None,
     days: int = 30
-) -> List[Dict]:
-    mid_point = datetime.utcnow() - timedelta(days=days * 2)
-    start_date = datetime.utcnow() - timedelta(days=days)
+) -> Optional[int]:
+    if index_scope(scope, team_id) is None:
+        return None
+    mine, ahead = rank_subqueries(
+        owner, datetime.utcnow() - timedelta(days=days), team_id if scope == "team" else None
+    )
+    energy, count = (await db.execute(select(mine, ahead))).one()
+    return None if energy is None else count + 1
 
-    if team_id:
-        first_period = await db.execute(
-            select(
-                PromptRun.owner,
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.team_id == team_id,
-                PromptRun.created_at >= mid_point,
-                PromptRun.created_at < start_date
-            ).group_by(PromptRun.owner)
-        )
+async def get_ranked_leaderboard(
+    db: AsyncSession,
+    index: Union[MemoryLeaderboard, RedisLeaderboard],
+    owner: str,
+    scope: str = "team",
+    team_id: Optional[str] = None,
+    days: int = 30,
+    limit: int = 10,
+    neighbors: int = 0
+) -> Dict[str, Any]:
+    key = index_scope(scope, team_id)
+    if key is not None and days in index.windows:
+        ranked = await index.query(key, days, limit, owner, neighbors)
+        if ranked is not None:
+            return ranked
+    entries = await get_leaderboard(db, scope, team_id, days, limit)
+    return {"entries": entries, "my_rank": await get_rank(db, owner, scope, team_id, days), "around_me": []}
 
-        second_period = await db.execute(
-            select(
-                PromptRun.owner,
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.team_id == team_id,
-                PromptRun.created_at >= start_date
-            ).group_by(PromptRun.owner)
-        )
-    else:
-        first_period = await db.execute(
-            select(
-                PromptRun.owner,
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.created_at >= mid_point,
-                PromptRun.created_at < start_date
-            ).group_by(PromptRun.owner)
-        )
+def _encode_cursor(key: Tuple[float, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
 
-        second_period = await db.execute(
-            select(
-                PromptRun.owner,
-                func.avg(PromptRun.energy_joules)
-            ).where(
-                PromptRun.created_at >= start_date
-            ).group_by(PromptRun.owner)
-        )
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        sort_key, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(sort_key), str(user_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
 
-    first_avg = {row[0]: row[1] for row in first_period.all()}
-    second_avg = {row[0]: row[1] for row in second_period.all()}
+async def _improvement_sums(
+    db: AsyncSession,
+    scope: str,
+    team_id: Optional[str],
+    days: int
+) -> List[Tuple[str, float, int, float, int]]:
+    # Whole UTC days: the current window ends today, the previous one is the
+    # `days` before it. Both come from one pass over the daily rollup.
+    current_start = day_bucket(datetime.utcnow()) - timedelta(days=days - 1)
+    previous_start = current_start - timedelta(days=days)
+    current = PromptRunDaily.bucket >= current_start
+    query = select(
+        PromptRunDaily.owner,
+        func.sum(case((current, 0.0), else_=PromptRunDaily.energy_joules)),
+        func.sum(case((current, 0), else_=PromptRunDaily.prompt_count)),
+        func.sum(case((current, PromptRunDaily.energy_joules), else_=0.0)),
+        func.sum(case((current, PromptRunDaily.prompt_count), else_=0))
+    ).where(PromptRunDaily.bucket >= previous_start).group_by(PromptRunDaily.owner)
+    if scope == "team":
+        query = query.where(PromptRunDaily.team_id == team_id)
+    elif scope == "organization":
+        # Driven from the org's teams so each one is a (team_id, bucket)
+        # range on ix_prompt_runs_daily_team.
+        query = query.join(Team, PromptRunDaily.team_id == Team.id).where(Team.organization_id == team_id)
+    result = await db.execute(query)
+    return result.all()
 
+async def _improvement_ranking(
+    db: AsyncSession,
+    scope: str,
+    team_id: Optional[str],
+    days: int
+) -> List[Tuple[Tuple[float, str], float, float]]:
     improvements = []
-    for user_id in set(first_avg.keys()) & set(second_avg.keys()):
-        if first_avg[user_id] and second_avg[user_id]:
-            pct_improvement = ((first_avg[user_id] - second_avg[user_id]) / first_avg[user_id]) * 100
-            if pct_improvement > 0:
-                improvements.append({
-                    "user_id": user_id,
-                    "improvement_percent": round(pct_improvement, 2),
-                    "previous_avg_energy": round(first_avg[user_id], 2),
-                    "current_avg_energy": round(second_avg[user_id], 2)
-                })
-
-    improvements.sort(key=lambda x: x["improvement_percent"], reverse=True)
-    return improvements[:10]
+    for user_id, previous_energy, previous_count, current_energy, current_count in await _improvement_sums(
+        db, scope, team_id, days
+    ):
+        if not previous_count or not current_count or not previous_energy:
+            continue
+        previous_avg = previous_energy / previous_count
+        current_avg = current_energy / current_count
+        pct_improvement = (previous_avg - current_avg) / previous_avg * 100
+        if pct_improvement > 0:
+            improvements.append(((-pct_improvement, user_id), previous_avg, current_avg))
+    improvements.sort(key=lambda item: item[0])
+    return improvements
+
+async def get_most_improved(
+    db: AsyncSession,
+    scope: str = "team",
+    team_id: Optional[str] = None,
+    days: int = 30,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    cache: Optional[SnapshotCache] = None
+) -> Dict[str, Any]:
+    after = _decode_cursor(cursor) if cursor else None
+    if scope != "global" and not team_id:
+        return {"entries": [], "next_cursor": None}
+
+    # The whole ranking is computed once and cached, so following pages
+    # are slices of it rather than a fresh aggregation of the scope. The
+    # day is part of the key because the windows move at midnight UTC.
+    key = (f"most-improved:{scope}:{team_id or ''}", (days, day_bucket(datetime.utcnow())))
+    ranking = cache.get(key) if cache is not None else None
+    if ranking is None:
+        generation = cache.generation(key[0]) if cache is not None else 0
+        ranking = await _improvement_ranking(db, scope, team_id, days)
+        if cache is not None:
+            cache.put(key, ranking, generation)
+
+    # Keyset pagination: the cursor is the sort key of the last entry
+    # served, so a page stays consistent if the ranking was recomputed.
+    start = bisect_right(ranking, after, key=lambda item: item[0]) if after is not None else 0
+    page = ranking[start:start + limit + 1]
+
+    entries = []
+    for i, ((sort_key, user_id), previous_avg, current_avg) in enumerate(page[:limit]):
+        entries.append({
+            "rank": start + i + 1,
+            "user_id": user_id,
+            "improvement_percent": round(-sort_key, 2),
+            "previous_avg_energy": round(previous_avg, 2),
+            "current_avg_energy": round(current_avg, 2)
+        })
+    next_cursor = _encode_cursor(page[limit - 1][0]) if len(page) > limit else None
+    return {"entries": entries, "next_cursor": next_cursor}
 
 async def calculate_savings_comparison(
     db: AsyncSession,
@@ -175,18 +252,18 @@ async def calculate_savings_comparison(
 ) -> Dict:
     start_date = datetime.utcnow() - timedelta(days=days)
 
+    runs = window_source(start_date, owner=user_id)
     result = await db.execute(
         select(
-            func.avg(PromptRun.energy_joules),
-            func.count(PromptRun.id)
-        ).where(
-            PromptRun.owner == user_id,
-            PromptRun.created_at >= start_date
+            func.sum(runs.c.energy_joules),
+            func.sum(runs.c.prompt_count)
         )
     )
     row = result.one()
-    avg_energy = row[0] or 0
-    prompt_count = row[1] or 0
+    return savings_from_totals(row[1] or 0, row[0] or 0)
+
+def savings_from_totals(prompt_count: int, total_energy: float) -> Dict:
+    avg_energy = total_energy / prompt_count if prompt_count else 0
 
     baseline_energy_per_prompt = 150.0
     total_baseline_energy = prompt_count * baseline_energy_per_prompt
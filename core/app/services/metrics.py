@@ -0,0 +1,407 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE"))
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+logger = logging.getLogger(__name__)
+
+Series = Dict[Tuple[str, ...], List[float]]
+
+RETIRED_FILE = "retired.json"
+LOCK_FILE = ".lock"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> per-bucket counts (last one is +Inf), then the sum.
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Series:
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def drain(self) -> Series:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Series) -> None:
+        with self._lock:
+            for labels, values in series.items():
+                current = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    current[i] += value
+
+    def collect(self, prefix: str, series: Optional[Series] = None) -> Iterator[str]:
+        name = f"{prefix}_{self.name}"
+        yield f"# HELP {name} {self.documentation}"
+        yield f"# TYPE {name} histogram"
+        if series is None:
+            series = self.snapshot()
+        for labels, values in sorted(series.items()):
+            count = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), values):
+                count += hits
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {count}"
+            yield f"{name}_sum{_labels(self.labels, labels)} {values[-1]!r}"
+            yield f"{name}_count{_labels(self.labels, labels)} {count}"
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "greenprompt"):
+        self.prefix = prefix
+        self._histograms: List[Histogram] = []
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (), **kwargs: Any) -> Histogram:
+        histogram = Histogram(name, documentation, labels, **kwargs)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_stats(self, component: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        # Numeric fields of a component's stats() dict are exported as
+        # gauges named <prefix>_<component>_<field>.
+        self._stats[component] = stats
+
+    def _gauges(self, name: str, stats: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        for key, value in stats.items():
+            field = f"{name}_{_NAME_RE.sub('_', str(key))}"
+            if isinstance(value, dict):
+                yield from self._gauges(field, value)
+            elif isinstance(value, (bool, int, float)):
+                yield field, int(value) if isinstance(value, bool) else value
+
+    def gauges(self) -> List[Tuple[str, Any]]:
+        return [
+            gauge
+            for component, stats in self._stats.items()
+            for gauge in self._gauges(f"{self.prefix}_{component}", stats())
+        ]
+
+    def render(
+        self,
+        series: Optional[Dict[str, Series]] = None,
+        gauges: Optional[Iterable[Tuple[str, Tuple[str, ...], Any]]] = None
+    ) -> str:
+        # Renders this process's numbers, or the given histogram series and
+        # (name, worker label, value) gauges merged from several workers.
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.collect(self.prefix, None if series is None else series.get(histogram.name, {})))
+        if gauges is None:
+            gauges = [(name, (), value) for name, value in self.gauges()]
+        typed = set()
+        for name, worker, value in gauges:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels(('worker',) if worker else (), worker)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class SharedMetrics:
+    # Each worker writes its histograms and gauges to <directory>/<pid>-<start>.json
+    # every flush interval, and /metrics on any worker merges the files, so
+    # one scrape covers every worker. Histograms are summed, including those
+    # of workers that have exited; gauges get a worker label and are only
+    # kept while their worker is still writing.
+    def __init__(self, registry: MetricsRegistry, directory: str = "", flush_interval: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.worker = str(os.getpid())
+        self._path = ""
+        self._task: Optional[asyncio.Task] = None
+        self.write_errors = 0
+        self.compacted = 0
+
+    def write(self) -> None:
+        state = {
+            "worker": self.worker,
+            "written": time.time(),
+            "histograms": {
+                histogram.name: [[list(labels), values] for labels, values in histogram.snapshot().items()]
+                for histogram in self.registry._histograms
+            },
+            "gauges": self.registry.gauges()
+        }
+        temporary = f"{self._path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temporary, self._path)
+
+    @staticmethod
+    def _load(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(series: Dict[str, Series], histograms: Dict[str, Any]) -> None:
+        for name, entries in histograms.items():
+            merged = series.setdefault(name, {})
+            for labels, values in entries:
+                current = merged.setdefault(tuple(labels), [0] * len(values))
+                for i, value in enumerate(values):
+                    current[i] += value
+
+    def _worker_files(self) -> List[str]:
+        return sorted(
+            path for path in glob.glob(os.path.join(self.directory, "*.json"))
+            if os.path.basename(path) != RETIRED_FILE
+        )
+
+    def compact(self, lock_file) -> None:
+        # Folds the histograms of workers that have exited into one retired
+        # file and deletes theirs, so restarts don't grow the directory or
+        # the cost of a scrape. A file only counts as exited once it is
+        # past the stale threshold and its pid is gone.
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            stale = time.time() - 3 * self.flush_interval
+            exited = []
+            for path in self._worker_files():
+                pid = os.path.basename(path).split("-", 1)[0]
+                if path != self._path and pid.isdigit() and not _running(int(pid)):
+                    state = self._load(path)
+                    if state is None or state["written"] < stale:
+                        exited.append((path, state))
+            if not exited:
+                return
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            series: Dict[str, Series] = {}
+            self._merge(series, (self._load(retired_path) or {}).get("histograms", {}))
+            for _, state in exited:
+                if state is not None:
+                    self._merge(series, state["histograms"])
+            temporary = f"{retired_path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump({"histograms": {
+                    name: [[list(labels), values] for labels, values in merged.items()]
+                    for name, merged in series.items()
+                }}, f)
+            os.replace(temporary, retired_path)
+            for path, _ in exited:
+                os.remove(path)
+            self.compacted += len(exited)
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def read(self) -> str:
+        series: Dict[str, Series] = {}
+        gauges = []
+        stale = time.time() - 3 * self.flush_interval
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                self.compact(lock_file)
+                # Shared with other scrapes; keeps a compaction from running
+                # between reading a worker's file and reading the retired one.
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH)
+            retired = self._load(os.path.join(self.directory, RETIRED_FILE))
+            if retired is not None:
+                self._merge(series, retired["histograms"])
+            for path in self._worker_files():
+                state = self._load(path)
+                if state is None:
+                    continue
+                self._merge(series, state["histograms"])
+                if state["written"] >= stale:
+                    gauges.extend((name, (state["worker"],), value) for name, value in state["gauges"])
+        gauges.sort(key=lambda gauge: gauge[0])
+        return self.registry.render(series, gauges)
+
+    async def render(self) -> str:
+        if not self.directory:
+            return self.registry.render()
+        await self.flush()
+        return await asyncio.to_thread(self.read)
+
+    async def flush(self) -> None:
+        try:
+            await asyncio.to_thread(self.write)
+        except OSError as e:
+            self.write_errors += 1
+            logger.warning(f"Failed to write metrics to {self.directory}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # A restarted worker may reuse a pid; the start time keeps its file
+        # from overwriting the counts of the one before.
+        self.worker = str(os.getpid())
+        self._path = os.path.join(self.directory, f"{self.worker}-{int(time.time() * 1000)}.json")
+        await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shared": bool(self.directory),
+            "worker": self.worker,
+            "write_errors": self.write_errors,
+            "compacted_files": self.compacted
+        }
+
+http_requests = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status.",
+    ("method", "route", "status")
+)
+db_queries = metrics.histogram("db_query_seconds", "Database statement time by operation.", ("operation",))
+db_commits = metrics.histogram("db_commit_seconds", "Session flush and commit time.")
+pipeline_stages = metrics.histogram(
+    "pipeline_stage_seconds", "Energy pipeline time by stage: tokenize, detect, estimate, optimize.", ("stage",)
+)
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Routes from an included router may carry only their own path, without
+    # the include prefix; recover the prefix from the request path.
+    template = getattr(route, "path_format", None) or route.path
+    try:
+        suffix = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    return path[:len(path) - len(suffix)] + template if path.endswith(suffix) else template
+
+class MetricsMiddleware:
+    # Plain ASGI so streamed responses are timed to their last chunk and
+    # the overhead stays at a couple of clock reads per request.
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests.observe(time.perf_counter() - started, scope["method"], route_template(scope), str(status))
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info["query_started"].pop()
+    operation = statement.lstrip()[:6].upper()
+    db_queries.observe(time.perf_counter() - started, operation if operation in QUERY_OPERATIONS else "OTHER")
+
+def _execute_failed(context) -> None:
+    pending = context.connection.info.get("query_started") if context.connection is not None else None
+    if pending:
+        pending.pop()
+
+def _before_commit(session: Session) -> None:
+    session.info["commit_started"] = time.perf_counter()
+
+def _after_commit(session: Session) -> None:
+    started: Optional[float] = session.info.pop("commit_started", None)
+    if started is not None:
+        db_commits.observe(time.perf_counter() - started)
+
+def pool_stats(engine: AsyncEngine) -> Callable[[], Dict[str, Any]]:
+    pool = engine.pool
+
+    def stats() -> Dict[str, Any]:
+        # Pools without a fixed size (NullPool, StaticPool) only report what
+        # they have.
+        return {
+            name: getattr(pool, name)()
+            for name in ("size", "checkedin", "checkedout", "overflow")
+            if hasattr(pool, name)
+        }
+    return stats
+
+def instrument_database(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_execute)
+    event.listen(sync_engine, "handle_error", _execute_failed)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _after_commit)
+    metrics.register_stats("db_pool", pool_stats(engine))
@@ -0,0 +1,317 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.services.energy import CONSTRAINT_KEYWORDS, PromptFeatures, estimate_tokens, extract_features
+from app.services.registry import registry
+
+@dataclass
+class OptimizationSuggestion:
+    type: str
+    original_text: str
+    suggested_text: str
+    energy_savings_joules: float
+    energy_savings_percent: float
+    confidence: float
+    reason: str
+
+@dataclass(frozen=True)
+class Savings:
+    removed_tokens: float = 0.0
+    prompt_tokens: float = 0.0
+    output_tokens: float = 0.0
+    joules: float = 0.0
+
+    def estimate(self, removed: int, features: PromptFeatures, joules_per_token: float) -> float:
+        tokens = (
+            self.removed_tokens * removed
+            + self.prompt_tokens * features.token_count
+            + self.output_tokens * features.output_tokens()
+        )
+        return tokens * joules_per_token + self.joules
+
+@dataclass(frozen=True)
+class PhraseRule:
+    type: str
+    phrases: Tuple[str, ...]
+    reason: str
+    confidence: float
+    savings: Savings
+    replacement: Optional[str] = None
+    suggested_text: Optional[str] = None
+    savings_percent: Optional[float] = None
+    at_start: bool = False
+
+@dataclass(frozen=True)
+class DocumentRule:
+    type: str
+    original_text: str
+    suggested_text: str
+    reason: str
+    confidence: float
+    savings: Savings
+    savings_percent: Optional[float] = None
+    absent: Tuple[str, ...] = ()
+    min_chars: int = 0
+    min_tokens: int = 0
+
+    def applies(self, prompt: str, features: PromptFeatures) -> bool:
+        if self.absent and features.has(*self.absent):
+            return False
+        return len(prompt) >= self.min_chars and features.token_count >= self.min_tokens
+
+@dataclass(frozen=True)
+class RuleSet:
+    version: str
+    phrase_rules: Tuple[PhraseRule, ...]
+    document_rules: Tuple[DocumentRule, ...]
+    joules_per_token: Optional[float] = None
+
+_TRAILING_RE = re.compile(r'[.,:;!]?\s*')
+
+def _match_case(original: str, replacement: str) -> str:
+    if replacement and original[:1].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+def _phrase_trie(phrases: List[str]) -> str:
+    trie: Dict[str, dict] = {}
+    for i, phrase in enumerate(phrases):
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = i
+
+    # An empty named group marks the end of each phrase. Markers sort last
+    # so the longest phrase wins and shorter ones are reached by backtracking.
+    def emit(node: dict) -> str:
+        branches = [
+            f"(?P<p{child}>)" if ch == "" else re.escape(ch) + emit(child)
+            for ch, child in sorted(node.items(), key=lambda item: item[0] == "")
+        ]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return emit(trie)
+
+class CompiledRuleSet:
+    def __init__(self, rule_set: RuleSet):
+        self.version = rule_set.version
+        self.rule_set = rule_set
+        self._phrases: List[Tuple[PhraseRule, str]] = []
+        seen = set()
+        for rule in rule_set.phrase_rules:
+            for phrase in rule.phrases:
+                phrase = phrase.lower()
+                if phrase in seen:
+                    raise ValueError(f"Phrase '{phrase}' is claimed by more than one rule in {rule_set.version}")
+                if not (phrase[:1].isalnum() and phrase[-1:].isalnum()):
+                    raise ValueError(f"Phrase '{phrase}' must start and end with a word character")
+                seen.add(phrase)
+                self._phrases.append((rule, phrase))
+        self._matcher = re.compile(r"\b" + _phrase_trie([phrase for _, phrase in self._phrases]) + r"\b")
+
+    def _joules_per_token(self, model: Optional[str]) -> float:
+        if self.rule_set.joules_per_token is not None:
+            return self.rule_set.joules_per_token
+        snapshot = registry.snapshot
+        record = snapshot.resolve(model) if model else None
+        return (record or snapshot.default_model).joules_per_token
+
+    def optimize(
+        self,
+        prompt: str,
+        features: PromptFeatures,
+        model: Optional[str] = None
+    ) -> Tuple[str, List[OptimizationSuggestion]]:
+        lowered = prompt.lower()
+        if len(lowered) != len(prompt):
+            lowered = "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in prompt)
+        leading = len(prompt) - len(prompt.lstrip())
+
+        pieces = []
+        last = 0
+        first_hit: Dict[PhraseRule, str] = {}
+        removed: Dict[PhraseRule, int] = {}
+        for match in self._matcher.finditer(lowered):
+            rule, _ = self._phrases[int(match.lastgroup[1:])]
+            start, end = match.span()
+            if start < last or (rule.at_start and start != leading):
+                continue
+            text = prompt[start:end]
+            first_hit.setdefault(rule, text)
+            if rule.replacement is None:
+                continue
+            replacement = _match_case(text, rule.replacement)
+            if not replacement:
+                end = _TRAILING_RE.match(prompt, end).end()
+            pieces.append(prompt[last:start])
+            pieces.append(replacement)
+            last = end
+            removed[rule] = removed.get(rule, 0) + max(
+                0, estimate_tokens(prompt[start:end], model) - estimate_tokens(replacement, model)
+            )
+        pieces.append(prompt[last:])
+        optimized = "".join(pieces)
+
+        joules_per_token = self._joules_per_token(model)
+        baseline = (features.token_count + features.output_tokens()) * joules_per_token
+
+        def suggestion(rule, original_text, suggested_text, removed_tokens):
+            savings = rule.savings.estimate(removed_tokens, features, joules_per_token)
+            percent = rule.savings_percent
+            if percent is None:
+                percent = round(savings / baseline * 100, 2) if baseline else 0.0
+            return OptimizationSuggestion(
+                type=rule.type,
+                original_text=original_text,
+                suggested_text=suggested_text,
+                energy_savings_joules=round(savings, 4),
+                energy_savings_percent=percent,
+                confidence=rule.confidence,
+                reason=rule.reason.format(original=original_text, suggested=suggested_text)
+            )
+
+        suggestions = []
+        for rule in self.rule_set.phrase_rules:
+            if rule in first_hit:
+                suggested = rule.suggested_text or rule.replacement or "[removed]"
+                suggestions.append(suggestion(rule, first_hit[rule], suggested, removed.get(rule, 0)))
+        for rule in self.rule_set.document_rules:
+            if rule.applies(prompt, features):
+                suggestions.append(suggestion(rule, rule.original_text, rule.suggested_text, 0))
+
+        return optimized.strip(), suggestions
+
+CONCISE_REWRITES = {
+    "analyze in detail": "analyze",
+    "explain thoroughly": "explain",
+    "comprehensive analysis": "analysis",
+    "elaborate on": "explain",
+    "describe in depth": "describe",
+    "provide extensive details": "provide key details",
+    "reason through": "consider",
+}
+
+FILLER_REWRITES = {
+    "in order to": "to",
+    "due to the fact that": "because",
+    "at this point in time": "now",
+    "it is important to note that": "",
+    "i would like you to": "",
+}
+
+KEYWORD_REASON = "'{original}' consumes high energy. '{suggested}' achieves similar result with lower overhead."
+POLITENESS_REASON = "Politeness phrases increase token count without affecting output quality."
+VAGUENESS_REASON = "Vague directives waste tokens. Specify exact areas of focus instead."
+REASONING_REASON = "Chain-of-thought significantly increases output. Use only when necessary."
+CONSTRAINT_REASON = "Adding output constraints helps models produce focused, efficient responses."
+CONCISE_REASON = "Concise prompts with clear requirements outperform verbose ones."
+
+RULES_V1 = RuleSet(
+    version="v1",
+    joules_per_token=0.5,
+    phrase_rules=tuple(
+        PhraseRule(
+            type="keyword_replacement", phrases=(phrase,), replacement=concise,
+            reason=KEYWORD_REASON, confidence=0.85, savings=Savings(removed_tokens=1.0), savings_percent=15.0
+        )
+        for phrase, concise in CONCISE_REWRITES.items()
+    ) + (
+        PhraseRule(
+            type="remove_politeness", phrases=("please",), replacement="", at_start=True,
+            reason=POLITENESS_REASON, confidence=0.95, savings=Savings(removed_tokens=1.0), savings_percent=5.0
+        ),
+        PhraseRule(
+            type="remove_vagueness", phrases=("in detail", "in depth"), suggested_text="[specify focus areas]",
+            reason=VAGUENESS_REASON, confidence=0.80, savings=Savings(joules=15.0), savings_percent=10.0
+        ),
+        PhraseRule(
+            type="remove_reasoning", phrases=("think step by step", "explain your reasoning"),
+            suggested_text="[removed for efficiency]", reason=REASONING_REASON, confidence=0.70,
+            savings=Savings(joules=25.0), savings_percent=12.0
+        ),
+    ),
+    document_rules=(
+        DocumentRule(
+            type="add_constraint", original_text="[no constraints]", suggested_text="Add output format or token limit",
+            reason=CONSTRAINT_REASON, confidence=0.75, savings=Savings(joules=10.0), savings_percent=8.0,
+            absent=tuple(CONSTRAINT_KEYWORDS)
+        ),
+        DocumentRule(
+            type="concise_instruction", original_text="[long prompt]", suggested_text="Summarize key requirements",
+            reason=CONCISE_REASON, confidence=0.65, savings=Savings(prompt_tokens=0.2), savings_percent=10.0,
+            min_chars=501, min_tokens=101
+        ),
+    )
+)
+
+RULES_V2 = RuleSet(
+    version="v2",
+    phrase_rules=tuple(
+        PhraseRule(
+            type="keyword_replacement", phrases=(phrase,), replacement=concise,
+            reason=KEYWORD_REASON, confidence=0.85, savings=Savings(removed_tokens=1.0, output_tokens=0.15)
+        )
+        for phrase, concise in CONCISE_REWRITES.items()
+    ) + tuple(
+        PhraseRule(
+            type="remove_filler", phrases=(phrase,), replacement=concise,
+            reason="Filler phrases add tokens without changing the instruction.", confidence=0.90,
+            savings=Savings(removed_tokens=1.0)
+        )
+        for phrase, concise in FILLER_REWRITES.items()
+    ) + (
+        PhraseRule(
+            type="remove_politeness", phrases=("please", "kindly", "could you", "could you please"),
+            replacement="", at_start=True, reason=POLITENESS_REASON, confidence=0.95,
+            savings=Savings(removed_tokens=1.0)
+        ),
+        PhraseRule(
+            type="remove_vagueness", phrases=("in detail", "in depth", "in great detail", "in great depth"),
+            suggested_text="[specify focus areas]", reason=VAGUENESS_REASON, confidence=0.80,
+            savings=Savings(output_tokens=0.3)
+        ),
+        PhraseRule(
+            type="remove_reasoning",
+            phrases=(
+                "think step by step", "let's think step by step", "let us think step by step",
+                "explain your reasoning"
+            ),
+            replacement="", suggested_text="[removed for efficiency]", reason=REASONING_REASON,
+            confidence=0.70, savings=Savings(removed_tokens=1.0, output_tokens=0.4)
+        ),
+    ),
+    document_rules=(
+        DocumentRule(
+            type="add_constraint", original_text="[no constraints]", suggested_text="Add output format or token limit",
+            reason=CONSTRAINT_REASON, confidence=0.75, savings=Savings(output_tokens=0.25),
+            absent=tuple(CONSTRAINT_KEYWORDS)
+        ),
+        DocumentRule(
+            type="concise_instruction", original_text="[long prompt]", suggested_text="Summarize key requirements",
+            reason=CONCISE_REASON, confidence=0.65, savings=Savings(prompt_tokens=0.2),
+            min_chars=501, min_tokens=101
+        ),
+    )
+)
+
+RULE_SETS: Dict[str, CompiledRuleSet] = {
+    rule_set.version: CompiledRuleSet(rule_set) for rule_set in (RULES_V1, RULES_V2)
+}
+DEFAULT_RULE_SET = "v2"
+
+def get_rule_set(version: Optional[str] = None) -> CompiledRuleSet:
+    version = version or DEFAULT_RULE_SET
+    if version not in RULE_SETS:
+        raise ValueError(f"Unknown rule set '{version}'. Available: {', '.join(RULE_SETS)}")
+    return RULE_SETS[version]
+
+def optimize_prompt(
+    prompt: str,
+    features: Optional[PromptFeatures] = None,
+    rule_set: Optional[str] = None,
+    model: Optional[str] = None
+) -> Tuple[str, List[OptimizationSuggestion]]:
+    compiled = get_rule_set(rule_set)
+    features = features or extract_features(prompt, model)
+    return compiled.optimize(prompt, features, model)
@@ -0,0 +1,279 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+from sortedcontainers import SortedList
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PromptRunDaily
+
+logger = logging.getLogger(__name__)
+
+# Per-owner totals: energy_joules, carbon_kg, prompt_count.
+Totals = List[float]
+
+def index_scope(scope: str, team_id: Optional[str]) -> Optional[str]:
+    if scope == "global":
+        return "global"
+    if scope == "team" and team_id:
+        return f"team:{team_id}"
+    return None
+
+def _row_scopes(row: Dict[str, Any]) -> Tuple[str, ...]:
+    team_id = row.get("team_id")
+    return ("global", f"team:{team_id}") if team_id else ("global",)
+
+def _entry(rank: int, owner: str, totals: Totals) -> Dict[str, Any]:
+    energy, carbon, count = totals
+    return {
+        "rank": rank,
+        "user_id": owner,
+        "total_energy_joules": energy,
+        "total_carbon_kg": carbon,
+        "prompt_count": int(count),
+        "avg_energy_per_prompt": energy / count if count else 0
+    }
+
+def aggregate_contributions(rows: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, date], Dict[str, Totals]]:
+    contributions: Dict[Tuple[str, date], Dict[str, Totals]] = {}
+    for row in rows:
+        day = row["created_at"].date()
+        for scope in _row_scopes(row):
+            totals = contributions.setdefault((scope, day), {}).setdefault(row["owner"], [0.0, 0.0, 0])
+            totals[0] += row.get("energy_joules") or 0.0
+            totals[1] += row.get("carbon_kg") or 0.0
+            totals[2] += row.get("prompt_count", 1)
+    return contributions
+
+async def _rollup_rows(db: AsyncSession, days: int) -> List[Dict[str, Any]]:
+    start = datetime.combine(datetime.utcnow().date() - timedelta(days=days - 1), datetime.min.time())
+    result = await db.execute(
+        select(
+            PromptRunDaily.owner,
+            PromptRunDaily.team_id,
+            PromptRunDaily.bucket,
+            func.sum(PromptRunDaily.energy_joules),
+            func.sum(PromptRunDaily.carbon_kg),
+            func.sum(PromptRunDaily.prompt_count)
+        ).where(PromptRunDaily.bucket >= start).group_by(
+            PromptRunDaily.owner, PromptRunDaily.team_id, PromptRunDaily.bucket
+        )
+    )
+    return [
+        {"owner": owner, "team_id": team_id, "created_at": bucket,
+         "energy_joules": energy, "carbon_kg": carbon, "prompt_count": count}
+        for owner, team_id, bucket, energy, carbon, count in result.all()
+    ]
+
+class _Board:
+    def __init__(self):
+        self.totals: Dict[str, Totals] = {}
+        self.order = SortedList()
+
+    def add(self, owner: str, delta: Totals, sign: int = 1) -> None:
+        totals = self.totals.get(owner)
+        if totals is None:
+            totals = self.totals[owner] = [0.0, 0.0, 0]
+        else:
+            self.order.remove((totals[0], owner))
+        for i, value in enumerate(delta):
+            totals[i] += sign * value
+        if totals[2] <= 0:
+            del self.totals[owner]
+        else:
+            self.order.add((totals[0], owner))
+
+    def rank(self, owner: str) -> Optional[int]:
+        totals = self.totals.get(owner)
+        return None if totals is None else self.order.bisect_left((totals[0], owner)) + 1
+
+    def entries(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        return [
+            _entry(start + i + 1, owner, self.totals[owner])
+            for i, (_, owner) in enumerate(self.order[start:stop])
+        ]
+
+class MemoryLeaderboard:
+    backend = "memory"
+
+    def __init__(self, windows: Iterable[int]):
+        self.windows = tuple(sorted(set(windows)))
+        self._days: Dict[Tuple[str, date], Dict[str, Totals]] = {}
+        self._boards: Dict[Tuple[str, int], _Board] = {}
+        self._today: Optional[date] = None
+
+    def _advance(self, today: date) -> None:
+        if self._today is None or today <= self._today:
+            self._today = max(today, self._today or today)
+            return
+        elapsed = (today - self._today).days
+        for (scope, window), board in list(self._boards.items()):
+            if elapsed >= window:
+                del self._boards[(scope, window)]
+                continue
+            # Days in (old_today - window, today - window] drop out of the window.
+            for offset in range(elapsed):
+                expired = self._today - timedelta(days=window - 1 - offset)
+                for owner, totals in self._days.get((scope, expired), {}).items():
+                    board.add(owner, totals, sign=-1)
+            if not board.totals:
+                del self._boards[(scope, window)]
+        cutoff = today - timedelta(days=self.windows[-1])
+        for key in [key for key in self._days if key[1] <= cutoff]:
+            del self._days[key]
+        self._today = today
+
+    async def add(self, rows: List[Dict[str, Any]]) -> None:
+        if not self.windows:
+            return
+        contributions = aggregate_contributions(rows)
+        latest = max((day for _, day in contributions), default=None)
+        self._advance(max(datetime.utcnow().date(), latest) if latest else datetime.utcnow().date())
+        for (scope, day), owners in contributions.items():
+            age = (self._today - day).days
+            if age >= self.windows[-1]:
+                continue
+            bucket = self._days.setdefault((scope, day), {})
+            for owner, delta in owners.items():
+                totals = bucket.setdefault(owner, [0.0, 0.0, 0])
+                for i, value in enumerate(delta):
+                    totals[i] += value
+            for window in self.windows:
+                if age < window:
+                    board = self._boards.setdefault((scope, window), _Board())
+                    for owner, delta in owners.items():
+                        board.add(owner, delta)
+
+    async def query(
+        self,
+        scope: str,
+        window: int,
+        limit: int,
+        owner: Optional[str] = None,
+        neighbors: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        self._advance(datetime.utcnow().date())
+        board = self._boards.get((scope, window))
+        if board is None:
+            return {"entries": [], "my_rank": None, "around_me": []}
+        rank = board.rank(owner) if owner else None
+        around = board.entries(max(0, rank - 1 - neighbors), rank + neighbors) if rank and neighbors else []
+        return {"entries": board.entries(0, limit), "my_rank": rank, "around_me": around}
+
+    async def warm(self, db: AsyncSession) -> None:
+        if self.windows:
+            self._days.clear()
+            self._boards.clear()
+            await self.add(await _rollup_rows(db, self.windows[-1]))
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "windows": list(self.windows), "boards": len(self._boards)}
+
+class RedisLeaderboard:
+    backend = "redis"
+    FIELDS = ("energy", "carbon", "count")
+
+    def __init__(self, url: str, windows: Iterable[int], refresh_seconds: float = 5.0, prefix: str = "greenprompt:lb"):
+        self.windows = tuple(sorted(set(windows)))
+        self.refresh_seconds = refresh_seconds
+        self.prefix = prefix
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+        self.errors = 0
+
+    def _day_key(self, scope: str, day: date, field: str) -> str:
+        return f"{self.prefix}:{scope}:d{day:%Y%m%d}:{field}"
+
+    def _window_key(self, scope: str, window: int, today: date, field: str) -> str:
+        return f"{self.prefix}:{scope}:w{window}:{today:%Y%m%d}:{field}"
+
+    async def add(self, rows: List[Dict[str, Any]]) -> None:
+        if not self.windows:
+            return
+        today = datetime.utcnow().date()
+        pipe = self._redis.pipeline(transaction=False)
+        for (scope, day), owners in aggregate_contributions(rows).items():
+            if (today - day).days >= self.windows[-1]:
+                continue
+            # Day buckets expire by themselves once no window can reach them.
+            expire_at = datetime.combine(day + timedelta(days=self.windows[-1] + 1), datetime.min.time())
+            for i, field in enumerate(self.FIELDS):
+                key = self._day_key(scope, day, field)
+                for owner, totals in owners.items():
+                    pipe.zincrby(key, totals[i], owner)
+                pipe.expireat(key, expire_at)
+        try:
+            await pipe.execute()
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Leaderboard update failed: {e}")
+
+    async def _materialize(self, scope: str, window: int) -> Dict[str, str]:
+        today = datetime.utcnow().date()
+        keys = {field: self._window_key(scope, window, today, field) for field in self.FIELDS}
+        if not await self._redis.exists(keys["energy"]):
+            days = [today - timedelta(days=offset) for offset in range(window)]
+            pipe = self._redis.pipeline(transaction=True)
+            for field in self.FIELDS:
+                pipe.zunionstore(keys[field], [self._day_key(scope, day, field) for day in days])
+                pipe.expire(keys[field], max(1, int(self.refresh_seconds)))
+            await pipe.execute()
+        return keys
+
+    async def _entries(self, keys: Dict[str, str], start: int, stop: int) -> List[Dict[str, Any]]:
+        if stop <= start:
+            return []
+        ranked = await self._redis.zrange(keys["energy"], start, stop - 1, withscores=True)
+        if not ranked:
+            return []
+        owners = [owner for owner, _ in ranked]
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zmscore(keys["carbon"], owners)
+        pipe.zmscore(keys["count"], owners)
+        carbon, count = await pipe.execute()
+        return [
+            _entry(start + i + 1, owner, [energy, carbon[i] or 0.0, count[i] or 0])
+            for i, (owner, energy) in enumerate(ranked)
+        ]
+
+    async def query(
+        self,
+        scope: str,
+        window: int,
+        limit: int,
+        owner: Optional[str] = None,
+        neighbors: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            keys = await self._materialize(scope, window)
+            entries = await self._entries(keys, 0, limit)
+            rank = await self._redis.zrank(keys["energy"], owner) if owner else None
+            rank = None if rank is None else rank + 1
+            around = await self._entries(keys, max(0, rank - 1 - neighbors), rank + neighbors) if rank and neighbors else []
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Leaderboard query failed, falling back to SQL: {e}")
+            return None
+        return {"entries": entries, "my_rank": rank, "around_me": around}
+
+    async def warm(self, db: AsyncSession) -> None:
+        if not self.windows:
+            return
+        try:
+            if await self._redis.set(f"{self.prefix}:loaded", 1, nx=True):
+                await self.add(await _rollup_rows(db, self.windows[-1]))
+                logger.info("Loaded leaderboard day buckets from rollups")
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Leaderboard warm-up skipped: {e}")
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "windows": list(self.windows), "errors": self.errors}
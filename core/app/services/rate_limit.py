@@ -0,0 +1,116 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# GCRA: each client has a theoretical arrival time (TAT). A request is let
+# through when, after adding one emission interval (period / limit), the TAT
+# is at most one period ahead of now. That allows bursts of `limit` requests
+# and then a steady `limit` per period, with O(1) state per client.
+
+class MemoryRateLimiter:
+    backend = "memory"
+
+    def __init__(self, max_clients: int = 100_000, period_seconds: float = 60.0):
+        self.max_clients = max_clients
+        self.period_seconds = period_seconds
+        self._arrivals: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    async def check(self, client_id: str, limit: int) -> float:
+        # Returns 0 when the request is allowed, else the seconds to wait.
+        interval = self.period_seconds / limit
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._arrivals.get(client_id, now), now) + interval
+            wait = tat - now - self.period_seconds
+            if wait > 0:
+                self.limited += 1
+                return wait
+            self._arrivals[client_id] = tat
+            self._arrivals.move_to_end(client_id)
+            # Least recently seen clients go first; once their TAT has
+            # passed, dropping them loses nothing.
+            while len(self._arrivals) > self.max_clients:
+                self._arrivals.popitem(last=False)
+        return 0.0
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "clients": len(self._arrivals), "limited": self.limited}
+
+# Times are in microseconds from the Redis clock so every worker agrees on
+# "now". Keys expire when their TAT passes, so idle clients cost nothing.
+# The TAT is formatted explicitly; Lua would otherwise round it to 14 digits.
+GCRA_SCRIPT = """
+local now = redis.call('TIME')
+local now_us = tonumber(now[1]) * 1000000 + tonumber(now[2])
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now_us)
+if tat < now_us then
+    tat = now_us
+end
+tat = tat + interval
+local wait = tat - now_us - period
+if wait > 0 then
+    return wait
+end
+redis.call('SET', KEYS[1], string.format('%.0f', tat), 'PX', math.ceil((tat - now_us) / 1000))
+return 0
+"""
+
+class RedisRateLimiter:
+    backend = "redis"
+
+    def __init__(
+        self,
+        url: str = "",
+        max_clients: int = 100_000,
+        period_seconds: float = 60.0,
+        prefix: str = "greenprompt:rl",
+        client: Optional[Any] = None
+    ):
+        self.period_seconds = period_seconds
+        self.prefix = prefix
+        self._redis = client if client is not None else redis_asyncio.from_url(url)
+        self._script = self._redis.register_script(GCRA_SCRIPT)
+        # Used while Redis is unreachable, so limits still hold per worker.
+        self._fallback = MemoryRateLimiter(max_clients, period_seconds)
+        self.limited = 0
+        self.errors = 0
+
+    async def check(self, client_id: str, limit: int) -> float:
+        interval = math.ceil(self.period_seconds * 1_000_000 / limit)
+        try:
+            wait = int(await self._script(
+                keys=[f"{self.prefix}:{client_id}"], args=[interval, int(self.period_seconds * 1_000_000)]
+            ))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Rate limit check failed, using local limiter: {e}")
+            return await self._fallback.check(client_id, limit)
+        if wait > 0:
+            self.limited += 1
+        return wait / 1_000_000
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "limited": self.limited,
+            "errors": self.errors,
+            "fallback": self._fallback.stats()
+        }
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tomllib
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_MODELS = {
+    "gpt-4o": {"provider": "openai", "joules_per_token": 2.5, "accuracy": 0.95, "price_per_1k_tokens": 0.005,
+               "aliases": ["chatgpt-4o-latest"]},
+    "gpt-4o-mini": {"provider": "openai", "joules_per_token": 0.8, "accuracy": 0.92, "price_per_1k_tokens": 0.00015},
+    "gpt-3.5-turbo": {"provider": "openai", "joules_per_token": 0.6, "accuracy": 0.89, "price_per_1k_tokens": 0.0005},
+    "claude-3-5-sonnet": {"provider": "anthropic", "joules_per_token": 1.8, "accuracy": 0.94, "price_per_1k_tokens": 0.003,
+                          "aliases": ["claude-3-5-sonnet-latest", "claude-3.5-sonnet"]},
+    "claude-3-haiku": {"provider": "anthropic", "joules_per_token": 0.5, "accuracy": 0.88, "price_per_1k_tokens": 0.00025},
+    "gemini-2.5-pro": {"provider": "google", "joules_per_token": 1.5, "accuracy": 0.96, "price_per_1k_tokens": 0.00125},
+    "gemini-2.5-flash": {"provider": "google", "joules_per_token": 0.35, "accuracy": 0.94, "price_per_1k_tokens": 0.00015},
+    "gemini-2.5-flash-lite": {"provider": "google", "joules_per_token": 0.2, "accuracy": 0.91, "price_per_1k_tokens": 0.000075},
+    "gemini-2.0-flash": {"provider": "google", "joules_per_token": 0.3, "accuracy": 0.92, "price_per_1k_tokens": 0.00010},
+    "gemini-2.0-flash-lite": {"provider": "google", "joules_per_token": 0.15, "accuracy": 0.89, "price_per_1k_tokens": 0.00005},
+    "gemini-1.5-pro": {"provider": "google", "joules_per_token": 1.2, "accuracy": 0.93, "price_per_1k_tokens": 0.00125},
+    "gemini-1.5-flash": {"provider": "google", "joules_per_token": 0.4, "accuracy": 0.90, "price_per_1k_tokens": 0.000075},
+    "gemini-3-pro": {"provider": "google", "joules_per_token": 0.9, "accuracy": 0.92, "price_per_1k_tokens": 0.00050},
+    "gemini-3-flash": {"provider": "google", "joules_per_token": 0.35, "accuracy": 0.90, "price_per_1k_tokens": 0.00010},
+    "mistral-large": {"provider": "mistral", "joules_per_token": 1.5, "accuracy": 0.92, "price_per_1k_tokens": 0.002,
+                      "aliases": ["mistral-large-latest"]},
+    "mistral-medium": {"provider": "mistral", "joules_per_token": 0.9, "accuracy": 0.90, "price_per_1k_tokens": 0.001,
+                       "aliases": ["mistral-medium-latest"]},
+    "mistral-small": {"provider": "mistral", "joules_per_token": 0.4, "accuracy": 0.87, "price_per_1k_tokens": 0.0002,
+                      "aliases": ["mistral-small-latest"]},
+    "qwen-72b": {"provider": "alibaba", "joules_per_token": 1.8, "accuracy": 0.91},
+    "qwen-32b": {"provider": "alibaba", "joules_per_token": 1.0, "accuracy": 0.89},
+    "qwen-7b": {"provider": "alibaba", "joules_per_token": 0.5, "accuracy": 0.86},
+    "llama-3-70b": {"provider": "meta", "joules_per_token": 1.6, "accuracy": 0.91, "price_per_1k_tokens": 0.0009},
+    "llama-3-8b": {"provider": "meta", "joules_per_token": 0.4, "accuracy": 0.85, "price_per_1k_tokens": 0.00008},
+    "llama-3.1-405b": {"provider": "meta", "joules_per_token": 3.5, "accuracy": 0.96, "price_per_1k_tokens": 0.005},
+    "llama-3.1-70b": {"provider": "meta", "joules_per_token": 1.4, "accuracy": 0.92, "price_per_1k_tokens": 0.0009},
+    "llama-3.1-8b": {"provider": "meta", "joules_per_token": 0.35, "accuracy": 0.84, "price_per_1k_tokens": 0.00008},
+}
+
+BUILTIN_REGIONS = {
+    "us-west": 0.00035,
+    "us-east": 0.00042,
+    "eu-west": 0.00028,
+    "eu-central": 0.00032,
+    "asia-east": 0.00055,
+    "asia-south": 0.00048,
+    "default": 0.00040
+}
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_PRICE_PER_1K_TOKENS = 0.001
+
+_VERSION_SUFFIX_RE = re.compile(r'(?:-\d{4}-\d{2}-\d{2}|-\d{8}|-\d{4}|-latest|-preview)$')
+
+@dataclass(frozen=True, slots=True)
+class ModelRecord:
+    name: str
+    provider: str
+    joules_per_token: float
+    accuracy: float
+    price_per_1k_tokens: float
+    aliases: Tuple[str, ...] = ()
+
+@dataclass(frozen=True, slots=True)
+class RegistrySnapshot:
+    models: Mapping[str, ModelRecord]
+    index: Mapping[str, ModelRecord]
+    carbon_factors: Mapping[str, float]
+    default_model: ModelRecord
+    version: int
+
+    @property
+    def model_names(self) -> Tuple[str, ...]:
+        return tuple(self.models)
+
+    def resolve(self, model: str) -> Optional[ModelRecord]:
+        key = model.lower()
+        record = self.index.get(key)
+        if record is None:
+            stripped = _VERSION_SUFFIX_RE.sub("", key)
+            if stripped != key:
+                record = self.index.get(stripped)
+        return record
+
+    def carbon_factor(self, region: str) -> float:
+        return self.carbon_factors.get(region.lower(), self.carbon_factors["default"])
+
+def build_snapshot(models: Dict[str, Dict[str, Any]], regions: Dict[str, float],
+                   default_model: str = DEFAULT_MODEL, version: int = 0) -> RegistrySnapshot:
+    records = {}
+    index = {}
+    for name, spec in models.items():
+        name = name.lower()
+        record = ModelRecord(
+            name=name,
+            provider=str(spec.get("provider", "unknown")),
+            joules_per_token=float(spec["joules_per_token"]),
+            accuracy=float(spec["accuracy"]),
+            price_per_1k_tokens=float(spec.get("price_per_1k_tokens", DEFAULT_PRICE_PER_1K_TOKENS)),
+            aliases=tuple(alias.lower() for alias in spec.get("aliases", ()))
+        )
+        records[name] = record
+    for record in records.values():
+        for alias in record.aliases:
+            index[alias] = record
+    index.update(records)
+
+    carbon_factors = {region.lower(): float(factor) for region, factor in regions.items()}
+    carbon_factors.setdefault("default", BUILTIN_REGIONS["default"])
+    if default_model.lower() not in records:
+        raise ValueError(f"Default model {default_model} is not defined")
+
+    return RegistrySnapshot(
+        models=MappingProxyType(records),
+        index=MappingProxyType(index),
+        carbon_factors=MappingProxyType(carbon_factors),
+        default_model=records[default_model.lower()],
+        version=version
+    )
+
+def _read_registry_file(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        if path.endswith(".toml"):
+            return tomllib.load(f)
+        return json.load(f)
+
+class ModelRegistry:
+    def __init__(self):
+        self._snapshot = build_snapshot(BUILTIN_MODELS, BUILTIN_REGIONS)
+        self._path = ""
+        self._interval = 5.0
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, path: str, reload_interval: float = 5.0) -> None:
+        self._path = path
+        self._interval = reload_interval
+        self._mtime = None
+        self._next_check = 0.0
+        if path:
+            self.reload()
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        if self._path and time.monotonic() >= self._next_check:
+            self._check_for_changes()
+        return self._snapshot
+
+    def _check_for_changes(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self._interval
+            try:
+                mtime = os.stat(self._path).st_mtime
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    self._load()
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.warning(f"Keeping model registry v{self._snapshot.version}; failed to load {self._path}: {e}")
+        finally:
+            self._lock.release()
+
+    def reload(self) -> RegistrySnapshot:
+        with self._lock:
+            self._mtime = os.stat(self._path).st_mtime
+            self._load()
+        return self._snapshot
+
+    def _load(self) -> None:
+        data = _read_registry_file(self._path)
+        models = {**BUILTIN_MODELS, **data.get("models", {})}
+        regions = {**BUILTIN_REGIONS, **data.get("regions", {})}
+        self._snapshot = build_snapshot(
+            models, regions, data.get("default_model", DEFAULT_MODEL), self._snapshot.version + 1
+        )
+        logger.info(f"Loaded model registry v{self._snapshot.version} from {self._path}")
+
+registry = ModelRegistry()
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, func, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PromptRun, PromptRunDaily, PromptRunHourly
+from app.services.archive import archive, month_start
+
+MEASURES = ("prompt_count", "energy_joules", "carbon_kg", "water_liters", "cost_usd")
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def dialect_insert(db: AsyncSession, model: Any):
+    return _INSERTS[db.get_bind().dialect.name](model)
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def day_bucket(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _ceil(ts: datetime, floor, step: timedelta) -> datetime:
+    start = floor(ts)
+    return start if start == ts else start + step
+
+ROLLUPS = ((PromptRunHourly, hour_bucket), (PromptRunDaily, day_bucket))
+
+def aggregate_runs(rows: Iterable[Dict[str, Any]], bucket) -> Dict[Tuple, List[float]]:
+    totals: Dict[Tuple, List[float]] = {}
+    for row in rows:
+        key = (row["owner"], row.get("team_id") or "", row["model"], bucket(row["created_at"]))
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = [0, 0.0, 0.0, 0.0, 0.0]
+        total[0] += 1
+        total[1] += row.get("energy_joules") or 0.0
+        total[2] += row.get("carbon_kg") or 0.0
+        total[3] += row.get("water_liters") or 0.0
+        total[4] += row.get("cost_usd") or 0.0
+    return totals
+
+def _rollup_params(totals: Dict[Tuple, List[float]]) -> List[Dict[str, Any]]:
+    # Sorted so concurrent writers lock rollup rows in the same order.
+    return [
+        {"owner": owner, "team_id": team_id, "model": model, "bucket": bucket, **dict(zip(MEASURES, total))}
+        for (owner, team_id, model, bucket), total in sorted(totals.items())
+    ]
+
+async def upsert_rollups(db: AsyncSession, model: Any, totals: Dict[Tuple, List[float]]) -> None:
+    if not totals:
+        return
+    statement = dialect_insert(db, model)
+    statement = statement.on_conflict_do_update(
+        index_elements=["owner", "team_id", "model", "bucket"],
+        set_={measure: model.__table__.c[measure] + statement.excluded[measure] for measure in MEASURES}
+    )
+    await db.execute(statement, _rollup_params(totals))
+
+async def apply_rollups(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    for model, bucket in ROLLUPS:
+        await upsert_rollups(db, model, aggregate_runs(rows, bucket))
+
+def _raw_select(lo: datetime, hi: Optional[datetime]) -> Select:
+    query = select(
+        PromptRun.owner.label("owner"),
+        func.coalesce(PromptRun.team_id, "").label("team_id"),
+        PromptRun.model.label("model"),
+        PromptRun.created_at.label("bucket"),
+        literal(1).label("prompt_count"),
+        func.coalesce(PromptRun.energy_joules, 0.0).label("energy_joules"),
+        func.coalesce(PromptRun.carbon_kg, 0.0).label("carbon_kg"),
+        func.coalesce(PromptRun.water_liters, 0.0).label("water_liters"),
+        func.coalesce(PromptRun.cost_usd, 0.0).label("cost_usd")
+    ).where(PromptRun.created_at >= lo)
+    return query.where(PromptRun.created_at < hi) if hi is not None else query
+
+def _rollup_select(model: Any, lo: datetime, hi: Optional[datetime]) -> Select:
+    query = select(
+        model.owner, model.team_id, model.model, model.bucket, *(model.__table__.c[m] for m in MEASURES)
+    ).where(model.bucket >= lo)
+    return query.where(model.bucket < hi) if hi is not None else query
+
+def window_source(
+    start: datetime,
+    end: Optional[datetime] = None,
+    owner: Optional[str] = None,
+    team_id: Optional[str] = None
+):
+    # Whole days come from the daily rollup and whole hours from the hourly
+    # one. Only the partial hours at either edge of the window read raw rows.
+    first_hour = _ceil(start, hour_bucket, timedelta(hours=1))
+    first_day = _ceil(first_hour, day_bucket, timedelta(days=1))
+    if end is None:
+        spans = [(None, start, first_hour), (PromptRunHourly, first_hour, first_day), (PromptRunDaily, first_day, None)]
+    else:
+        last_hour = hour_bucket(end)
+        last_day = day_bucket(last_hour)
+        if first_hour >= last_hour:
+            spans = [(None, start, end)]
+        elif first_day >= last_day:
+            spans = [(None, start, first_hour), (PromptRunHourly, first_hour, last_hour), (None, last_hour, end)]
+        else:
+            spans = [
+                (None, start, first_hour), (PromptRunHourly, first_hour, first_day),
+                (PromptRunDaily, first_day, last_day),
+                (PromptRunHourly, last_day, last_hour), (None, last_hour, end)
+            ]
+
+    queries = []
+    for model, lo, hi in spans:
+        if hi is not None and lo >= hi:
+            continue
+        if model is None and archive.covers(lo, hi):
+            # Raw runs of archived months are no longer in prompt_runs, so a
+            # partial edge hour there is counted whole from the hourly rollup.
+            model, lo, hi = PromptRunHourly, hour_bucket(lo), hour_bucket(lo) + timedelta(hours=1)
+        table = PromptRun if model is None else model
+        query = _raw_select(lo, hi) if model is None else _rollup_select(model, lo, hi)
+        if owner is not None:
+            query = query.where(table.owner == owner)
+        if team_id is not None:
+            query = query.where(table.team_id == team_id)
+        queries.append(query)
+    return (union_all(*queries) if len(queries) > 1 else queries[0]).subquery("runs")
+
+async def rebuild_rollups(db: AsyncSession, chunk_rows: int = 10000) -> int:
+    for model, _ in ROLLUPS:
+        await db.execute(model.__table__.delete())
+
+    totals = {model: {} for model, _ in ROLLUPS}
+    count = 0
+
+    def fold(rows: List[Dict[str, Any]]) -> None:
+        for model, bucket in ROLLUPS:
+            for key, total in aggregate_runs(rows, bucket).items():
+                merged = totals[model].setdefault(key, [0, 0.0, 0.0, 0.0, 0.0])
+                for i, value in enumerate(total):
+                    merged[i] += value
+
+    # Archived months are read from their files; any of their runs still in
+    # prompt_runs are mid-archive copies and are skipped.
+    archived = set(archive.months())
+    columns = ("owner", "team_id", "model", "created_at", "energy_joules", "carbon_kg", "water_liters", "cost_usd")
+    for batch in archive.read(columns=columns):
+        rows = [dict(zip(columns, values)) for values in zip(*(batch[name] for name in columns))]
+        fold(rows)
+        count += len(rows)
+
+    result = await db.stream(
+        select(
+            PromptRun.owner, PromptRun.team_id, PromptRun.model, PromptRun.created_at,
+            PromptRun.energy_joules, PromptRun.carbon_kg, PromptRun.water_liters, PromptRun.cost_usd
+        ).where(PromptRun.created_at.is_not(None)).execution_options(yield_per=chunk_rows)
+    )
+    async for partition in result.mappings().partitions():
+        rows = [row for row in partition if month_start(row["created_at"]) not in archived] if archived else partition
+        fold(rows)
+        count += len(rows)
+
+    for model, _ in ROLLUPS:
+        params = _rollup_params(totals[model])
+        for start in range(0, len(params), chunk_rows):
+            await db.execute(model.__table__.insert(), params[start:start + chunk_rows])
+    await db.commit()
+    return count
@@ -0,0 +1,276 @@
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional
+
+from redis import asyncio as redis_asyncio
+from redis.exceptions import RedisError
+
+from app.services.energy import FEATURE_VOCABULARY, PromptFeatures, features_from_hits
+from app.services.tokenizer import Tokenizer, get_tokenizer
+
+# Both the regex estimator and the BPE pre-tokenizer always split between a
+# non-space character and a following space or tab, so text between two
+# such positions can be re-counted on its own.
+_TOKEN_BOUNDARY_RE = re.compile(r'(?<=\S)[ \t]')
+_KEYWORD_MARGIN = max(len(kw) for kw in FEATURE_VOCABULARY) - 1
+
+logger = logging.getLogger(__name__)
+
+class SessionConflict(ValueError):
+    pass
+
+class SessionStoreUnavailable(Exception):
+    pass
+
+def _count_keywords(text_lower: str) -> Counter:
+    counts = Counter()
+    for kw in FEATURE_VOCABULARY:
+        pos = text_lower.find(kw)
+        while pos != -1:
+            counts[kw] += 1
+            pos = text_lower.find(kw, pos + 1)
+    return counts
+
+def _left_boundary(text: str, offset: int) -> int:
+    span = 64
+    while True:
+        lo = max(0, offset - span)
+        last = None
+        for match in _TOKEN_BOUNDARY_RE.finditer(text, lo, offset):
+            last = match.start()
+        if last is not None:
+            return last
+        if lo == 0:
+            return 0
+        span *= 4
+
+def _right_boundary(text: str, end: int) -> int:
+    match = _TOKEN_BOUNDARY_RE.search(text, end + 1)
+    return match.start() if match else len(text)
+
+class AnalysisSession:
+    def __init__(self, owner: str, text: str, model: str, max_tokens: Optional[int],
+                 output_format: Optional[str], region: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.model = model
+        self.max_tokens = max_tokens
+        self.output_format = output_format
+        self.region = region
+        self.version = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self._tokenizer: Tokenizer = get_tokenizer(model)
+        self.text = text
+        self._raw_tokens = self._tokenizer.count(text)
+        self._keyword_counts = _count_keywords(text.lower())
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "text": self.text,
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "output_format": self.output_format,
+            "region": self.region,
+            "raw_tokens": self._raw_tokens,
+            "keyword_counts": dict(self._keyword_counts)
+        }
+
+    @classmethod
+    def from_state(cls, session_id: str, owner: str, version: int, state: Dict[str, Any]) -> "AnalysisSession":
+        # Restores the running counts as saved, without re-tokenizing.
+        session = cls.__new__(cls)
+        session.id = session_id
+        session.owner = owner
+        session.model = state["model"]
+        session.max_tokens = state["max_tokens"]
+        session.output_format = state["output_format"]
+        session.region = state["region"]
+        session.version = version
+        session.last_used = time.monotonic()
+        session.lock = threading.Lock()
+        session._tokenizer = get_tokenizer(session.model)
+        session.text = state["text"]
+        session._raw_tokens = state["raw_tokens"]
+        session._keyword_counts = Counter(state["keyword_counts"])
+        return session
+
+    def apply_edit(self, offset: int, deleted: int, inserted: str) -> None:
+        text = self.text
+        end = offset + deleted
+        if offset < 0 or deleted < 0 or end > len(text):
+            raise SessionConflict(f"Edit [{offset}, {end}) is outside the {len(text)}-character prompt")
+
+        a = _left_boundary(text, offset)
+        b = _right_boundary(text, end)
+        old_window = text[a:b]
+        new_window = text[a:offset] + inserted + text[end:b]
+        self._raw_tokens += self._tokenizer.count(new_window) - self._tokenizer.count(old_window)
+
+        prefix = text[max(0, offset - _KEYWORD_MARGIN):offset]
+        suffix = text[end:end + _KEYWORD_MARGIN]
+        counts = self._keyword_counts
+        counts.update(_count_keywords((prefix + inserted + suffix).lower()))
+        counts.subtract(_count_keywords((prefix + text[offset:end] + suffix).lower()))
+        for kw in [kw for kw, n in counts.items() if n <= 0]:
+            del counts[kw]
+
+        self.text = text[:offset] + inserted + text[end:]
+        self.version += 1
+
+    def features(self) -> PromptFeatures:
+        token_count = 0 if not self.text.strip() else max(1, self._raw_tokens)
+        return features_from_hits(self.text, token_count, frozenset(self._keyword_counts))
+
+class SessionStore:
+    # Sessions live in this process, so edits must reach the worker that
+    # created the session: use it with a single worker only.
+    backend = "memory"
+
+    def __init__(self, idle_timeout: float, max_sessions: int):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, AnalysisSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self, now: float) -> None:
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.idle_timeout and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session.id]
+            self.evictions += 1
+
+    async def create(self, session: AnalysisSession) -> AnalysisSession:
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict(time.monotonic())
+        return session
+
+    async def get(self, owner: str, session_id: str) -> Optional[AnalysisSession]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    async def save(self, session: AnalysisSession, base_version: int) -> Optional[bool]:
+        # Edits were applied to the stored object itself.
+        return True
+
+    async def delete(self, owner: str, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return False
+            del self._sessions[session_id]
+            return True
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "sessions": len(self._sessions), "evictions": self.evictions}
+
+# Saves only if nobody else saved since the session was read: returns -1
+# when the session has expired, 0 when its version moved on, else 1.
+SAVE_SCRIPT = """
+local version = redis.call('HGET', KEYS[1], 'version')
+if not version then
+    return -1
+end
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[2], 'state', ARGV[3])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+DELETE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'owner') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class RedisSessionStore:
+    # Each session is a hash of owner, version and its serialized state,
+    # expiring after the idle timeout, so any worker can serve its edits.
+    backend = "redis"
+
+    def __init__(self, url: str = "", idle_timeout: float = 600, prefix: str = "greenprompt:session", client: Optional[Any] = None):
+        self.idle_ms = int(idle_timeout * 1000)
+        self.prefix = prefix
+        self._redis = client if client is not None else redis_asyncio.from_url(url, decode_responses=True)
+        self._save = self._redis.register_script(SAVE_SCRIPT)
+        self._delete = self._redis.register_script(DELETE_SCRIPT)
+        self.conflicts = 0
+        self.errors = 0
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:{session_id}"
+
+    def _failed(self, e: RedisError) -> SessionStoreUnavailable:
+        self.errors += 1
+        logger.warning(f"Session store request failed: {e}")
+        return SessionStoreUnavailable("Session store is unavailable")
+
+    async def create(self, session: AnalysisSession) -> AnalysisSession:
+        key = self._key(session.id)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hset(key, mapping={"owner": session.owner, "version": session.version, "state": json.dumps(session.to_state())})
+        pipe.pexpire(key, self.idle_ms)
+        try:
+            await pipe.execute()
+        except RedisError as e:
+            raise self._failed(e)
+        return session
+
+    async def get(self, owner: str, session_id: str) -> Optional[AnalysisSession]:
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hgetall(self._key(session_id))
+        pipe.pexpire(self._key(session_id), self.idle_ms)
+        try:
+            stored, _ = await pipe.execute()
+        except RedisError as e:
+            raise self._failed(e)
+        if not stored or stored.get("owner") != owner:
+            return None
+        return AnalysisSession.from_state(session_id, owner, int(stored["version"]), json.loads(stored["state"]))
+
+    async def save(self, session: AnalysisSession, base_version: int) -> Optional[bool]:
+        # None when the session expired meanwhile, False when another
+        # request saved an edit first.
+        try:
+            saved = int(await self._save(
+                keys=[self._key(session.id)],
+                args=[base_version, session.version, json.dumps(session.to_state()), self.idle_ms]
+            ))
+        except RedisError as e:
+            raise self._failed(e)
+        if saved == 0:
+            self.conflicts += 1
+        return None if saved < 0 else saved == 1
+
+    async def delete(self, owner: str, session_id: str) -> bool:
+        try:
+            return bool(int(await self._delete(keys=[self._key(session_id)], args=[owner])))
+        except RedisError as e:
+            raise self._failed(e)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "conflicts": self.conflicts, "errors": self.errors}
@@ -0,0 +1,248 @@
+import base64
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Protocol, Tuple
+
+_WORD_OR_SYMBOL_RE = re.compile(r'\w+|[^\w\s]')
+
+# cl100k-style pre-tokenizer written for the stdlib `re` module:
+# [^\W\d_] stands in for \p{L}, \d for \p{N} and [\W_] for "neither".
+# llama-3 splits text the same way.
+BPE_PATTERN = (
+    r"'(?i:[sdmt]|ll|ve|re)"
+    r"|(?:(?![\r\n])[\W_])?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:(?!\s)[\W_])+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+# Qwen splits numbers into single digits.
+QWEN_PATTERN = BPE_PATTERN.replace(r"|\d{1,3}", r"|\d", 1)
+
+# o200k splits letter runs at lower-to-upper case changes and keeps
+# contractions on the word. `re` has no \p{Lu} or \p{Ll}, so those two
+# classes are built from unicodedata when the pattern is first needed.
+O200K_PATTERN = (
+    r"(?:(?![\r\n])[\W_])?[{upper}]*[{lower}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?"
+    r"|(?:(?![\r\n])[\W_])?[{upper}]+[{lower}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?"
+    r"|\d{{1,3}}"
+    r"| ?(?:(?!\s)[\W_])+[\r\n/]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+TOKENIZER_FAMILIES = {
+    "gpt-4o": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5": "cl100k_base",
+    "llama-3": "llama3",
+    "qwen": "qwen",
+}
+
+def _category_class(categories: Tuple[str, ...]) -> str:
+    # Body of a character class matching every code point whose Unicode
+    # general category is in `categories` ("M" covers Mn, Mc and Me).
+    ranges = []
+    start = None
+    for cp in range(sys.maxunicode + 2):
+        category = unicodedata.category(chr(cp)) if cp <= sys.maxunicode else ""
+        if category in categories or category[:1] in categories:
+            if start is None:
+                start = cp
+        elif start is not None:
+            ranges.append(f"\\U{start:08x}" if start == cp - 1 else f"\\U{start:08x}-\\U{cp - 1:08x}")
+            start = None
+    return "".join(ranges)
+
+@lru_cache(maxsize=None)
+def pretokenizer_pattern(vocab: str) -> str:
+    if vocab == "o200k_base":
+        return O200K_PATTERN.format(
+            upper=_category_class(("Lu", "Lt", "Lm", "Lo", "M")),
+            lower=_category_class(("Ll", "Lm", "Lo", "M"))
+        )
+    if vocab == "qwen":
+        return QWEN_PATTERN
+    return BPE_PATTERN
+
+_HEADER = struct.Struct("<8sII")
+_SLOT = struct.Struct("<IIII")
+_MAGIC = b"GPBPE001"
+
+_config = {"directory": "", "mode": "bpe"}
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int:
+        ...
+
+class RegexTokenizer:
+    name = "regex"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        whitespace_runs = len(text.split()) - 1
+        if text[0].isspace():
+            whitespace_runs += 1
+        if text[-1].isspace():
+            whitespace_runs += 1
+        return len(_WORD_OR_SYMBOL_RE.findall(text)) + whitespace_runs
+
+regex_tokenizer = RegexTokenizer()
+
+def compile_vocab(source: str, target: str) -> None:
+    ranks: Dict[bytes, int] = {}
+    with open(source, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+
+    n_slots = 1 << max(1, (len(ranks) * 2 - 1).bit_length())
+    mask = n_slots - 1
+    slots = bytearray(n_slots * _SLOT.size)
+    blob = bytearray()
+    for piece, rank in ranks.items():
+        piece_hash = zlib.crc32(piece)
+        i = piece_hash & mask
+        while _SLOT.unpack_from(slots, i * _SLOT.size)[2]:
+            i = (i + 1) & mask
+        _SLOT.pack_into(slots, i * _SLOT.size, piece_hash, len(blob), len(piece), rank)
+        blob += piece
+
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(ranks), n_slots))
+        f.write(slots)
+        f.write(blob)
+    os.replace(tmp_path, target)
+
+class MappedRanks:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, n_slots = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a compiled BPE vocabulary")
+        self._mask = n_slots - 1
+        self._blob_start = _HEADER.size + n_slots * _SLOT.size
+
+    def get(self, piece: bytes) -> Optional[int]:
+        piece_hash = zlib.crc32(piece)
+        i = piece_hash & self._mask
+        while True:
+            slot_hash, offset, length, rank = _SLOT.unpack_from(self._map, _HEADER.size + i * _SLOT.size)
+            if not length:
+                return None
+            if slot_hash == piece_hash and length == len(piece):
+                start = self._blob_start + offset
+                if self._map[start:start + length] == piece:
+                    return rank
+            i = (i + 1) & self._mask
+
+class BPETokenizer:
+    def __init__(self, name: str, ranks: MappedRanks, pattern: str = BPE_PATTERN, cache_size: int = 8192):
+        self.name = name
+        self.ranks = ranks
+        self._pattern = re.compile(pattern)
+        self._cache: Dict[str, int] = {}
+        self._cache_lock = threading.Lock()
+        self._cache_size = cache_size
+
+    def _merge(self, piece: bytes) -> List[bytes]:
+        get = self.ranks.get
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        pair_ranks = [get(parts[i] + parts[i + 1]) for i in range(len(parts) - 1)]
+        while pair_ranks:
+            best = None
+            for i, rank in enumerate(pair_ranks):
+                if rank is not None and (best is None or rank < pair_ranks[best]):
+                    best = i
+            if best is None:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+            del pair_ranks[best]
+            if best > 0:
+                pair_ranks[best - 1] = get(parts[best - 1] + parts[best])
+            if best < len(pair_ranks):
+                pair_ranks[best] = get(parts[best] + parts[best + 1])
+        return parts
+
+    def encode(self, text: str) -> List[Optional[int]]:
+        ids = []
+        for piece in self._pattern.findall(text):
+            raw = piece.encode("utf-8")
+            rank = self.ranks.get(raw)
+            if rank is not None:
+                ids.append(rank)
+            else:
+                ids.extend(self.ranks.get(part) for part in self._merge(raw))
+        return ids
+
+    def count(self, text: str) -> int:
+        total = 0
+        cache = self._cache
+        for piece in self._pattern.findall(text):
+            n = cache.get(piece)
+            if n is None:
+                raw = piece.encode("utf-8")
+                n = 1 if self.ranks.get(raw) is not None else len(self._merge(raw))
+                # Executor threads share the cache; only writers take the
+                # lock, so two of them can't evict the same oldest piece.
+                with self._cache_lock:
+                    if len(cache) >= self._cache_size:
+                        del cache[next(iter(cache))]
+                    cache[piece] = n
+            total += n
+        return total
+
+def configure_tokenizers(directory: str, mode: str = "bpe") -> None:
+    _config["directory"] = directory
+    _config["mode"] = mode
+    _load_vocab.cache_clear()
+    get_tokenizer.cache_clear()
+    # Compile and map every vocabulary now, at startup, rather than on the
+    # first request that needs one.
+    if directory and mode == "bpe":
+        for vocab in sorted(set(TOKENIZER_FAMILIES.values())):
+            _load_vocab(vocab)
+
+def resolve_family(model: str) -> Optional[str]:
+    model = model.lower()
+    matches = [prefix for prefix in TOKENIZER_FAMILIES if model.startswith(prefix)]
+    return TOKENIZER_FAMILIES[max(matches, key=len)] if matches else None
+
+@lru_cache(maxsize=None)
+def _load_vocab(vocab: str) -> Optional[BPETokenizer]:
+    directory = _config["directory"]
+    if not directory:
+        return None
+    compiled = os.path.join(directory, f"{vocab}.bpe")
+    source = os.path.join(directory, f"{vocab}.tiktoken")
+    if os.path.exists(source) and (
+        not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(source)
+    ):
+        compile_vocab(source, compiled)
+    if not os.path.exists(compiled):
+        return None
+    return BPETokenizer(vocab, MappedRanks(compiled), pretokenizer_pattern(vocab))
+
+@lru_cache(maxsize=256)
+def get_tokenizer(model: Optional[str] = None) -> Tokenizer:
+    if not model or _config["mode"] != "bpe":
+        return regex_tokenizer
+    vocab = resolve_family(model)
+    tokenizer = _load_vocab(vocab) if vocab else None
+    return tokenizer or regex_tokenizer
@@ -1,39 +1,71 @@
+import math
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from sqlalchemy import func, select, text
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Union
+from sqlalchemy import func, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.cache import RecentKeys
+from app.services.rollups import apply_rollups, day_bucket, dialect_insert, hour_bucket, window_source
 
-async def track_prompt_run(
+async def track_prompt_runs(
     db: AsyncSession,
     owner: str,
-    prompt: str,
-    model: str,
-    input_tokens: int,
-    output_tokens: int,
-    energy_joules: float,
-    carbon_kg: float,
-    water_liters: float,
-    cost_usd: float,
-    team_id: Optional[str] = None
-) -> Any:
+    rows: List[Dict[str, Any]],
+    recent_keys: RecentKeys
+) -> List[Dict[str, Any]]:
     from app.models import PromptRun
-    run = PromptRun(
-        owner=owner,
-        prompt_hash=str(hash(prompt)),
-        prompt_length=len(prompt),
-        model=model,
-        prompt_tokens=input_tokens,
-        estimated_output_tokens=output_tokens,
-        energy_joules=energy_joules,
-        carbon_kg=carbon_kg,
-        water_liters=water_liters,
-        cost_usd=cost_usd,
-        team_id=team_id
-    )
-    db.add(run)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+    plain = []
+    keyed: Dict[str, List[int]] = {}
+    for index, row in enumerate(rows):
+        key = row.get("idempotency_key")
+        if key is None:
+            plain.append(index)
+            continue
+        seen = recent_keys.get((owner, key))
+        if seen is not None:
+            results[index] = {**row, **seen, "duplicate": True}
+        else:
+            keyed.setdefault(key, []).append(index)
+
+    created: Dict[str, Dict[str, Any]] = {}
+    stored: Dict[str, Dict[str, Any]] = {}
+    if plain:
+        result = await db.execute(
+            insert(PromptRun).returning(PromptRun.id, PromptRun.created_at, sort_by_parameter_order=True),
+            [{**rows[index], "owner": owner} for index in plain]
+        )
+        for index, (run_id, created_at) in zip(plain, result.all()):
+            results[index] = {**rows[index], "id": run_id, "created_at": created_at, "duplicate": False}
+
+    if keyed:
+        statement = dialect_insert(db, PromptRun).on_conflict_do_nothing(
+            index_elements=["owner", "idempotency_key"]
+        ).returning(PromptRun.idempotency_key, PromptRun.id, PromptRun.created_at)
+        result = await db.execute(statement, [{**rows[indexes[0]], "owner": owner} for indexes in keyed.values()])
+        created = {key: {"id": run_id, "created_at": created_at} for key, run_id, created_at in result.all()}
+
+        conflicts = [key for key in keyed if key not in created]
+        if conflicts:
+            existing = await db.execute(
+                select(PromptRun.idempotency_key, PromptRun.id, PromptRun.created_at).where(
+                    PromptRun.owner == owner,
+                    PromptRun.idempotency_key.in_(conflicts)
+                )
+            )
+            stored = {key: {"id": run_id, "created_at": created_at} for key, run_id, created_at in existing.all()}
+
+        for key, indexes in keyed.items():
+            first = key in created
+            saved = created[key] if first else stored[key]
+            for position, index in enumerate(indexes):
+                results[index] = {**rows[index], **saved, "duplicate": not (first and position == 0)}
+
+    inserted = [results[index] for index in plain] + [results[keyed[key][0]] for key in created]
+    await apply_rollups(db, inserted)
     await db.commit()
-    await db.refresh(run)
-    return run
+    for key in keyed:
+        recent_keys.put((owner, key), created.get(key) or stored[key])
+    return results
 
 async def get_user_stats(
     db: AsyncSession,
@@ -41,14 +73,14 @@ async def get_user_stats(
     days: int = 30
 ) -> Dict[str, Any]:
     start_date = datetime.utcnow() - timedelta(days=days)
+    runs = window_source(start_date, owner=user_id)
     result = await db.execute(
         select(
-            func.sum(__import__('app.models', fromlist=['PromptRun']).PromptRun.energy_joules),
-            func.sum(__import__('app.models', fromlist=['PromptRun']).PromptRun.carbon_kg),
-            func.sum(__import__('app.models', fromlist=['PromptRun']).PromptRun.water_liters),
-            func.sum(__import__('app.models', fromlist=['PromptRun']).PromptRun.cost_usd),
-            func.count(__import__('app.models', fromlist=['PromptRun']).PromptRun.id),
-            func.avg(__import__('app.models', fromlist=['PromptRun']).PromptRun.energy_joules)
+            func.sum(runs.c.energy_joules),
+            func.sum(runs.c.carbon_kg),
+            func.sum(runs.c.water_liters),
+            func.sum(runs.c.cost_usd),
+            func.sum(runs.c.prompt_count)
         )
     )
     row = result.one()
@@ -58,7 +90,7 @@ async def get_user_stats(
         "total_water_liters": row[2] or 0,
         "total_cost_usd": row[3] or 0,
         "total_prompts": row[4] or 0,
-        "avg_energy_per_prompt": row[5] or 0,
+        "avg_energy_per_prompt": row[0] / row[4] if row[4] else 0,
         "period_days": days
     }
 
@@ -67,53 +99,114 @@ async def get_team_stats(
     team_id: str,
     days: int = 30
 ) -> Dict[str, Any]:
-    from app.models import PromptRun
     start_date = datetime.utcnow() - timedelta(days=days)
-    result = await db.execute(
-        select(
-            func.sum(PromptRun.energy_joules),
-            func.sum(PromptRun.carbon_kg),
-            func.sum(PromptRun.water_liters),
-            func.sum(PromptRun.cost_usd),
-            func.count(PromptRun.id)
-        ).where(
-            PromptRun.team_id == team_id,
-            PromptRun.created_at >= start_date
-        )
-    )
-    row = result.one()
-
+    runs = window_source(start_date, team_id=team_id)
     user_results = await db.execute(
         select(
-            PromptRun.owner,
-            func.sum(PromptRun.energy_joules),
-            func.count(PromptRun.id)
-        ).where(
-            PromptRun.team_id == team_id,
-            PromptRun.created_at >= start_date
-        ).group_by(PromptRun.owner)
+            runs.c.owner,
+            func.sum(runs.c.energy_joules),
+            func.sum(runs.c.carbon_kg),
+            func.sum(runs.c.water_liters),
+            func.sum(runs.c.cost_usd),
+            func.sum(runs.c.prompt_count)
+        ).group_by(runs.c.owner)
     )
 
     members = []
+    totals = [0.0, 0.0, 0.0, 0.0, 0]
     for user_row in user_results.all():
+        for i in range(5):
+            totals[i] += user_row[i + 1] or 0
         members.append({
             "user_id": user_row[0],
             "total_energy_joules": user_row[1] or 0,
-            "prompt_count": user_row[2] or 0
+            "prompt_count": user_row[5] or 0
         })
     members.sort(key=lambda x: x["total_energy_joules"])
 
     return {
         "team_id": team_id,
-        "total_energy_joules": row[0] or 0,
-        "total_carbon_kg": row[1] or 0,
-        "total_water_liters": row[2] or 0,
-        "total_cost_usd": row[3] or 0,
-        "total_prompts": row[4] or 0,
+        "total_energy_joules": totals[0],
+        "total_carbon_kg": totals[1],
+        "total_water_liters": totals[2],
+        "total_cost_usd": totals[3],
+        "total_prompts": totals[4],
         "period_days": days,
         "leaderboard": members
     }
 
+TIME_SERIES_GRANULARITIES = ("minute", "hour", "day", "week", "month")
+MAX_TIME_SERIES_POINTS = 10000
+_BUCKETS_PER_DAY = {"minute": 1440, "hour": 24, "day": 1, "week": 1 / 7, "month": 1 / 28}
+
+def floor_bucket(ts: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return hour_bucket(ts)
+    day = day_bucket(ts)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def next_bucket(ts: datetime, granularity: str) -> datetime:
+    if granularity == "month":
+        return ts.replace(year=ts.year + 1, month=1) if ts.month == 12 else ts.replace(month=ts.month + 1)
+    steps = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(days=7)}
+    return ts + steps[granularity]
+
+def time_series_points(days: int, granularity: str) -> int:
+    return math.ceil(days * _BUCKETS_PER_DAY[granularity]) + 1
+
+def bucket_expression(dialect: str, granularity: str, column: Any) -> Any:
+    if dialect == "sqlite":
+        if granularity == "minute":
+            return func.strftime("%Y-%m-%d %H:%M:00", column)
+        if granularity == "day":
+            return func.datetime(column, "start of day")
+        if granularity == "week":
+            return func.datetime(column, "weekday 0", "-6 days", "start of day")
+        return func.datetime(column, "start of month")
+    return func.date_trunc(granularity, column)
+
+def _as_datetime(value: Any) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def _series_point(timestamp: datetime, energy: float = 0, carbon: float = 0, cost: float = 0, count: int = 0) -> Dict[str, Any]:
+    return {"timestamp": timestamp.isoformat(), "energy_joules": energy, "carbon_kg": carbon, "cost_usd": cost, "prompt_count": count}
+
+async def _iterate(rows: Iterable[Sequence[Any]]) -> AsyncIterator[Sequence[Any]]:
+    for row in rows:
+        yield row
+
+async def fill_time_series(
+    rows: Union[Iterable[Sequence[Any]], AsyncIterable[Sequence[Any]]],
+    start: datetime,
+    granularity: str,
+    now: datetime
+) -> List[Dict[str, Any]]:
+    # rows are (period, energy, carbon, cost, count) in period order, either
+    # in memory or streamed from the database; every missing bucket up to the
+    # current one is filled with zeros.
+    if not hasattr(rows, "__aiter__"):
+        rows = _iterate(rows)
+    data = []
+    expected = start
+    async for period, energy, carbon, cost, count in rows:
+        period = _as_datetime(period)
+        while expected < period:
+            data.append(_series_point(expected))
+            expected = next_bucket(expected, granularity)
+        data.append(_series_point(period, energy or 0, carbon or 0, cost or 0, count or 0))
+        expected = next_bucket(period, granularity)
+    last = floor_bucket(now, granularity)
+    while expected <= last:
+        data.append(_series_point(expected))
+        expected = next_bucket(expected, granularity)
+    return data
+
 async def get_time_series(
     db: AsyncSession,
     user_id: Optional[str] = None,
@@ -121,37 +214,40 @@ async def get_time_series(
     days: int = 30,
     granularity: str = "day"
 ) -> List[Dict[str, Any]]:
-    from app.models import PromptRun
-    start_date = datetime.utcnow() - timedelta(days=days)
+    from app.models import PromptRun, PromptRunDaily, PromptRunHourly
+    if granularity not in TIME_SERIES_GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Use one of: {', '.join(TIME_SERIES_GRANULARITIES)}")
+    if time_series_points(days, granularity) > MAX_TIME_SERIES_POINTS:
+        raise ValueError(f"{days} days at {granularity} granularity exceeds {MAX_TIME_SERIES_POINTS} points")
 
-    if granularity == "hour":
-        date_trunc = func.date_trunc('hour', PromptRun.created_at)
+    now = datetime.utcnow()
+    start_date = floor_bucket(now - timedelta(days=days), granularity)
+    dialect = db.get_bind().dialect.name
+
+    # Minutes come from raw runs, hours and days straight from their rollup,
+    # weeks and months from the daily rollup truncated in the database.
+    if granularity == "minute":
+        source, time_column, count = PromptRun, PromptRun.created_at, func.count(PromptRun.id)
+        bucket = bucket_expression(dialect, granularity, time_column)
     else:
-        date_trunc = func.date_trunc('day', PromptRun.created_at)
+        source = PromptRunHourly if granularity == "hour" else PromptRunDaily
+        time_column, count = source.bucket, func.sum(source.prompt_count)
+        bucket = time_column if granularity in ("hour", "day") else bucket_expression(dialect, granularity, time_column)
 
     query = select(
-        date_trunc.label('period'),
-        func.sum(PromptRun.energy_joules),
-        func.sum(PromptRun.carbon_kg),
-        func.sum(PromptRun.cost_usd),
-        func.count(PromptRun.id)
-    ).where(PromptRun.created_at >= start_date)
+        bucket.label("period"),
+        func.sum(source.energy_joules),
+        func.sum(source.carbon_kg),
+        func.sum(source.cost_usd),
+        count
+    ).where(time_column >= start_date)
 
     if user_id:
-        query = query.where(PromptRun.owner == user_id)
+        query = query.where(source.owner == user_id)
     elif team_id:
-        query = query.where(PromptRun.team_id == team_id)
+        query = query.where(source.team_id == team_id)
 
-    query = query.group_by('period').order_by('period')
+    query = query.group_by("period").order_by("period")
 
-    result = await db.execute(query)
-    data = []
-    for row in result.all():
-        data.append({
-            "timestamp": row[0].isoformat() if row[0] else None,
-            "energy_joules": row[1] or 0,
-            "carbon_kg": row[2] or 0,
-            "cost_usd": row[3] or 0,
-            "prompt_count": row[4] or 0
-        })
-    return data
+    result = await db.stream(query)
+    return await fill_time_series(result, start_date, granularity, now)
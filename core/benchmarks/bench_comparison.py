@@ -0,0 +1,39 @@
+"""Compare per-prompt model loops against the vectorized comparison matrix.
+
+Run from the core/ directory:
+
+    python -m benchmarks.bench_comparison
+"""
+import timeit
+
+from app.services.energy import (
+    get_comparison_engine, extract_features,
+    estimate_energy, calculate_carbon_footprint
+)
+from app.services.registry import registry
+from benchmarks.bench_features import make_prompt
+
+def loop_compare(features, models):
+    rows = []
+    for f in features:
+        output_tokens = f.output_tokens("standard")
+        rows.append(sorted(
+            (estimate_energy(f.token_count, output_tokens, m, f.output_format), m)
+            for m in models
+        ))
+        for energy, _ in rows[-1]:
+            calculate_carbon_footprint(energy)
+    return rows
+
+def main():
+    models = list(registry.snapshot.model_names)
+    engine = get_comparison_engine()
+    print(f"{'prompts':>8} {'models':>7} {'loop ms':>9} {'matrix ms':>10} {'speedup':>8}")
+    for n_prompts in (6, 100, 500):
+        features = [extract_features(make_prompt(400, seed=i)) for i in range(n_prompts)]
+        old = min(timeit.repeat(lambda: loop_compare(features, models), number=5, repeat=3)) / 5 * 1e3
+        new = min(timeit.repeat(lambda: engine.compare(features, models), number=5, repeat=3)) / 5 * 1e3
+        print(f"{n_prompts:>8} {len(models):>7} {old:>9.2f} {new:>10.2f} {old / new:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
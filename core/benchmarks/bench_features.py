@@ -0,0 +1,67 @@
+"""Compare the per-request prompt scans against the shared PromptFeatures path.
+
+Run from the core/ directory:
+
+    python -m benchmarks.bench_features
+"""
+import random
+import timeit
+
+from app.services.energy import (
+    estimate_tokens, estimate_output_tokens,
+    detect_task_type, detect_output_format,
+    extract_features
+)
+from app.services.optimizer import optimize_prompt
+
+WORDS = (
+    "please analyze the quarterly revenue data and explain thoroughly why costs rose "
+    "compare regions list the top drivers write a short summary in json with a table "
+    "of rows and columns think step by step about outliers"
+).split()
+
+def make_prompt(n_chars: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < n_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:n_chars]
+
+def legacy_analyze(prompt: str):
+    input_tokens = estimate_tokens(prompt)
+    output_tokens = estimate_output_tokens(prompt, detect_task_type(prompt))
+    return input_tokens, output_tokens, detect_task_type(prompt), detect_output_format(prompt)
+
+def features_analyze(prompt: str):
+    features = extract_features(prompt)
+    return features.token_count, features.output_tokens(), features.task_type, features.output_format
+
+def legacy_optimize(prompt: str):
+    return optimize_prompt(prompt), legacy_analyze(prompt)
+
+def features_optimize(prompt: str):
+    features = extract_features(prompt)
+    return optimize_prompt(prompt, features), features.token_count
+
+def bench(fn, prompt: str, number: int) -> float:
+    return min(timeit.repeat(lambda: fn(prompt), number=number, repeat=5)) / number * 1e6
+
+def main():
+    print(f"{'chars':>7} {'path':<10} {'legacy us':>10} {'features us':>12} {'speedup':>8}")
+    for n_chars in (200, 2_000, 10_000):
+        prompt = make_prompt(n_chars)
+        assert legacy_analyze(prompt) == features_analyze(prompt)
+        number = max(20, 20_000 // n_chars)
+        for name, legacy, fast in (
+            ("analyze", legacy_analyze, features_analyze),
+            ("optimize", legacy_optimize, features_optimize),
+        ):
+            old = bench(legacy, prompt, number)
+            new = bench(fast, prompt, number)
+            print(f"{n_chars:>7} {name:<10} {old:>10.1f} {new:>12.1f} {old / new:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
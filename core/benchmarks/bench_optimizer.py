@@ -0,0 +1,46 @@
+"""Measure optimize throughput on long prompts for each rule set.
+
+Compares the compiled single-pass matcher against applying the same rules
+one at a time with re.sub, which copies the prompt once per rule.
+
+Run from the core/ directory:
+
+    python -m benchmarks.bench_optimizer
+"""
+import re
+import timeit
+
+from app.services.energy import extract_features
+from app.services.optimizer import RULE_SETS
+from benchmarks.bench_features import make_prompt
+
+def sequential_optimize(rule_set, prompt: str) -> str:
+    for rule in rule_set.phrase_rules:
+        for phrase in rule.phrases:
+            pattern = rf"\b{re.escape(phrase)}\b"
+            if rule.replacement is not None:
+                prompt = re.sub(pattern, rule.replacement, prompt, flags=re.IGNORECASE)
+            else:
+                re.findall(pattern, prompt, flags=re.IGNORECASE)
+    return prompt.strip()
+
+def main():
+    print(f"{'rules':>6} {'chars':>7} {'sequential us':>14} {'compiled us':>12} {'MB/s':>7} {'speedup':>8}")
+    for version, compiled in RULE_SETS.items():
+        for n_chars in (2_000, 10_000, 100_000):
+            prompt = make_prompt(n_chars)
+            features = extract_features(prompt)
+            number = max(5, 200_000 // n_chars)
+            old = min(timeit.repeat(
+                lambda: sequential_optimize(compiled.rule_set, prompt), number=number, repeat=5
+            )) / number
+            new = min(timeit.repeat(
+                lambda: compiled.optimize(prompt, features), number=number, repeat=5
+            )) / number
+            print(
+                f"{version:>6} {n_chars:>7} {old * 1e6:>14.1f} {new * 1e6:>12.1f} "
+                f"{n_chars / new / 1e6:>7.1f} {old / new:>7.2f}x"
+            )
+
+if __name__ == "__main__":
+    main()
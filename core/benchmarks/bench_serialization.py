@@ -0,0 +1,62 @@
+"""Compare FastAPI's response_model serialization with the fast response path.
+
+The default path mirrors what FastAPI does for an endpoint with a
+response_model: dump the returned value, validate it against the model, dump
+it again to JSON-compatible Python and encode that with the stdlib json
+module. The fast path encodes service payloads directly (FAST_RESPONSES=true)
+and serves /v1/models as bytes encoded once per registry version.
+
+Run from the core/ directory:
+
+    python -m benchmarks.bench_serialization
+"""
+import timeit
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.api.responses import EncodedPayloads, json_bytes_response, prevalidated_response
+from app.schemas import AnalyzeResponse, BenchmarkResponse, ModelListResponse
+from app.services.benchmark import list_supported_models, run_benchmark
+from app.services.registry import registry
+
+def run_ready(coro):
+    # Drives a coroutine that never suspends without paying for an event loop.
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+def default_response(model: type, payload) -> JSONResponse:
+    content = payload.model_dump() if isinstance(payload, BaseModel) else payload
+    return JSONResponse(model.model_validate(content).model_dump(mode="json"))
+
+def main():
+    analysis = AnalyzeResponse(
+        input_tokens=412, estimated_output_tokens=618, energy_joules=1545.0, carbon_kg=0.000541,
+        water_liters=772.5, estimated_cost_usd=0.01545, task_type="complex", output_format="prose",
+        confidence=0.92, model_info={"model": "gpt-4o", "energy_per_token": 1.5, "estimated_accuracy": 0.95}
+    )
+    standard = run_benchmark(models=list(registry.snapshot.model_names[:10]))
+    payloads = EncodedPayloads()
+    version = registry.snapshot.version
+
+    async def encoded_models():
+        return json_bytes_response(await payloads.get("models", version, ModelListResponse, list_supported_models))
+
+    # /v1/models used to rebuild its payload on every request.
+    cases = [
+        ("analyze", lambda: default_response(AnalyzeResponse, analysis), lambda: prevalidated_response(analysis)),
+        ("benchmark 6x10", lambda: default_response(BenchmarkResponse, standard), lambda: prevalidated_response(standard)),
+        ("models", lambda: default_response(ModelListResponse, run_ready(list_supported_models())), lambda: run_ready(encoded_models()))
+    ]
+    print(f"{'payload':>15} {'bytes':>7} {'default us':>11} {'fast us':>9} {'speedup':>8}")
+    for name, old_fn, new_fn in cases:
+        size = len(new_fn().body)
+        old = min(timeit.repeat(old_fn, number=200, repeat=5)) / 200 * 1e6
+        new = min(timeit.repeat(new_fn, number=200, repeat=5)) / 200 * 1e6
+        print(f"{name:>15} {size:>7} {old:>11.1f} {new:>9.1f} {old / new:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure tokens/sec for the regex estimator and the mmap-backed BPE tokenizer.
+
+Run from the core/ directory:
+
+    TOKENIZER_DIR=/path/to/vocabs python -m benchmarks.bench_tokenizer [model]
+
+When TOKENIZER_DIR holds no vocabulary for the model, a small byte-level
+BPE table is trained on the sample corpus so the encoder can still be timed.
+"""
+import base64
+import re
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from app.services.tokenizer import (
+    BPE_PATTERN, BPETokenizer, RegexTokenizer, configure_tokenizers, get_tokenizer
+)
+from benchmarks.bench_features import make_prompt
+
+def train_vocab(corpus: str, path: str, n_merges: int = 2000) -> None:
+    words = Counter(tuple(bytes([b]) for b in piece.encode("utf-8")) for piece in re.findall(BPE_PATTERN, corpus))
+    ranks = {bytes([i]): i for i in range(256)}
+    for _ in range(n_merges):
+        pairs = Counter()
+        for word, freq in words.items():
+            for a, b in zip(word, word[1:]):
+                pairs[a, b] += freq
+        if not pairs:
+            break
+        (a, b), _ = pairs.most_common(1)[0]
+        ranks[a + b] = len(ranks)
+        merged = Counter()
+        for word, freq in words.items():
+            out, i = [], 0
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == a and word[i + 1] == b:
+                    out.append(a + b)
+                    i += 2
+                else:
+                    out.append(word[i])
+                    i += 1
+            merged[tuple(out)] += freq
+        words = merged
+    with open(path, "w") as f:
+        for piece, rank in ranks.items():
+            f.write(f"{base64.b64encode(piece).decode()} {rank}\n")
+
+def tokens_per_sec(tokenizer, text: str, seconds: float = 1.0) -> float:
+    tokens = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        tokens += tokenizer.count(text)
+    return tokens / (time.perf_counter() - start)
+
+def main():
+    model = sys.argv[1] if len(sys.argv) > 1 else "gpt-3.5-turbo"
+    text = make_prompt(10_000)
+    directory = os.getenv("TOKENIZER_DIR", "")
+    configure_tokenizers(directory)
+    tokenizer = get_tokenizer(model)
+    if not isinstance(tokenizer, BPETokenizer):
+        directory = tempfile.mkdtemp()
+        train_vocab(make_prompt(50_000, seed=1), os.path.join(directory, "cl100k_base.tiktoken"))
+        configure_tokenizers(directory)
+        tokenizer = get_tokenizer("gpt-3.5-turbo")
+        print(f"no vocabulary for {model}; using a trained toy vocabulary ({tokenizer.ranks.size} ranks)")
+
+    regex = RegexTokenizer()
+    print(f"regex: {regex.count(text)} tokens, {tokens_per_sec(regex, text):,.0f} tokens/sec")
+    tokenizer._cache.clear()
+    start = time.perf_counter()
+    count = tokenizer.count(text)
+    cold = count / (time.perf_counter() - start)
+    print(f"bpe ({tokenizer.name}): {count} tokens, {cold:,.0f} tokens/sec cold, "
+          f"{tokens_per_sec(tokenizer, text):,.0f} tokens/sec warm")
+
+if __name__ == "__main__":
+    main()
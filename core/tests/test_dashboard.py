@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from app.models import PromptRun
+from app.services.dashboard import get_dashboard
+from app.services.leaderboard import get_rank
+from app.services.ranking import MemoryLeaderboard
+from app.services.rollups import rebuild_rollups
+
+ENERGY = {"user-a": 300.0, "user-b": 100.0, "user-c": 200.0, "user-d": 100.0}
+# Ordered by energy, ties by user id.
+RANKS = {"user-b": 1, "user-d": 2, "user-c": 3, "user-a": 4}
+
+async def seed(session_factory):
+    now = datetime.utcnow()
+    rows = [
+        {
+            "owner": owner, "team_id": "team-1", "model": model, "energy_joules": energy / 2,
+            "carbon_kg": 0.001, "water_liters": 0.5, "cost_usd": 0.01, "created_at": now - timedelta(hours=hours)
+        }
+        for owner, energy in ENERGY.items()
+        for model, hours in (("gpt-4o", 1), ("gpt-4o-mini", 30))
+    ]
+    async with session_factory() as db:
+        await db.execute(insert(PromptRun), rows)
+        await db.commit()
+        await rebuild_rollups(db)
+    return rows
+
+async def test_dashboard_is_one_round_trip_with_rank(engine, session_factory):
+    rows = await seed(session_factory)
+    index = MemoryLeaderboard([30])
+    await index.add(rows)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for owner in ENERGY:
+        async with session_factory() as db:
+            event.listen(engine.sync_engine, "before_cursor_execute", capture)
+            try:
+                dashboard = await get_dashboard(db, MemoryLeaderboard(()), owner, 30)
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", capture)
+            assert len(statements) == 1
+            statements.clear()
+            indexed = await index.query("global", 30, 0, owner)
+            assert dashboard["global_rank"] == RANKS[owner]
+            assert indexed["my_rank"] == await get_rank(db, owner, "global", None, 30) == RANKS[owner]
+            assert dashboard["total_energy_joules"] == ENERGY[owner]
+            assert dashboard["total_prompts"] == 2
+            assert len(dashboard["top_models"]) == 2
+
+async def test_dashboard_without_runs_has_no_rank(session_factory):
+    await seed(session_factory)
+    async with session_factory() as db:
+        dashboard = await get_dashboard(db, MemoryLeaderboard(()), "user-z", 30)
+    assert dashboard["global_rank"] is None
+    assert dashboard["total_prompts"] == 0
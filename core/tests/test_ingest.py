@@ -0,0 +1,156 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.models import PromptRun, PromptRunDaily
+from app.services.ingest import IngestUnavailable, RunIngestor, append_spill
+
+def run(owner="user-1", model="gpt-4o", **fields):
+    return {"owner": owner, "model": model, "energy_joules": 10.0, "created_at": datetime(2026, 1, 1, 12), **fields}
+
+class FlakyDatabase:
+    # Hands out real sessions, or fails the way an unreachable database does.
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.down = False
+        self.error = None
+
+    @asynccontextmanager
+    async def __call__(self):
+        if self.error is not None:
+            raise self.error
+        if self.down:
+            raise OperationalError("INSERT", {}, ConnectionRefusedError("database is down"))
+        async with self.session_factory() as db:
+            yield db
+
+async def eventually(check, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+async def count_runs(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(PromptRun))
+
+async def test_write_returns_inserted_run_and_updates_rollups(session_factory):
+    inserted = []
+
+    async def on_insert(rows):
+        inserted.extend(rows)
+
+    ingestor = RunIngestor(session_factory, flush_interval=0.01, on_insert=on_insert)
+    await ingestor.start()
+    stored = await ingestor.write(run())
+    ingestor.submit(run(owner="user-2"))
+    await ingestor.drain()
+
+    assert stored["id"] is not None and stored["owner"] == "user-1"
+    assert [row["owner"] for row in inserted] == ["user-1", "user-2"]
+    assert await count_runs(session_factory) == 2
+    async with session_factory() as db:
+        assert await db.scalar(select(func.sum(PromptRunDaily.prompt_count))) == 2
+
+async def test_failing_listener_does_not_stop_ingestion(session_factory):
+    async def on_insert(rows):
+        raise RuntimeError("listener failed")
+
+    ingestor = RunIngestor(session_factory, flush_interval=0.01, on_insert=on_insert)
+    await ingestor.start()
+    await ingestor.write(run())
+    await ingestor.write(run())
+    await ingestor.drain()
+    assert await count_runs(session_factory) == 2
+
+async def test_writes_are_refused_once_the_task_has_died(session_factory, caplog):
+    database = FlakyDatabase(session_factory)
+    database.error = RuntimeError("unexpected")
+    ingestor = RunIngestor(database, flush_interval=0.01)
+    await ingestor.start()
+
+    with pytest.raises(IngestUnavailable):
+        await asyncio.wait_for(ingestor.write(run()), 1)
+    with pytest.raises(IngestUnavailable):
+        await ingestor.write(run())
+    with pytest.raises(IngestUnavailable):
+        ingestor.submit(run())
+    assert ingestor.stats()["dropped"] == 1
+    assert "Run ingestion stopped" in caplog.text
+    await ingestor.drain()
+
+async def test_unavailable_database_spills_and_replays(session_factory, tmp_path):
+    spill_path = os.path.join(tmp_path, "runs.spill")
+    database = FlakyDatabase(session_factory)
+    database.down = True
+    ingestor = RunIngestor(database, flush_interval=0.01, spill_path=spill_path)
+    await ingestor.start()
+    for i in range(3):
+        ingestor.submit(run(owner=f"user-{i}"))
+    with pytest.raises(IngestUnavailable):
+        await ingestor.write(run())
+    await eventually(lambda: ingestor.stats()["spilled"] == 3)
+
+    database.down = False
+    await ingestor.write(run(owner="user-9"))
+    await ingestor.drain()
+
+    assert ingestor.stats()["replayed"] == 3
+    assert await count_runs(session_factory) == 4
+    assert not os.path.exists(spill_path) and not os.path.exists(f"{spill_path}.replay")
+
+async def test_drain_spills_rows_still_queued(session_factory, tmp_path):
+    spill_path = os.path.join(tmp_path, "runs.spill")
+    database = FlakyDatabase(session_factory)
+    ingestor = RunIngestor(database, flush_interval=60, spill_path=spill_path, drain_timeout=0.2)
+    await ingestor.start()
+    database.down = True
+    for i in range(5):
+        ingestor.submit(run(owner=f"user-{i}"))
+    await ingestor.drain()
+
+    with open(spill_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 5
+    assert ingestor.stats()["pending"] == 0
+
+async def test_refused_spill_rows_are_quarantined(session_factory, tmp_path):
+    spill_path = os.path.join(tmp_path, "runs.spill")
+    # model is NOT NULL: the middle row can never be inserted.
+    append_spill(spill_path, [run(owner="user-1"), run(owner="user-2", model=None), run(owner="user-3")])
+    ingestor = RunIngestor(session_factory, flush_interval=0.01, spill_path=spill_path)
+    await ingestor.start()
+    await ingestor.write(run(owner="user-4"))
+    await ingestor.drain()
+
+    assert ingestor.stats()["replayed"] == 2
+    assert ingestor.stats()["quarantined"] == 1
+    assert await count_runs(session_factory) == 3
+    assert not os.path.exists(f"{spill_path}.replay")
+    with open(f"{spill_path}.quarantine", encoding="utf-8") as f:
+        assert '"owner": "user-2"' in f.read()
+
+async def test_interrupted_replay_keeps_only_unwritten_rows(session_factory, tmp_path):
+    spill_path = os.path.join(tmp_path, "runs.spill")
+    append_spill(spill_path, [run(owner=f"user-{i}") for i in range(5)])
+    ingestor = RunIngestor(session_factory, batch_rows=2, flush_interval=0.01, spill_path=spill_path)
+    insert_rows = ingestor._insert_rows
+    calls = 0
+
+    async def fail_second_batch(rows):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise OperationalError("INSERT", {}, ConnectionRefusedError("database is down"))
+        await insert_rows(rows)
+
+    ingestor._insert_rows = fail_second_batch
+    await ingestor._replay_spill()
+
+    assert await count_runs(session_factory) == 2
+    with open(f"{spill_path}.replay", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
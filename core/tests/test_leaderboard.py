@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from app.models import PromptRun
+from app.services.cache import SnapshotCache
+from app.services.leaderboard import get_most_improved
+from app.services.rollups import rebuild_rollups
+
+async def seed(session_factory, owners: int = 25):
+    # user-N used 100 J per prompt last period and 100 - 3N this one.
+    now = datetime.utcnow()
+    rows = []
+    for n in range(owners):
+        for energy, age in ((100.0, 40), (100.0 - 3 * n, 1)):
+            rows.append({
+                "owner": f"user-{n}", "team_id": "team-1", "model": "gpt-4o",
+                "energy_joules": energy, "created_at": now - timedelta(days=age)
+            })
+    async with session_factory() as db:
+        await db.execute(insert(PromptRun), rows)
+        await db.commit()
+        await rebuild_rollups(db)
+
+async def pages(session_factory, limit, cache=None):
+    entries, cursor = [], None
+    while True:
+        async with session_factory() as db:
+            page = await get_most_improved(db, "team", "team-1", 30, limit, cursor, cache)
+        entries.extend(page["entries"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return entries
+
+async def test_pages_cover_the_ranking_in_order(session_factory):
+    await seed(session_factory)
+    entries = await pages(session_factory, 7)
+    # user-0 did not improve.
+    assert [entry["user_id"] for entry in entries] == [f"user-{n}" for n in range(24, 0, -1)]
+    assert [entry["rank"] for entry in entries] == list(range(1, 25))
+    assert entries[0]["improvement_percent"] == 72.0
+
+async def test_cached_ranking_serves_later_pages_without_queries(engine, session_factory):
+    await seed(session_factory)
+    cache = SnapshotCache(10, 60)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        entries = await pages(session_factory, 5, cache)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    assert len(statements) == 1
+    assert entries == await pages(session_factory, 5)
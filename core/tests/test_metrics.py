@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services.metrics import RETIRED_FILE, MetricsRegistry, SharedMetrics
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+def request_count(text: str) -> float:
+    for line in text.splitlines():
+        if line.startswith("test_requests_seconds_count"):
+            return float(line.split()[-1])
+    return 0.0
+
+@pytest.mark.skipif(sys.platform == "win32", reason="compaction needs fcntl")
+async def test_exited_workers_are_compacted_without_losing_counts(tmp_path):
+    registry = MetricsRegistry("test")
+    requests = registry.histogram("requests_seconds", "Request time.")
+    shared = SharedMetrics(registry, str(tmp_path), flush_interval=0.05)
+    await shared.start()
+    try:
+        requests.observe(0.01)
+        # Two workers that exited a while ago, each having served 5 requests.
+        for pid in (exited_pid(), exited_pid()):
+            state = {
+                "worker": str(pid), "written": time.time() - 60, "gauges": [],
+                "histograms": {"requests_seconds": [[[], [5] + [0] * 15 + [0.5]]]}
+            }
+            with open(os.path.join(tmp_path, f"{pid}-1.json"), "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+        await shared.flush()
+        assert request_count(shared.read()) == 11
+        assert sorted(os.listdir(tmp_path)) == [".lock", os.path.basename(shared._path), RETIRED_FILE]
+        assert shared.stats()["compacted_files"] == 2
+
+        requests.observe(0.01)
+        assert request_count(await shared.render()) == 12
+        assert shared.stats()["compacted_files"] == 2
+    finally:
+        await shared.stop()
@@ -0,0 +1,79 @@
+"""Burst, Retry-After and steady-rate checks for both GCRA rate limiters.
+
+The Redis limiter runs GCRA_SCRIPT on the server at BENCH_REDIS_URL when it
+is set. Otherwise the script's logic runs in a minimal in-process stand-in
+for Redis, which still checks how the limiter handles the script's results.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from app.services.rate_limit import MemoryRateLimiter, RedisRateLimiter
+
+LIMIT = 20
+PERIOD_SECONDS = 1.0
+STEADY_SECONDS = 2.0
+
+class FakeRedis:
+    # Runs GCRA_SCRIPT's steps in Python against a dict, with the local
+    # clock standing in for Redis TIME.
+    def __init__(self):
+        self.arrivals = {}
+
+    def register_script(self, script: str):
+        async def run(keys, args):
+            now = int(time.time() * 1_000_000)
+            interval, period = args
+            tat = max(self.arrivals.get(keys[0], now), now) + interval
+            wait = tat - now - period
+            if wait > 0:
+                return wait
+            self.arrivals[keys[0]] = tat
+            return 0
+        return run
+
+    async def aclose(self) -> None:
+        pass
+
+@pytest.fixture(params=["memory", "redis"])
+async def limiter(request):
+    if request.param == "memory":
+        limiter = MemoryRateLimiter(period_seconds=PERIOD_SECONDS)
+    elif os.getenv("BENCH_REDIS_URL"):
+        limiter = RedisRateLimiter(
+            os.environ["BENCH_REDIS_URL"], period_seconds=PERIOD_SECONDS,
+            prefix=f"greenprompt:test-rl:{uuid.uuid4().hex}"
+        )
+    else:
+        limiter = RedisRateLimiter(client=FakeRedis(), period_seconds=PERIOD_SECONDS)
+    yield limiter
+    # A Redis error would have silently fallen back to the memory limiter.
+    assert getattr(limiter, "errors", 0) == 0
+    await limiter.close()
+
+async def test_burst_of_limit_then_refused(limiter):
+    waits = [await limiter.check("client", LIMIT) for _ in range(LIMIT + 1)]
+    assert sum(1 for wait in waits if wait == 0) == LIMIT
+    assert waits[-1] > 0
+
+async def test_retry_after_one_emission_interval(limiter):
+    for _ in range(LIMIT):
+        await limiter.check("client", LIMIT)
+    wait = await limiter.check("client", LIMIT)
+    # Redis rounds the interval up to whole microseconds.
+    assert 0 < wait <= PERIOD_SECONDS / LIMIT + 1e-5
+    await asyncio.sleep(wait)
+    assert await limiter.check("client", LIMIT) == 0
+
+async def test_steady_rate_is_held_to_the_limit(limiter):
+    allowed = 0
+    started = time.monotonic()
+    while time.monotonic() - started < STEADY_SECONDS:
+        allowed += await limiter.check("client", LIMIT) == 0
+        await asyncio.sleep(PERIOD_SECONDS / LIMIT / 2)
+    # The initial burst, then `limit` per period of the time actually spent.
+    expected = LIMIT + LIMIT * (time.monotonic() - started) / PERIOD_SECONDS
+    assert abs(allowed - expected) <= 3
@@ -0,0 +1,141 @@
+import random
+import time
+
+import pytest
+
+from app.services.sessions import AnalysisSession, RedisSessionStore, SessionConflict, SessionStore
+
+PROMPT = (
+    "Please explain step by step how to write a Python function that sorts a list.\n"
+    "Return the answer as JSON and include a short summary of the code."
+)
+WORDS = ["explain", " code", "json", " step by step", "summary", "\n", "  ", "translate", "!", "list"]
+
+def session(text: str = PROMPT) -> AnalysisSession:
+    return AnalysisSession("user-1", text, "gpt-4o", None, None, None)
+
+def test_incremental_edits_match_a_full_recount():
+    rnd = random.Random(0)
+    edited = session()
+    for _ in range(300):
+        offset = rnd.randrange(len(edited.text) + 1)
+        deleted = rnd.randrange(min(8, len(edited.text) - offset) + 1)
+        edited.apply_edit(offset, deleted, rnd.choice(WORDS))
+        fresh = session(edited.text)
+        assert edited._raw_tokens == fresh._raw_tokens
+        assert +edited._keyword_counts == +fresh._keyword_counts
+    assert edited.version == 300
+    assert edited.features() == session(edited.text).features()
+
+def test_edit_outside_the_prompt_is_refused():
+    with pytest.raises(SessionConflict):
+        session("short").apply_edit(3, 5, "x")
+
+def test_state_round_trip_keeps_running_counts():
+    original = session()
+    original.apply_edit(0, 6, "Kindly")
+    restored = AnalysisSession.from_state(original.id, original.owner, original.version, original.to_state())
+    assert restored.text == original.text
+    assert restored.version == 1
+    assert restored.features() == original.features()
+
+async def test_memory_store_checks_owner_and_evicts():
+    store = SessionStore(idle_timeout=600, max_sessions=2)
+    first = await store.create(session())
+    assert await store.get("user-1", first.id) is first
+    assert await store.get("user-2", first.id) is None
+    assert not await store.delete("user-2", first.id)
+
+    await store.create(session())
+    await store.create(session())
+    assert await store.get("user-1", first.id) is None
+    assert store.stats()["evictions"] == 1
+
+class FakeRedis:
+    # Hashes with expiry, and the two session scripts run in Python.
+    def __init__(self):
+        self.hashes = {}
+        self.expires = {}
+
+    def _live(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.hashes.pop(key, None)
+            self.expires.pop(key, None)
+        return self.hashes.get(key)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script: str):
+        async def save(keys, args):
+            stored = self._live(keys[0])
+            if stored is None:
+                return -1
+            if stored["version"] != str(args[0]):
+                return 0
+            stored.update(version=str(args[1]), state=args[2])
+            self.expires[keys[0]] = time.monotonic() + int(args[3]) / 1000
+            return 1
+
+        async def delete(keys, args):
+            stored = self._live(keys[0])
+            if stored is None or stored["owner"] != args[0]:
+                return 0
+            del self.hashes[keys[0]]
+            return 1
+        return save if "PEXPIRE" in script else delete
+
+    async def aclose(self):
+        pass
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def hset(self, key, mapping):
+        self.commands.append(lambda: self.redis.hashes.__setitem__(key, {k: str(v) for k, v in mapping.items()}))
+
+    def hgetall(self, key):
+        self.commands.append(lambda: dict(self.redis._live(key) or {}))
+
+    def pexpire(self, key, ms):
+        def expire():
+            if self.redis._live(key) is not None:
+                self.redis.expires[key] = time.monotonic() + ms / 1000
+        self.commands.append(expire)
+
+    async def execute(self):
+        return [command() for command in self.commands]
+
+async def test_redis_store_shares_sessions_and_detects_conflicts():
+    redis = FakeRedis()
+    store = RedisSessionStore(idle_timeout=600, client=redis)
+    other_worker = RedisSessionStore(idle_timeout=600, client=redis)
+    created = await store.create(session())
+
+    first = await store.get("user-1", created.id)
+    second = await other_worker.get("user-1", created.id)
+    assert await other_worker.get("user-2", created.id) is None
+    first.apply_edit(0, 6, "Kindly")
+    second.apply_edit(0, 0, "Hi. ")
+    assert await store.save(first, 0) is True
+    assert await other_worker.save(second, 0) is False
+    assert other_worker.stats()["conflicts"] == 1
+
+    reloaded = await other_worker.get("user-1", created.id)
+    assert reloaded.version == 1 and reloaded.text.startswith("Kindly")
+    assert reloaded.features() == session(reloaded.text).features()
+
+    assert not await store.delete("user-2", created.id)
+    assert await store.delete("user-1", created.id)
+    assert await store.get("user-1", created.id) is None
+
+async def test_redis_store_reports_expired_sessions():
+    store = RedisSessionStore(idle_timeout=0.01, client=FakeRedis())
+    created = await store.create(session())
+    loaded = await store.get("user-1", created.id)
+    time.sleep(0.02)
+    loaded.apply_edit(0, 0, "x")
+    assert await store.save(loaded, 0) is None
+    assert await store.get("user-1", created.id) is None
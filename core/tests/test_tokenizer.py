@@ -0,0 +1,61 @@
+import re
+import threading
+
+import pytest
+
+from app.services.tokenizer import BPETokenizer, pretokenizer_pattern
+
+class PairRanks:
+    # Every one- and two-byte piece is a token.
+    def get(self, piece: bytes):
+        return len(piece) if len(piece) <= 2 else None
+
+def test_piece_cache_is_safe_across_threads():
+    tokenizer = BPETokenizer("test", PairRanks(), cache_size=16)
+    errors = []
+
+    def count(worker: int) -> None:
+        try:
+            for i in range(2000):
+                tokenizer.count(f"w{worker}x{i} a{i}b c{i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=count, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(tokenizer._cache) <= 16
+
+# The reference pre-tokenizers, as published with each vocabulary.
+REFERENCE_PATTERNS = {
+    "cl100k_base": r"'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s",
+    "o200k_base": "|".join([
+        r"[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?",
+        r"[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?",
+        r"\p{N}{1,3}",
+        r" ?[^\s\p{L}\p{N}]+[\r\n/]*",
+        r"\s*[\r\n]+",
+        r"\s+(?!\S)",
+        r"\s+",
+    ]),
+    "qwen": r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+",
+}
+
+SAMPLES = [
+    "Hello World! I'm here, they'll GO.  HTTPServer parseJSON camelCaseWord iPhone",
+    "Ünïcödé naïve café ΑΒΓαβγ Привет мир 你好世界 12345 path/to/file\n\n  x\r\n",
+    "don't WON'T it's I'VE  \t\n  end",
+    "x=1+2; y = [a,b]//c /* comment */\n\tdef f(): return 'ok'",
+    "été नमस्ते हिन्दी Ǆemal ǅ",
+]
+
+@pytest.mark.parametrize("vocab", sorted(REFERENCE_PATTERNS))
+def test_pretokenizer_matches_reference(vocab):
+    regex = pytest.importorskip("regex")
+    pattern = re.compile(pretokenizer_pattern(vocab))
+    reference = regex.compile(REFERENCE_PATTERNS[vocab])
+    for sample in SAMPLES:
+        assert pattern.findall(sample) == reference.findall(sample)